@@ -0,0 +1,74 @@
+'''
+Auth overhead per request: resolving the current user from a token by username (tokens without the user_id
+claim), by primary key, and from the token cache.
+
+Usage: python -m benchmarks.bench_auth [--users 10000] [--requests 5000]
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from swetter.database.db import Base, create_db_engine, create_async_db_engine
+from swetter.models import User
+from swetter.routes.auth import create_access_token
+from swetter.utils.deps import get_current_user
+from swetter.utils.user_cache import user_cache
+
+
+def seed(engine, users):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"user_id": i, "user_name": f"user{i}", "user_password_hash": "x"}
+                                          for i in range(1, users + 1)])
+
+
+async def measure(session_factory, tokens, use_cache):
+    user_cache.clear()
+    started = time.perf_counter()
+
+    for token in tokens:
+        if not use_cache:
+            user_cache.clear()
+        async with session_factory() as db:
+            await get_current_user(token, db)
+
+    return (time.perf_counter() - started) / len(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(create_db_engine(f"sqlite:///{path}"), args.users)
+        session_factory = async_sessionmaker(create_async_db_engine(f"sqlite+aiosqlite:///{path}"),
+                                             expire_on_commit=False)
+
+        # a few active users sending many requests each
+        user_ids = [1 + i % 50 for i in range(args.requests)]
+        by_username = [create_access_token({"sub": f"user{i}"}) for i in user_ids]
+        by_id = [create_access_token({"sub": f"user{i}", "user_id": i}) for i in user_ids]
+
+        async def run_all():
+            return {
+                "username lookup": await measure(session_factory, by_username, use_cache=False),
+                "primary key lookup": await measure(session_factory, by_id, use_cache=False),
+                "token cache": await measure(session_factory, by_id, use_cache=True),
+            }
+
+        results = asyncio.run(run_all())
+
+    for name, seconds in results.items():
+        print(f"{name:>20}: {seconds * 1e6:8.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
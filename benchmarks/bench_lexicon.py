@@ -0,0 +1,64 @@
+'''
+Throughput of the lexicon pre-filter on large inputs, compared with a regex alternation of the same terms.
+
+Usage: python -m benchmarks.bench_lexicon [--terms 2000] [--size-mb 4]
+'''
+import argparse
+import random
+import re
+import string
+import time
+
+from swetter.utils.lexicon import Lexicon, normalize_text
+
+
+def random_word(rng, alphabet, low=3, high=9):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def measure(function, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=2000)
+    parser.add_argument("--size-mb", type=float, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    alphabet = string.ascii_lowercase + "абвгдеєжзиіїйклмнопрстуфхцчшщьюя"
+    terms = list({random_word(rng, alphabet, 5, 10) for _ in range(args.terms)})
+
+    words = [random_word(rng, alphabet) for _ in range(5000)]
+    size = int(args.size_mb * 1024 * 1024)
+    chunks, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        chunks.append(word)
+        length += len(word) + 1
+    text = " ".join(chunks)
+
+    started = time.perf_counter()
+    lexicon = Lexicon(blocked=terms)
+    build_time = time.perf_counter() - started
+
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)))
+
+    lexicon_time = measure(lexicon.find_blocked, text)
+    regex_time = measure(lambda value: pattern.findall(normalize_text(value)), text, repeat=1)
+
+    megabytes = len(text) / 1024 / 1024
+    print(f"terms: {len(terms)}, states: {len(lexicon.goto)}, build: {build_time * 1000:.0f} ms, input: {megabytes:.1f} MB")
+    print(f"{'matcher':<20}{'seconds':>10}{'MB/s':>10}")
+    print(f"{'aho-corasick':<20}{lexicon_time:>10.3f}{megabytes / lexicon_time:>10.1f}")
+    print(f"{'regex alternation':<20}{regex_time:>10.3f}{megabytes / regex_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
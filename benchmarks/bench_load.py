@@ -0,0 +1,395 @@
+'''
+Load test of the whole API: boots the real app (uvicorn, job workers, lifespan) in a child process against a seeded
+database, replaces the Gemini model with a local stub of configurable latency and failure rate and drives a mixed
+read/write workload over every route at a fixed concurrency. Per-endpoint latency percentiles and requests per second
+are printed and written to a JSON report, so two runs (releases) can be compared.
+
+Usage: python -m benchmarks.bench_load [--concurrency 32] [--duration 30] [--warmup 3] [--write-ratio 0.2]
+       [--posts 1000] [--gemini-latency 0.2] [--gemini-failure-rate 0.01] [--moderation-mode sync]
+       [--report bench_load.json]
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from swetter.database.counters_db import reconcile_counters, backfill_rollup
+from swetter.database.db import Base, create_db_engine
+from swetter.models import User, Post, Comment, CommentReply
+from swetter.routes import router
+from swetter.utils.passwords import password_hasher
+
+USERNAME = PASSWORD = "bench"
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    '''
+    Local stand-in for the Gemini model. Answers after latency * uniform(0.5, 1.5) seconds and raises
+    with probability failure_rate. Moderation never blocks (batch prompts get one numbered verdict per text),
+    reply prompts get a fixed reply.
+    '''
+
+    def __init__(self, latency, failure_rate, seed=None):
+        from swetter.utils import gemini
+
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.batch_prefix = gemini.batch_block_prompt.split("{}")[0]
+        self.reply_prefix = gemini.create_reply_promt.split("{}")[0]
+        self.batch_item = re.compile(r"^\d+\. \(", re.MULTILINE)
+
+    async def generate_content_async(self, prompt):
+        if self.latency:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+
+        if self.rng.random() < self.failure_rate:
+            raise RuntimeError("Stub Gemini failure")
+
+        if prompt.startswith(self.batch_prefix):
+            items = len(self.batch_item.findall(prompt[len(self.batch_prefix):]))
+            return StubResponse("\n".join(f"{number}. False" for number in range(1, items + 1)))
+        if prompt.startswith(self.reply_prefix):
+            return StubResponse("Thank you for the comment!")
+        return StubResponse("False")
+
+
+def serve(args):
+    '''
+    Child process: the real app with the stubbed Gemini model. The database comes from DATABASE_URL.
+    '''
+
+    import uvicorn
+
+    from swetter.main import app
+    from swetter.utils import gemini
+
+    gemini.model = StubModel(args.gemini_latency, args.gemini_failure_rate, seed=1)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+def seed(engine, posts):
+    '''
+    Fill a new database with users, posts, comments (5 per post) and replies (1 per comment) using bulk inserts,
+    then bring the counters and the daily rollup up to date.
+    '''
+
+    Base.metadata.create_all(bind=engine)
+    password_hash = password_hasher.context.hash(PASSWORD)
+    now = datetime.utcnow()
+
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"user_name": USERNAME, "user_password_hash": password_hash}] +
+                           [{"user_name": f"user{i}", "user_password_hash": password_hash} for i in range(99)])
+        connection.execute(insert(Post), [{"user_id": 1 + i % 100, "post_title": f"Post {i} about topic {i % 50}",
+                                           "post_content": f"Content of post {i}", "post_auto_answer": i % 10 == 0,
+                                           "post_delay": None, "post_blocked": False, "post_pending": False,
+                                           "post_created_at": now - timedelta(minutes=posts - i)}
+                                          for i in range(posts)])
+        connection.execute(insert(Comment), [{"post_id": 1 + i % posts, "user_id": 1 + i % 100,
+                                              "comment_content": f"Comment {i} on topic {i % 50}",
+                                              "comment_blocked": False, "comment_pending": False,
+                                              "comment_created_at": now - timedelta(seconds=posts * 5 - i)}
+                                             for i in range(posts * 5)])
+        connection.execute(insert(CommentReply), [{"comment_id": 1 + i, "user_id": 1 + i % 100,
+                                                   "reply_content": f"Reply {i}", "reply_blocked": False,
+                                                   "reply_pending": False,
+                                                   "reply_created_at": now - timedelta(seconds=posts * 5 - i)}
+                                                  for i in range(posts * 5)])
+
+    session_factory = sessionmaker(bind=engine)
+    reconcile_counters(session_factory)
+    backfill_rollup(session_factory)
+
+
+class Workload:
+    '''
+    Requests of the mixed workload. Every operation returns (method, url, keyword arguments of the request)
+    or None if it has nothing to do (e.g. no own rows to delete yet), and may record ids of created rows.
+    '''
+
+    def __init__(self, posts, write_ratio, seed=None):
+        self.rng = random.Random(seed)
+        self.posts = posts
+        self.comments = posts * 5
+        self.replies = posts * 5
+        self.created = defaultdict(list)
+        self.registrations = itertools.count()
+
+        reads = {
+            "GET /post/{post_id}": (20, lambda: ("GET", f"/post/{self.post_id()}", {})),
+            "GET /posts/": (10, lambda: ("GET", "/posts/", {})),
+            "GET /posts/{user_id}": (5, lambda: ("GET", f"/posts/{self.user_id()}", {})),
+            "GET /comment/{comment_id}": (10, lambda: ("GET", f"/comment/{self.comment_id()}", {})),
+            "GET /comments/{user_id}": (5, lambda: ("GET", f"/comments/{self.user_id()}", {})),
+            "GET /posts/{post_id}/comments": (10, lambda: ("GET", f"/posts/{self.post_id()}/comments", {})),
+            "GET /reply/{reply_id}": (5, lambda: ("GET", f"/reply/{self.rng.randint(1, self.replies)}", {})),
+            "GET /replies/{comment_id}": (10, lambda: ("GET", f"/replies/{self.comment_id()}", {})),
+            "GET /thread/{post_id}": (15, lambda: ("GET", f"/thread/{self.post_id()}", {})),
+            "GET /search": (10, lambda: ("GET", "/search", {"params": {
+                "q": f"topic {self.rng.randint(0, 49)}", "entity": self.rng.choice(["posts", "comments"])}})),
+            "GET /comments-daily-breakdown": (3, lambda: ("GET", "/comments-daily-breakdown", {"params": {
+                "date_from": str(datetime.utcnow().date() - timedelta(days=30)),
+                "date_to": str(datetime.utcnow().date()), "post_id": self.post_id()}})),
+            "GET /export/{entity}": (1, lambda: ("GET", "/export/posts", {"params": {"format": "ndjson"}})),
+        }
+        writes = {
+            "POST /post/": (10, lambda: ("POST", "/post/", {"json": {
+                "post_title": "Load post", "post_content": "Load content", "post_auto_answer": False,
+                "post_delay": None}})),
+            "PUT /post/{post_id}": (5, lambda: ("PUT", f"/post/{self.own('post')}", {"json": {
+                "post_title": "Updated post", "post_content": "Updated content", "post_auto_answer": False}})),
+            "DELETE /post/{post_id}": (2, lambda: self.delete("post")),
+            "POST /comment/": (20, lambda: ("POST", "/comment/", {"json": {
+                "post_id": self.post_id(), "comment_content": "Load comment"}})),
+            "PUT /comment/{comment_id}": (5, lambda: ("PUT", f"/comment/{self.own('comment')}", {"json": {
+                "comment_content": "Updated comment"}})),
+            "DELETE /comment/{comment_id}": (3, lambda: self.delete("comment")),
+            "POST /comments/batch": (3, lambda: ("POST", "/comments/batch", {"json": {"items": [
+                {"post_id": self.post_id(), "comment_content": f"Batch comment {i}"} for i in range(20)]}})),
+            "POST /reply/": (15, lambda: ("POST", "/reply/", {"json": {
+                "comment_id": self.comment_id(), "reply_content": "Load reply"}})),
+            "PUT /reply/{reply_id}": (4, lambda: ("PUT", f"/reply/{self.own('reply')}", {"json": {
+                "reply_content": "Updated reply"}})),
+            "DELETE /reply/{reply_id}": (3, lambda: self.delete("reply")),
+            "POST /replies/batch": (2, lambda: ("POST", "/replies/batch", {"json": {"items": [
+                {"comment_id": self.comment_id(), "reply_content": f"Batch reply {i}"} for i in range(20)]}})),
+            "POST /registration/": (1, lambda: ("POST", "/registration/", {"json": {
+                "username": f"load{next(self.registrations)}_{self.rng.random()}", "password": "password"}})),
+            "POST /login/": (1, lambda: ("POST", "/login/", {"data": {"username": USERNAME, "password": PASSWORD}})),
+        }
+
+        read_total = sum(weight for weight, _ in reads.values())
+        write_total = sum(weight for weight, _ in writes.values())
+
+        self.operations = {name: operation for name, (_, operation) in (reads | writes).items()}
+        self.names = list(reads) + list(writes)
+        self.weights = ([weight / read_total * (1 - write_ratio) for weight, _ in reads.values()] +
+                        [weight / write_total * write_ratio for weight, _ in writes.values()])
+
+    def post_id(self):
+        return self.rng.randint(1, self.posts)
+
+    def comment_id(self):
+        return self.rng.randint(1, self.comments)
+
+    def user_id(self):
+        return self.rng.randint(1, 100)
+
+    def own(self, entity):
+        '''
+        A row created by this run, or a seeded one if there is none yet.
+        '''
+
+        created = self.created[entity]
+        if created:
+            return self.rng.choice(created)
+        return {"post": self.post_id, "comment": self.comment_id,
+                "reply": lambda: self.rng.randint(1, self.replies)}[entity]()
+
+    def delete(self, entity):
+        # only rows created by this run are deleted, so reads of seeded rows keep finding them
+        created = self.created[entity]
+        if not created:
+            return None
+        return "DELETE", f"/{entity}/{created.pop(self.rng.randrange(len(created)))}", {}
+
+    def record(self, name, response):
+        if response.status_code not in (200, 202):
+            return
+
+        for entity in ("post", "comment", "reply"):
+            if name == f"POST /{entity}/":
+                self.created[entity].append(response.json()[f"{entity}_id"])
+            elif name == f"POST /{'replies' if entity == 'reply' else entity + 's'}/batch":
+                self.created[entity].extend(item[f"{entity}_id"] for item in response.json()["items"]
+                                            if item.get(f"{entity}_id"))
+
+    def next(self):
+        while True:
+            name = self.rng.choices(self.names, weights=self.weights)[0]
+            request = self.operations[name]()
+            if request is not None:
+                return name, request
+
+
+def check_coverage(workload):
+    routes = {f"{method} {route.path}" for route in router.routes for method in route.methods}
+    missing = routes - set(workload.names)
+
+    if missing:
+        raise SystemExit(f"The workload does not cover: {', '.join(sorted(missing))}")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+async def drive(base_url, workload, concurrency, duration, warmup):
+    '''
+    Run concurrency workers sending workload requests for warmup + duration seconds.
+    :return: dict endpoint -> list of (latency, status) measured after the warmup, and the measured seconds
+    '''
+
+    results = defaultdict(list)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        response = await client.post("/login/", data={"username": USERNAME, "password": PASSWORD})
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        async def worker():
+            while (now := time.perf_counter()) < stop_at:
+                name, (method, url, kwargs) = workload.next()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    status = response.status_code
+                    workload.record(name, response)
+                except httpx.HTTPError:
+                    status = "error"
+                if now >= measure_from:
+                    results[name].append((time.perf_counter() - now, status))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return results, time.perf_counter() - measure_from
+
+
+def summarize(latencies, elapsed, statuses):
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "errors": sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500),
+        "status": dict(sorted(statuses.items())),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def build_report(args, results, elapsed):
+    endpoints = {}
+    all_latencies = []
+    all_statuses = defaultdict(int)
+
+    for name, measurements in sorted(results.items()):
+        statuses = defaultdict(int)
+        for latency, status in measurements:
+            statuses[str(status)] += 1
+            all_statuses[str(status)] += 1
+        latencies = [latency for latency, _ in measurements]
+        all_latencies += latencies
+        endpoints[name] = summarize(latencies, elapsed, statuses)
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "port")},
+        "duration_s": round(elapsed, 2),
+        "total": summarize(all_latencies, elapsed, all_statuses) if all_latencies else {},
+        "endpoints": endpoints,
+    }
+
+
+def wait_until_ready(process, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The app exited during startup")
+        try:
+            if httpx.get(f"{base_url}/openapi.json", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    raise SystemExit(f"The app did not start in {timeout} seconds")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="mean seconds per stubbed Gemini call")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.01)
+    parser.add_argument("--moderation-mode", choices=["sync", "pending"], default="sync")
+    parser.add_argument("--report", default="bench_load.json")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workload = Workload(args.posts, args.write_ratio, seed=42)
+    check_coverage(workload)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(create_db_engine(f"sqlite:///{path}"), args.posts)
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{path}",
+               "ADMIN_USERNAMES": USERNAME, "MODERATION_MODE": args.moderation_mode}
+        command = [sys.executable, "-m", "benchmarks.bench_load", "--serve", "--port", str(port),
+                   "--gemini-latency", str(args.gemini_latency), "--gemini-failure-rate", str(args.gemini_failure_rate)]
+
+        process = subprocess.Popen(command, env=env)
+        try:
+            wait_until_ready(process, base_url)
+            results, elapsed = asyncio.run(drive(base_url, workload, args.concurrency, args.duration, args.warmup))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = build_report(args, results, elapsed)
+
+    with open(args.report, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(f"{'endpoint':<32} {'requests':>9} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for name, stats in list(report["endpoints"].items()) + [("total", report["total"])]:
+        print(f"{name:<32} {stats['requests']:>9} {stats['rps']:>8} {stats['errors']:>7} "
+              f"{stats['p50_ms']:>8} {stats['p90_ms']:>8} {stats['p99_ms']:>8}")
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+'''
+Login throughput and event loop responsiveness during a burst of logins: bcrypt run inline twice
+(the previous login handler) vs a single verification in the password hasher pool.
+
+Usage: python -m benchmarks.bench_login [--logins 32] [--rounds 12]
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from swetter.database.db import Base, create_db_engine, create_async_db_engine
+from swetter.models import User
+from swetter.routes import auth
+from swetter.utils.passwords import PasswordHasher
+
+
+async def inline_login(session_factory, hasher, username, password):
+    async with session_factory() as db:
+        user = await User.get_user_by_username_async(db, username)
+        return hasher.context.verify(password, user.user_password_hash) and \
+            hasher.context.verify(password, user.user_password_hash)
+
+
+async def pool_login(session_factory, hasher, username, password):
+    async with session_factory() as db:
+        return await auth.authenticate_user(db, username, password)
+
+
+async def measure(login, session_factory, hasher, logins):
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login(session_factory, hasher, f"user{i}", "password") for i in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    done.set()
+    await ticker_task
+
+    assert all(results)
+    return logins / elapsed, max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(rounds=args.rounds, max_queue=args.logins)
+    auth.password_hasher = hasher
+    password_hash = hasher.context.hash("password")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        engine = create_db_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(User.__table__.insert(), [{"user_name": f"user{i}", "user_password_hash": password_hash}
+                                                          for i in range(args.logins)])
+
+        session_factory = async_sessionmaker(create_async_db_engine(f"sqlite+aiosqlite:///{path}"),
+                                             expire_on_commit=False)
+
+        async def run_all():
+            return {
+                "inline, verified twice": await measure(inline_login, session_factory, hasher, args.logins),
+                "hasher pool": await measure(pool_login, session_factory, hasher, args.logins),
+            }
+
+        results = asyncio.run(run_all())
+
+    print(f"{args.logins} concurrent logins, bcrypt rounds {args.rounds}, {hasher.workers} workers")
+    for name, (throughput, stall) in results.items():
+        print(f"{name:>24}: {throughput:8.1f} logins/s, longest event loop stall {stall * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+'''
+Reads per second of hot posts and comment pages with the read cache on and off.
+Reads follow a skewed distribution: a few viral posts get most of them.
+
+Usage: python -m benchmarks.bench_read_cache [--posts 1000] [--reads 20000]
+'''
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from swetter.database.db import Base, create_db_engine, create_async_db_engine
+from swetter.models import User, Post, Comment
+from swetter.routes.comments import comment_page_columns
+from swetter.routes.posts import load_post
+from swetter.utils.read_cache import ReadCache
+
+
+def seed(engine, posts):
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"user_id": 1, "user_name": "bench", "user_password_hash": "x"}])
+        connection.execute(insert(Post), [{"post_id": i, "user_id": 1, "post_title": f"Post {i}",
+                                           "post_content": "Content", "post_auto_answer": False,
+                                           "post_blocked": False, "post_pending": False, "post_created_at": now}
+                                          for i in range(1, posts + 1)])
+        connection.execute(insert(Comment), [{"post_id": 1 + i % posts, "user_id": 1,
+                                              "comment_content": f"Comment {i}", "comment_blocked": False,
+                                              "comment_pending": False, "comment_created_at": now}
+                                             for i in range(posts * 20)])
+
+
+async def run(session_factory, cache, post_ids):
+    started = time.perf_counter()
+
+    for post_id in post_ids:
+        async with session_factory() as db:
+            await cache.get_or_load("post", post_id, lambda: load_post(db, post_id))
+            await cache.get_or_load(
+                "post_comments", post_id,
+                lambda: Comment.get_post_comments_async(db, post_id, columns=comment_page_columns),
+                variant=(20, None),
+            )
+
+    return len(post_ids) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    weights = [1 / rank for rank in range(1, args.posts + 1)]
+    post_ids = rng.choices(range(1, args.posts + 1), weights=weights, k=args.reads)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(create_db_engine(f"sqlite:///{path}"), args.posts)
+        session_factory = async_sessionmaker(create_async_db_engine(f"sqlite+aiosqlite:///{path}"),
+                                             expire_on_commit=False)
+
+        cache_on = ReadCache(enabled=True)
+
+        async def run_all():
+            return {
+                "cache off": await run(session_factory, ReadCache(enabled=False), post_ids),
+                "cache on": await run(session_factory, cache_on, post_ids),
+            }
+
+        results = asyncio.run(run_all())
+
+    print(f"{args.reads} reads of a post and its first comment page over {args.posts} posts")
+    for name, reads_per_second in results.items():
+        print(f"{name:>10}: {reads_per_second:10.0f} reads/s")
+    for namespace, stats in sorted(cache_on.stats().items()):
+        print(f"{namespace:>14} hit ratio: {stats['hit_ratio']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+'''
+Listing serialization cost: ORM rows -> to_dict -> PostResponse -> FastAPI response_model validation -> json
+(the previous path) vs from_attributes + model_dump_json vs a column-only select encoded by RowSerializer.
+
+Usage: python -m benchmarks.bench_serialization [--rows 10000] [--repeat 5]
+'''
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from swetter.database.db import Base, create_db_engine
+from swetter.models import User, Post
+from swetter.routes.posts import post_serializer
+from swetter.schem import PostResponse, PostPage
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"user_id": 1, "user_name": "bench", "user_password_hash": "x"}])
+        connection.execute(insert(Post), [{"user_id": 1, "post_title": f"Post {i}", "post_content": "Content " * 25,
+                                           "post_auto_answer": False, "post_blocked": False, "post_pending": False,
+                                           "post_created_at": now} for i in range(rows)])
+
+
+def previous_path(db, rows, field):
+    posts, next_cursor = Post.get_all_posts(db, limit=rows)
+    page = PostPage(items=[PostResponse(**post.to_dict()) for post in posts], next_cursor=next_cursor)
+    content = asyncio.run(serialize_response(field=field, response_content=page, is_coroutine=True))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def from_attributes_path(db, rows, field):
+    posts, next_cursor = Post.get_all_posts(db, limit=rows)
+    page = PostPage(items=[PostResponse.model_validate(post) for post in posts], next_cursor=next_cursor)
+    return page.model_dump_json().encode()
+
+
+def row_serializer_path(db, rows, field):
+    posts, next_cursor = Post.get_all_posts(db, limit=rows, columns=post_serializer.columns)
+    return post_serializer.page_response(posts, next_cursor).body
+
+
+def measure(path, session_factory, rows, field, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            body = path(db, rows, field)
+            best = min(best, time.perf_counter() - started)
+        finally:
+            db.close()
+    return best, json.loads(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_response_field(name="Response_get_all_posts", type_=PostPage)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_db_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        seed(engine, args.rows)
+        session_factory = sessionmaker(bind=engine)
+
+        results = {name: measure(path, session_factory, args.rows, field, args.repeat) for name, path in (
+            ("previous path", previous_path),
+            ("from_attributes", from_attributes_path),
+            ("row serializer", row_serializer_path),
+        )}
+        engine.dispose()
+
+    bodies = [body for _, body in results.values()]
+    assert all(body == bodies[0] for body in bodies), "paths produced different JSON"
+
+    print(f"listing of {args.rows} posts, query + serialization, best of {args.repeat}")
+    for name, (seconds, _) in results.items():
+        print(f"{name:>16}: {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+'''
+Concurrent read/write throughput of the default SQLite engine vs the tuned profile from swetter.database.db.
+
+Usage: python -m benchmarks.bench_sqlite_profile [--readers 8] [--writers 4] [--seconds 5]
+'''
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from swetter.database.db import Base, create_db_engine
+from swetter.models import User, Post, Comment
+
+
+def seed(engine):
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add(User(user_id=1, user_name="bench", user_password_hash="x"))
+        db.add(Post(post_id=1, user_id=1, post_title="Bench", post_content="Bench", post_auto_answer=False))
+        db.commit()
+        for i in range(1000):
+            db.add(Comment(post_id=1, user_id=1, comment_content=f"Comment {i}", comment_blocked=False))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(engine, readers, writers, seconds):
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    counters = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def count(key):
+        with lock:
+            counters[key] += 1
+
+    def reader():
+        while time.perf_counter() < deadline:
+            db = session_factory()
+            try:
+                Comment.get_post_comments(db, 1)
+                count("reads")
+            except OperationalError:
+                count("locked")
+            finally:
+                db.close()
+
+    def writer():
+        while time.perf_counter() < deadline:
+            db = session_factory()
+            try:
+                Comment.create_comment(db, post_id=1, user_id=1, comment_content="Bench", comment_blocked=False)
+                count("writes")
+            except OperationalError:
+                db.rollback()
+                count("locked")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {key: value / seconds for key, value in counters.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = {
+            "default": lambda url: create_engine(url, connect_args={"check_same_thread": False}),
+            "tuned": lambda url: create_db_engine(url),
+        }
+
+        print(f"{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'locked/s':>12}")
+        for name, factory in profiles.items():
+            engine = factory(f"sqlite:///{os.path.join(tmp, name + '.db')}")
+            seed(engine)
+            result = run(engine, args.readers, args.writers, args.seconds)
+            engine.dispose()
+            print(f"{name:<10}{result['reads']:>12.0f}{result['writes']:>12.0f}{result['locked']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
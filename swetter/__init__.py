@@ -1,14 +1,73 @@
 import os
 
 from dotenv import load_dotenv, find_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
 
 load_dotenv(find_dotenv())
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or os.cpu_count() or 1)
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+ADMIN_USERNAMES = set(filter(None, os.getenv("ADMIN_USERNAMES", "").split(",")))
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+WRITE_BATCH_MAX_ITEMS = int(os.getenv("WRITE_BATCH_MAX_ITEMS", "100"))
+
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "true").lower() == "true"
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "10000"))
+READ_CACHE_TTL = int(os.getenv("READ_CACHE_TTL", "30"))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# bearer token of GET /metrics, the endpoint is closed while it is empty
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# statements slower than this are printed, 0 disables
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# also print the query plan of every slow statement shape once
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+# requests running one statement more than this many times are reported (N+1), 0 disables
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "0"))
+# raise instead of printing, used to fail tests
+N_PLUS_ONE_STRICT = os.getenv("N_PLUS_ONE_STRICT", "false").lower() == "true"
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "100"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "10"))
+GEMINI_BATCH_WINDOW_MS = float(os.getenv("GEMINI_BATCH_WINDOW_MS", "10"))
+GEMINI_BATCH_MAX_ITEMS = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", "20"))
+
+LEXICON_PATH = os.getenv("LEXICON_PATH", os.path.join(os.path.dirname(__file__), "lexicon.txt"))
+LEXICON_RELOAD_INTERVAL = float(os.getenv("LEXICON_RELOAD_INTERVAL", "5"))
+LEXICON_TRIVIAL_MAX_LENGTH = int(os.getenv("LEXICON_TRIVIAL_MAX_LENGTH", "20"))
+
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", "10000"))
+MODERATION_CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", "3600"))
+MODERATION_CACHE_PERSISTENT = os.getenv("MODERATION_CACHE_PERSISTENT", "false").lower() == "true"
+MODERATION_CACHE_PERSISTENT_TTL = int(os.getenv("MODERATION_CACHE_PERSISTENT_TTL", str(30 * 24 * 3600)))
+
+# sync: writes wait for moderation, pending: writes return 202 and are moderated by background workers
+MODERATION_MODE = os.getenv("MODERATION_MODE", "sync")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "8"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "2"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "600"))
+JOB_DONE_RETENTION_SECONDS = int(os.getenv("JOB_DONE_RETENTION_SECONDS", "86400"))
+JOB_PRUNE_INTERVAL = float(os.getenv("JOB_PRUNE_INTERVAL", "300"))
 
-scheduler = BackgroundScheduler()
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./blog.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
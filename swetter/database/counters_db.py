@@ -0,0 +1,59 @@
+'''
+Reconciliation of the denormalized counters (Post.comment_count, Comment.reply_count) and the Comment_Daily rollup.
+They are kept up to date on every write through the models; this recomputes them with one GROUP BY each
+and fixes the rows that drifted, e.g. after rows were changed or loaded with plain SQL.
+
+Usage: python -m swetter.database.counters_db [--rollup]
+       --rollup also rebuilds the Comment_Daily rollup (backfill)
+'''
+import argparse
+
+from swetter.database.db import SessionLocal
+from swetter.models import Post, Comment, CommentDaily
+
+
+def reconcile_counters(session_factory=SessionLocal):
+    '''
+    Recompute all counters.
+    :param session_factory: factory of sync db sessions
+    :return: dict counter name -> number of fixed rows
+    '''
+
+    db = session_factory()
+    try:
+        return {
+            "comment_count": Post.reconcile_comment_counts(db),
+            "reply_count": Comment.reconcile_reply_counts(db),
+        }
+    finally:
+        db.close()
+
+
+def backfill_rollup(session_factory=SessionLocal):
+    '''
+    Rebuild the Comment_Daily rollup from the comments.
+    :param session_factory: factory of sync db sessions
+    :return: number of rollup rows
+    '''
+
+    db = session_factory()
+    try:
+        return CommentDaily.backfill(db)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rollup", action="store_true", help="also rebuild the Comment_Daily rollup")
+    args = parser.parse_args()
+
+    for counter, fixed in reconcile_counters().items():
+        print(f"{counter}: fixed {fixed} rows")
+
+    if args.rollup:
+        print(f"Comment_Daily: {backfill_rollup()} rows")
+
+
+if __name__ == "__main__":
+    main()
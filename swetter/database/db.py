@@ -1,10 +1,102 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool, AsyncAdaptedQueuePool
 
-DATABASE_URL = "sqlite:///./blog.db"
+from swetter import (DATABASE_URL, ASYNC_DATABASE_URL, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE,
+                     SQLITE_CACHE_SIZE, SQLITE_TEMP_STORE, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
 
+def sqlite_pragmas():
+    '''
+    PRAGMA statements applied to every new SQLite connection.
+    :return: list of PRAGMA statements
+    '''
+
+    return [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA temp_store={SQLITE_TEMP_STORE}",
+    ]
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url=DATABASE_URL, tuned=True, **kwargs):
+    '''
+    Create an engine with the configured SQLite profile.
+    File databases get a QueuePool shared between threads, in-memory databases a single static connection.
+    :param url: database url
+    :param tuned: apply the PRAGMA profile on every new connection
+    :param kwargs: extra arguments for create_engine
+    :return: Engine
+    '''
+
+    url = make_url(url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                             pool_timeout=DB_POOL_TIMEOUT, **kwargs)
+
+    # FastAPI runs sync dependencies in a thread pool, so a pooled connection is used from several threads
+    connect_args = {"check_same_thread": False}
+
+    if url.database in (None, "", ":memory:"):
+        engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool, **kwargs)
+    else:
+        engine = create_engine(url, connect_args=connect_args, pool_size=DB_POOL_SIZE,
+                               max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, **kwargs)
+
+    if tuned:
+        event.listen(engine, "connect", set_sqlite_pragmas)
+
+    return engine
 
+
+def create_async_db_engine(url=ASYNC_DATABASE_URL, tuned=True, **kwargs):
+    '''
+    Create an AsyncEngine (aiosqlite for SQLite) with the same profile as create_db_engine.
+    :param url: async database url
+    :param tuned: apply the PRAGMA profile on every new connection
+    :param kwargs: extra arguments for create_async_engine
+    :return: AsyncEngine
+    '''
+
+    url = make_url(url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                   pool_timeout=DB_POOL_TIMEOUT, **kwargs)
+
+    if url.database in (None, "", ":memory:"):
+        kwargs.setdefault("poolclass", StaticPool)
+    elif "poolclass" not in kwargs:
+        # aiosqlite defaults to NullPool, which reopens the file and reruns the PRAGMAs for every session
+        kwargs.update(poolclass=AsyncAdaptedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                      pool_timeout=DB_POOL_TIMEOUT)
+
+    async_engine = create_async_engine(url, **kwargs)
+
+    if tuned:
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+    return async_engine
+
+
+engine = create_db_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+Base = declarative_base()
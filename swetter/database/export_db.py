@@ -0,0 +1,133 @@
+'''
+Streaming export of posts, comments and replies as NDJSON or CSV.
+
+Usage: python -m swetter.database.export_db posts [--format csv] [--created-from 2024-01-01] [--created-to 2024-02-01]
+       [--blocked | --not-blocked] [--output posts.ndjson]
+'''
+import argparse
+import csv
+import io
+import sys
+from datetime import datetime, date, time
+
+import orjson
+from sqlalchemy import select
+
+from swetter import EXPORT_BATCH_SIZE
+from swetter.database.db import SessionLocal
+from swetter.models import Post, Comment, CommentReply
+
+EXPORT_ENTITIES = {
+    "posts": (Post, Post.post_created_at, Post.post_blocked),
+    "comments": (Comment, Comment.comment_created_at, Comment.comment_blocked),
+    "replies": (CommentReply, CommentReply.reply_created_at, CommentReply.reply_blocked),
+}
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_query(entity, created_from=None, created_to=None, blocked=None):
+    '''
+    Build the export select of an entity. All columns of the table are exported, in primary key order.
+    :param entity: posts, comments or replies
+    :param created_from: export rows created at or after this time (optional)
+    :param created_to: export rows created before this time (optional)
+    :param blocked: export only blocked (True) or only not blocked (False) rows (optional)
+    :return: select statement
+    :raises ValueError: If the entity is unknown
+    '''
+
+    if entity not in EXPORT_ENTITIES:
+        raise ValueError(f"Unknown entity {entity}")
+
+    model, created_column, blocked_column = EXPORT_ENTITIES[entity]
+    query = select(*model.__table__.columns).order_by(*model.__table__.primary_key.columns)
+
+    if created_from is not None:
+        query = query.where(created_column >= created_from)
+    if created_to is not None:
+        query = query.where(created_column < created_to)
+    if blocked is not None:
+        query = query.where(blocked_column == blocked)
+
+    return query
+
+
+def csv_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(entity, export_format="ndjson", created_from=None, created_to=None, blocked=None,
+                batch_size=EXPORT_BATCH_SIZE, session_factory=SessionLocal):
+    '''
+    Stream an export. Rows are fetched batch_size at a time (yield_per) and every batch is encoded and yielded
+    right away, so memory does not depend on the table size and output starts after the first batch.
+    :param entity: posts, comments or replies
+    :param export_format: ndjson or csv (with a header line)
+    :param created_from: export rows created at or after this time (optional)
+    :param created_to: export rows created before this time (optional)
+    :param blocked: export only blocked (True) or only not blocked (False) rows (optional)
+    :param batch_size: rows per fetch and per yielded chunk
+    :param session_factory: factory of sync db sessions
+    :return: generator of bytes chunks
+    :raises ValueError: If the entity or format is unknown
+    '''
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {export_format}")
+
+    query = export_query(entity, created_from, created_to, blocked)
+
+    def generate():
+        db = session_factory()
+        try:
+            result = db.execute(query.execution_options(yield_per=batch_size))
+            keys = tuple(result.keys())
+
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(keys)
+                yield buffer.getvalue().encode()
+
+                for rows in result.partitions():
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows([csv_value(value) for value in row] for row in rows)
+                    yield buffer.getvalue().encode()
+            else:
+                for rows in result.partitions():
+                    yield b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n" for row in rows)
+        finally:
+            db.close()
+
+    return generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entity", choices=EXPORT_ENTITIES)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--created-from", type=datetime.fromisoformat)
+    parser.add_argument("--created-to", type=datetime.fromisoformat)
+    blocked = parser.add_mutually_exclusive_group()
+    blocked.add_argument("--blocked", action="store_true", default=None)
+    blocked.add_argument("--not-blocked", dest="blocked", action="store_false", default=None)
+    parser.add_argument("--output", help="file to write, stdout by default")
+    args = parser.parse_args()
+
+    chunks = export_rows(args.entity, args.format, args.created_from, args.created_to, args.blocked)
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+'''
+Upgrade of a database created by an older version to the current models.
+Base.metadata.create_all only creates missing tables, so the columns and indexes added later to existing tables
+(*_pending, *_updated_at, comment_count, reply_count, the listing indexes) are added here with ALTER TABLE ADD COLUMN
+and CREATE INDEX IF NOT EXISTS, and the values of the rows already there are filled in. Every step checks the schema
+first, so it is run on every start of the app and does nothing on an up to date database.
+
+Usage: python -m swetter.database.migrate_db
+'''
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.orm import Session
+
+from swetter.database.db import engine as default_engine, Base
+# its create_all listener creates the FTS tables, also when this runs without the app
+from swetter.database.search_db import create_search_tables  # noqa: F401
+from swetter.models import Post, Comment, CommentDaily
+
+# added columns filled from another column of the row instead of their default
+COPIED_COLUMNS = {
+    ("Post", "post_updated_at"): "post_created_at",
+    ("Comment", "comment_updated_at"): "comment_created_at",
+    ("Reply_Comment", "reply_updated_at"): "reply_created_at",
+}
+
+
+def column_default(column, dialect):
+    '''
+    :return: DEFAULT clause for ALTER TABLE ADD COLUMN or empty string if the column has no constant default
+    '''
+
+    if column.server_default is not None:
+        return f" DEFAULT {column.server_default.arg}"
+    if column.default is not None and column.default.is_scalar:
+        value = literal(column.default.arg, column.type).compile(dialect=dialect,
+                                                                 compile_kwargs={"literal_binds": True})
+        return f" DEFAULT {value}"
+    return ""
+
+
+def add_missing_columns(connection, table, existing_columns):
+    '''
+    :return: names of the added columns
+    '''
+
+    dialect = connection.dialect
+    quote = dialect.identifier_preparer.quote
+    added = []
+
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+
+        not_null = "" if column.nullable else " NOT NULL"
+        connection.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                                f"{column.type.compile(dialect=dialect)}{not_null}"
+                                f"{column_default(column, dialect)}"))
+
+        source = COPIED_COLUMNS.get((table.name, column.name))
+        if source is not None:
+            connection.execute(text(f"UPDATE {quote(table.name)} SET {quote(column.name)} = {quote(source)}"))
+
+        added.append(column.name)
+
+    return added
+
+
+def upgrade_schema(engine=default_engine):
+    '''
+    Bring the database to the current models: add missing columns and indexes to existing tables, create missing
+    tables, and recompute the denormalized data that was not kept up to date before.
+    :param engine: sync engine
+    :return: dict table name -> added columns, empty if the database was up to date
+    '''
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = {}
+
+    # before create_all, so the FTS tables it creates can already index the new columns
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = add_missing_columns(connection, table,
+                                          {column["name"] for column in inspector.get_columns(table.name)})
+            if columns:
+                added[table.name] = columns
+
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    Base.metadata.create_all(bind=engine)
+
+    with Session(engine) as db:
+        if "comment_count" in added.get(Post.__tablename__, ()):
+            Post.reconcile_comment_counts(db)
+        if "reply_count" in added.get(Comment.__tablename__, ()):
+            Comment.reconcile_reply_counts(db)
+        if Comment.__tablename__ in existing_tables and CommentDaily.__tablename__ not in existing_tables:
+            CommentDaily.backfill(db)
+
+    return added
+
+
+def main():
+    added = upgrade_schema()
+
+    for table, columns in added.items():
+        print(f"{table}: added {', '.join(columns)}")
+    if not added:
+        print("Database is up to date")
+
+
+if __name__ == "__main__":
+    main()
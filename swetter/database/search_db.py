@@ -0,0 +1,267 @@
+'''
+Full-text search over visible posts, comments and replies with SQLite FTS5.
+
+Every entity has an external content FTS5 table (the text is not copied, snippets are read from the entity table)
+kept in sync by triggers. Only visible rows (not blocked, not pending) are indexed, so a row leaves the index
+when it gets blocked and enters it when its moderation is approved.
+
+Usage: python -m swetter.database.search_db [--entity posts] [--entity comments] [--entity replies]
+       rebuilds the index of the given entities (all by default) from the entity tables
+'''
+import argparse
+import base64
+import html
+import json
+import re
+from typing import NamedTuple
+
+from sqlalchemy import DateTime, event, text
+
+from swetter.database.db import Base, SessionLocal
+
+
+class SearchEntity(NamedTuple):
+    fts_table: str
+    table: str
+    id_column: str
+    columns: tuple
+    blocked_column: str
+    pending_column: str
+    # bm25 weight of every indexed column
+    weights: tuple
+    parent_column: str | None
+    title_column: str | None
+    created_column: str
+
+
+SEARCH_ENTITIES = {
+    "posts": SearchEntity("Post_Search", "Post", "post_id", ("post_title", "post_content"),
+                          "post_blocked", "post_pending", (10.0, 1.0), None, "post_title", "post_created_at"),
+    "comments": SearchEntity("Comment_Search", "Comment", "comment_id", ("comment_content",),
+                             "comment_blocked", "comment_pending", (1.0,), "post_id", None, "comment_created_at"),
+    "replies": SearchEntity("Reply_Search", "Reply_Comment", "reply_id", ("reply_content",),
+                            "reply_blocked", "reply_pending", (1.0,), "comment_id", None, "reply_created_at"),
+}
+
+SNIPPET_TOKENS = 12
+# private use characters marking the matches in snippet(), replaced by <b></b> after the text is escaped
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+_terms = re.compile(r"\w+")
+
+
+def visible(spec, row):
+    return f"{row}.{spec.blocked_column} = 0 AND {row}.{spec.pending_column} = 0"
+
+
+def search_ddl(spec):
+    '''
+    Statements creating the FTS5 table of an entity and the triggers keeping it in sync.
+    :param spec: SearchEntity
+    :return: list of SQL statements
+    '''
+
+    columns = ", ".join(spec.columns)
+
+    return [
+        f"CREATE VIRTUAL TABLE {spec.fts_table} USING fts5({columns}, content='{spec.table}', "
+        f"content_rowid='{spec.id_column}')",
+        f"INSERT INTO {spec.fts_table}({spec.fts_table}, rank) "
+        f"VALUES ('rank', 'bm25({', '.join(map(str, spec.weights))})')",
+    ] + search_triggers(spec)
+
+
+def search_triggers(spec):
+    '''
+    Statements creating the triggers that keep the FTS5 table of an entity in sync with the entity table.
+    :param spec: SearchEntity
+    :return: list of SQL statements
+    '''
+
+    columns = ", ".join(spec.columns)
+    old_values = ", ".join(f"old.{column}" for column in spec.columns)
+    new_values = ", ".join(f"new.{column}" for column in spec.columns)
+    watched = ", ".join(spec.columns + (spec.blocked_column, spec.pending_column))
+
+    delete_old = (f"INSERT INTO {spec.fts_table}({spec.fts_table}, rowid, {columns}) "
+                  f"SELECT 'delete', old.{spec.id_column}, {old_values} WHERE {visible(spec, 'old')};")
+    insert_new = (f"INSERT INTO {spec.fts_table}(rowid, {columns}) "
+                  f"SELECT new.{spec.id_column}, {new_values} WHERE {visible(spec, 'new')};")
+
+    return [
+        f"CREATE TRIGGER {spec.fts_table}_ai AFTER INSERT ON \"{spec.table}\" BEGIN {insert_new} END",
+        f"CREATE TRIGGER {spec.fts_table}_ad AFTER DELETE ON \"{spec.table}\" BEGIN {delete_old} END",
+        f"CREATE TRIGGER {spec.fts_table}_au AFTER UPDATE OF {watched} ON \"{spec.table}\" "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def drop_search_triggers(connection, entity):
+    '''
+    Drop the sync triggers of an entity, e.g. for a bulk load. Create them again with search_triggers
+    and rebuild the index afterwards.
+    :param connection: sqlalchemy connection (or session)
+    :param entity: posts, comments or replies
+    '''
+
+    spec = SEARCH_ENTITIES[entity]
+
+    for suffix in ("ai", "ad", "au"):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {spec.fts_table}_{suffix}"))
+
+
+def rebuild_search_index(connection, entity):
+    '''
+    Fill the index of an entity again from its table, e.g. after a bulk load with the triggers missing.
+    :param connection: sqlalchemy connection (or session) in a transaction
+    :param entity: posts, comments or replies
+    '''
+
+    spec = SEARCH_ENTITIES[entity]
+    columns = ", ".join(spec.columns)
+
+    connection.execute(text(f"INSERT INTO {spec.fts_table}({spec.fts_table}) VALUES ('delete-all')"))
+    connection.execute(text(
+        f"INSERT INTO {spec.fts_table}(rowid, {columns}) SELECT {spec.id_column}, {columns} "
+        f"FROM \"{spec.table}\" AS item WHERE {visible(spec, 'item')}"
+    ))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_search_tables(target, connection, **kwargs):
+    '''
+    Create missing FTS5 tables and triggers after Base.metadata.create_all, also on an existing database,
+    and index the rows already there.
+    '''
+
+    if connection.dialect.name != "sqlite":
+        return
+
+    existing = set(connection.execute(text("SELECT name FROM sqlite_master")).scalars())
+
+    for entity, spec in SEARCH_ENTITIES.items():
+        if spec.fts_table in existing or spec.table not in existing:
+            continue
+        for statement in search_ddl(spec):
+            connection.execute(text(statement))
+        rebuild_search_index(connection, entity)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_search_tables(target, connection, **kwargs):
+    if connection.dialect.name != "sqlite":
+        return
+
+    for spec in SEARCH_ENTITIES.values():
+        connection.execute(text(f"DROP TABLE IF EXISTS {spec.fts_table}"))
+
+
+def snippet_html(snippet: str | None) -> str | None:
+    '''
+    Escape the snippet text (it is user content) and mark the matches with <b></b>.
+    '''
+
+    if snippet is None:
+        return None
+
+    return html.escape(snippet).replace(MATCH_START, "<b>").replace(MATCH_END, "</b>")
+
+
+def match_expression(query: str) -> str:
+    '''
+    Turn user input into an FTS5 query: every word is quoted (so operators and punctuation in the input
+    can not break the query) and all words must match, the last one also as a prefix.
+    :param query: search text from the user
+    :return: FTS5 MATCH expression or empty string if the text has no words
+    '''
+
+    terms = [f'"{term}"' for term in _terms.findall(query)]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def encode_search_cursor(rank: float, row_id: int) -> str:
+    raw = json.dumps([rank, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, row_id = json.loads(raw)
+        return float(rank), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def search(db, entity, query, limit, cursor=None):
+    '''
+    Search the visible rows of an entity, best matches first (bm25, post titles weigh more than content).
+    Pages are keyset paginated on (rank, id), so a deep page costs the same as the first one.
+    :param db: db session
+    :param entity: posts, comments or replies
+    :param query: search text from the user
+    :param limit: page size
+    :param cursor: cursor returned with the previous page (optional)
+    :return: list of hits (dicts with id, user_id, parent_id, title, snippet, rank and created_at)
+    and cursor for the next page or None if this is the last page
+    :raises ValueError: If the entity or the cursor is invalid
+    '''
+
+    if entity not in SEARCH_ENTITIES:
+        raise ValueError(f"Unknown entity {entity}")
+
+    spec = SEARCH_ENTITIES[entity]
+    expression = match_expression(query)
+
+    if not expression:
+        return [], None
+
+    params = {"query": expression, "limit": limit + 1}
+    after_cursor = ""
+
+    if cursor is not None:
+        params["rank"], params["row_id"] = decode_search_cursor(cursor)
+        after_cursor = f"AND ({spec.fts_table}.rank, {spec.fts_table}.rowid) > (:rank, :row_id)"
+
+    rows = db.execute(text(
+        f"SELECT item.{spec.id_column} AS id, item.user_id AS user_id, "
+        f"{f'item.{spec.parent_column}' if spec.parent_column else 'NULL'} AS parent_id, "
+        f"{f'item.{spec.title_column}' if spec.title_column else 'NULL'} AS title, "
+        f"snippet({spec.fts_table}, -1, '{MATCH_START}', '{MATCH_END}', '...', {SNIPPET_TOKENS}) AS snippet, "
+        f"{spec.fts_table}.rank AS rank, item.{spec.created_column} AS created_at "
+        f"FROM {spec.fts_table} JOIN \"{spec.table}\" AS item ON item.{spec.id_column} = {spec.fts_table}.rowid "
+        f"WHERE {spec.fts_table} MATCH :query {after_cursor} "
+        f"ORDER BY {spec.fts_table}.rank, {spec.fts_table}.rowid LIMIT :limit"
+    ).columns(created_at=DateTime), params).mappings().all()
+
+    hits = [dict(row, snippet=snippet_html(row["snippet"])) for row in rows]
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_search_cursor(hits[-1]["rank"], hits[-1]["id"])
+
+    return hits, next_cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entity", dest="entities", action="append", choices=SEARCH_ENTITIES,
+                        help="entity to rebuild, all by default")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        Base.metadata.create_all(bind=db.get_bind())
+        for entity in args.entities or SEARCH_ENTITIES:
+            rebuild_search_index(db, entity)
+            db.commit()
+            print(f"Rebuilt the {entity} search index")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+'''
+Synthetic data at production scale: users, posts, comments and replies with a realistic skew.
+Comments go to posts and replies to comments with Zipf popularity (a few hot rows get most of them),
+timestamps are spread over the last days (a comment is always newer than its post) and a fraction is blocked.
+
+Rows are written with Core insert() executemany in large batches, one transaction per table, with the search
+triggers dropped during the load; the search index, the counters and the Comment_Daily rollup are rebuilt
+once at the end. All users share one password hash, computed once.
+
+Usage: python -m swetter.database.seed_db [--users 10000] [--posts 100000] [--comments 1000000] [--replies 500000]
+       [--days 365] [--zipf 1.1] [--blocked-fraction 0.02] [--password password] [--batch-size 50000] [--seed 1]
+'''
+import argparse
+import itertools
+import math
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from swetter.database.db import Base, engine as default_engine
+from swetter.database.search_db import SEARCH_ENTITIES, drop_search_triggers, rebuild_search_index, search_triggers
+from swetter.models import User, Post, Comment, CommentReply, CommentDaily
+from swetter.utils.passwords import password_hasher
+
+WORDS = ("python", "fastapi", "sqlite", "blog", "release", "weekend", "coffee", "music", "travel", "football",
+         "weather", "movie", "book", "garden", "startup", "cloud", "design", "photo", "recipe", "game")
+
+# multiplier of the permutation scattering Zipf ranks over the ids (prime, so coprime to almost every row count)
+PERMUTATION_STEP = 2654435761
+
+
+class ZipfSampler:
+    '''
+    Draws row indexes 0..n-1, rank k (1-based) with probability proportional to 1 / k ** exponent.
+    Ranks are scattered over the indexes by a multiplicative permutation, so the hot rows are not all the oldest.
+    '''
+
+    def __init__(self, n, exponent, rng):
+        self.n = n
+        self.rng = rng
+        self.population = range(n)
+        self.cum_weights = array("d", itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+        self.step = PERMUTATION_STEP if math.gcd(PERMUTATION_STEP, n) == 1 else 1
+
+    def sample(self, k):
+        ranks = self.rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+        return [rank * self.step % self.n for rank in ranks]
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def next_id(connection, column):
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def text_of(rng, words):
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def seed(engine=default_engine, users=10000, posts=100000, comments=1000000, replies=500000, days=365, zipf=1.1,
+         blocked_fraction=0.02, password="password", batch_size=50000, seed=None, log=print):
+    '''
+    Add synthetic rows to the database (existing rows are kept, new ids continue after them).
+    :param engine: sqlalchemy engine
+    :param users: number of users (named user<id>)
+    :param posts: number of posts
+    :param comments: number of comments
+    :param replies: number of replies
+    :param days: timestamps are spread over this many days back from now
+    :param zipf: exponent of the post and comment popularity
+    :param blocked_fraction: fraction of blocked posts, comments and replies
+    :param password: password of all users
+    :param batch_size: rows per executemany
+    :param seed: random seed (optional)
+    :param log: function printing progress
+    :return: dict table -> number of added rows
+    '''
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    span = days * 86400
+    start = now - timedelta(seconds=span)
+    sqlite = engine.dialect.name == "sqlite"
+
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        first_user = next_id(connection, User.user_id)
+        first_post = next_id(connection, Post.post_id)
+        first_comment = next_id(connection, Comment.comment_id)
+        first_reply = next_id(connection, CommentReply.reply_id)
+        if sqlite:
+            for entity in SEARCH_ENTITIES:
+                drop_search_triggers(connection, entity)
+
+    password_hash = password_hasher.context.hash(password)
+
+    def user_rows():
+        for user_id in range(first_user, first_user + users):
+            created_at = start + timedelta(seconds=span * rng.random())
+            yield {"user_id": user_id, "user_name": f"user{user_id}", "user_password_hash": password_hash,
+                   "user_created_at": created_at}
+
+    # creation offsets (seconds after start) of posts and comments, children are always created after them
+    post_offsets = array("d", sorted(span * rng.random() for _ in range(posts)))
+    comment_offsets = array("d")
+
+    def post_rows():
+        for index, offset in enumerate(post_offsets):
+            created_at = start + timedelta(seconds=offset)
+            blocked = rng.random() < blocked_fraction
+            yield {"post_id": first_post + index, "user_id": first_user + rng.randrange(users),
+                   "post_title": f"{text_of(rng, 3).capitalize()} {first_post + index}",
+                   "post_content": text_of(rng, 20), "post_auto_answer": rng.random() < 0.1, "post_delay": None,
+                   "post_created_at": created_at, "post_updated_at": created_at, "post_blocked": blocked,
+                   "post_blocked_at": created_at if blocked else None, "post_pending": False}
+
+    def comment_rows():
+        sampler = ZipfSampler(posts, zipf, rng)
+        for first in range(0, comments, batch_size):
+            for index, post_index in enumerate(sampler.sample(min(batch_size, comments - first)), first):
+                offset = post_offsets[post_index] + (span - post_offsets[post_index]) * rng.random()
+                comment_offsets.append(offset)
+                created_at = start + timedelta(seconds=offset)
+                blocked = rng.random() < blocked_fraction
+                yield {"comment_id": first_comment + index, "post_id": first_post + post_index,
+                       "user_id": first_user + rng.randrange(users), "comment_content": text_of(rng, 12),
+                       "comment_created_at": created_at, "comment_updated_at": created_at,
+                       "comment_blocked": blocked, "comment_blocked_at": created_at if blocked else None,
+                       "comment_pending": False}
+
+    def reply_rows():
+        sampler = ZipfSampler(comments, zipf, rng)
+        for first in range(0, replies, batch_size):
+            for index, comment_index in enumerate(sampler.sample(min(batch_size, replies - first)), first):
+                offset = comment_offsets[comment_index] + (span - comment_offsets[comment_index]) * rng.random()
+                created_at = start + timedelta(seconds=offset)
+                blocked = rng.random() < blocked_fraction
+                yield {"reply_id": first_reply + index, "comment_id": first_comment + comment_index,
+                       "user_id": first_user + rng.randrange(users), "reply_content": text_of(rng, 8),
+                       "reply_created_at": created_at, "reply_updated_at": created_at,
+                       "reply_blocked": blocked, "reply_blocked_at": created_at if blocked else None,
+                       "reply_pending": False}
+
+    tables = [(User, users, user_rows), (Post, posts, post_rows),
+              (Comment, comments if posts else 0, comment_rows), (CommentReply, replies if comments else 0, reply_rows)]
+    added = {}
+
+    try:
+        for model, count, rows in tables:
+            started = time.perf_counter()
+            with engine.begin() as connection:
+                if count:
+                    for batch in batched(rows(), batch_size):
+                        connection.execute(insert(model), batch)
+            elapsed = time.perf_counter() - started
+            added[model.__tablename__] = count
+            log(f"{model.__tablename__}: {count} rows in {elapsed:.1f} s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+    finally:
+        # also after a failed load, so the triggers are never left dropped. The index is rebuilt from the whole
+        # tables in the transaction that creates the triggers again, which also covers the rows the app wrote
+        # while the triggers were missing.
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            if sqlite:
+                for entity, spec in SEARCH_ENTITIES.items():
+                    drop_search_triggers(connection, entity)
+                    for statement in search_triggers(spec):
+                        connection.execute(text(statement))
+                    rebuild_search_index(connection, entity)
+
+        with Session(bind=engine) as db:
+            Post.reconcile_comment_counts(db)
+            Comment.reconcile_reply_counts(db)
+            CommentDaily.backfill(db)
+        log(f"Search index, counters and rollup rebuilt in {time.perf_counter() - started:.1f} s")
+
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=1000000)
+    parser.add_argument("--replies", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=365, help="spread timestamps over this many days back")
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the post and comment popularity")
+    parser.add_argument("--blocked-fraction", type=float, default=0.02)
+    parser.add_argument("--password", default="password", help="password of all users")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per executemany")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    if args.users < 1 and (args.posts or args.comments or args.replies):
+        parser.error("posts, comments and replies need at least one user")
+
+    started = time.perf_counter()
+    added = seed(users=args.users, posts=args.posts, comments=args.comments, replies=args.replies, days=args.days,
+                 zipf=args.zipf, blocked_fraction=args.blocked_fraction, password=args.password,
+                 batch_size=args.batch_size, seed=args.seed)
+    print(f"Added {sum(added.values())} rows in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
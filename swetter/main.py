@@ -1,20 +1,48 @@
 import os.path
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from swetter.database.db import engine, Base
+from swetter import METRICS_ENABLED
+from swetter.database.db import engine, async_engine
 from swetter.database.fill_db import populate_db
-from swetter.routes import router
-from swetter import scheduler
+from swetter.database.migrate_db import upgrade_schema
+from swetter.routes import router, metrics
+from swetter.utils.jobs import job_workers
+from swetter.utils.metrics import instrument_engine, instrument_requests
+from swetter.utils.query_diagnostics import query_diagnostics
+from swetter.utils.query_events import QueryTrackingMiddleware
 
-database_exists = os.path.exists("blog.db")
-Base.metadata.create_all(bind=engine)
+database_exists = engine.url.database is not None and os.path.exists(engine.url.database)
+# also adds the columns and indexes of newer versions to an existing database
+upgrade_schema(engine)
 
 if not database_exists:
     populate_db()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    job_workers.start()
+    yield
+    await job_workers.stop()
+    query_diagnostics.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
+# request and statement tracking shared by the metrics and the query diagnostics, idle while both are off
+app.add_middleware(QueryTrackingMiddleware)
 
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+    instrument_requests()
+    # scraped by Prometheus without a token, so it stays out of the API router
+    app.include_router(metrics.router)
 
-scheduler.start()
+if query_diagnostics.enabled:
+    query_diagnostics.attach(engine)
+    query_diagnostics.attach(async_engine.sync_engine, plan_engine=engine)
+    query_diagnostics.instrument_requests()
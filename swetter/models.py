@@ -1,8 +1,13 @@
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, date, timedelta
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Time,desc
+from sqlalchemy import (Boolean, Column, ForeignKey, Integer, String, Date, DateTime, Time, Index, text, insert, update, and_,
+                        func, bindparam)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import relationship, selectinload
 
 from swetter.database.db import Base
+from swetter.utils.pagination import paginate, DEFAULT_PAGE_SIZE
 
 
 class User(Base):
@@ -17,6 +22,10 @@ class User(Base):
     def get_user_by_username(cls, db, username):
         return db.query(cls).filter(cls.user_name == username).first()
 
+    @classmethod
+    def get_user_by_id(cls, db, user_id):
+        return db.get(cls, user_id)
+
     @classmethod
     def create_user(cls, db, username, hash_password):
         new_user = cls(user_name=username, user_password_hash=hash_password)
@@ -25,7 +34,25 @@ class User(Base):
         db.commit()
         db.refresh(new_user)
 
+    def update_password_hash(self, db, hash_password):
+        self.user_password_hash = hash_password
+
+        db.commit()
 
+    @classmethod
+    async def get_user_by_username_async(cls, db, username):
+        return await db.run_sync(cls.get_user_by_username, username)
+
+    @classmethod
+    async def get_user_by_id_async(cls, db, user_id):
+        return await db.run_sync(cls.get_user_by_id, user_id)
+
+    @classmethod
+    async def create_user_async(cls, db, username, hash_password):
+        await db.run_sync(cls.create_user, username, hash_password)
+
+    async def update_password_hash_async(self, db, hash_password):
+        await db.run_sync(self.update_password_hash, hash_password)
 
 
 class Post(Base):
@@ -38,8 +65,20 @@ class Post(Base):
     post_auto_answer = Column(Boolean, nullable=False)
     post_delay = Column(Time, default=datetime.strptime('00:01:00', '%H:%M:%S').time())
     post_created_at = Column(DateTime, default=datetime.utcnow)
+    post_updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     post_blocked = Column(Boolean, default=False)
     post_blocked_at = Column(DateTime, nullable=True)
+    post_pending = Column(Boolean, default=False)
+    # visible comments, kept up to date by the Comment methods in the same transaction as the comment change
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # relationships are never lazy loaded (lazy="raise"), load them with selectinload
+    comments = relationship("Comment", back_populates="post", lazy="raise", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_post_user_visible_created", "user_id", "post_blocked", "post_pending", "post_created_at"),
+        Index("ix_post_visible_created", "post_created_at", sqlite_where=text("post_blocked = 0 AND post_pending = 0")),
+    )
 
     def to_dict(self):
         return {
@@ -49,11 +88,12 @@ class Post(Base):
             "post_content": self.post_content,
             "post_auto_answer": self.post_auto_answer,
             "post_delay": self.post_delay,
-            "post_created_at": self.post_created_at
+            "post_created_at": self.post_created_at,
+            "comment_count": self.comment_count
         }
 
     def update(self, db, post_title=None, post_content=None,
-               post_auto_answer=None, post_delay=None, post_blocked=None, post_blocked_at=None):
+               post_auto_answer=None, post_delay=None, post_blocked=None, post_blocked_at=None, post_pending=None):
 
         if post_title is not None:
             self.post_title = post_title
@@ -67,34 +107,108 @@ class Post(Base):
             self.post_blocked = post_blocked
         if post_blocked_at is not None:
             self.post_blocked_at = post_blocked_at
+        if post_pending is not None:
+            self.post_pending = post_pending
 
         db.commit()
         db.refresh(self)
 
+    async def update_async(self, db, **fields):
+        await db.run_sync(self.update, **fields)
+
+    @classmethod
+    def add_to_comment_counts(cls, db, deltas):
+        '''
+        Shift comment_count of posts without committing, so the change is committed together with the comments.
+        :param db: db session
+        :param deltas: dict post id -> change of the number of visible comments
+        '''
+
+        params = [{"target_id": post_id, "delta": delta} for post_id, delta in deltas.items() if delta]
+
+        if params:
+            db.connection().execute(update(cls).where(cls.post_id == bindparam("target_id"))
+                                    .values(comment_count=cls.comment_count + bindparam("delta")), params)
+
+    @classmethod
+    def reconcile_comment_counts(cls, db):
+        '''
+        Recompute comment_count of all posts with one GROUP BY over the comments and fix the posts that drifted
+        (e.g. after writes that bypassed the models).
+        :param db: db session
+        :return: number of fixed posts
+        '''
+
+        counts = dict(db.query(Comment.post_id, func.count())
+                      .filter((Comment.comment_blocked == False) & (Comment.comment_pending == False))
+                      .group_by(Comment.post_id))
+        drifted = [{"target_id": post_id, "count": counts.get(post_id, 0)}
+                   for post_id, comment_count in db.query(cls.post_id, cls.comment_count)
+                   if comment_count != counts.get(post_id, 0)]
+
+        if drifted:
+            db.connection().execute(update(cls).where(cls.post_id == bindparam("target_id"))
+                                    .values(comment_count=bindparam("count")), drifted)
+        db.commit()
+
+        return len(drifted)
+
     @classmethod
     def get_post_by_id(cls,db, post_id):
         return db.query(cls).filter(cls.post_id == post_id).first()
 
     @classmethod
-    def get_user_posts(cls, db, user_id):
-        return db.query(cls).filter((cls.user_id == user_id) & (cls.post_blocked == False)).all()
+    def get_posts_by_ids(cls, db, post_ids):
+        return {post.post_id: post for post in db.query(cls).filter(cls.post_id.in_(post_ids))}
+
+    @classmethod
+    def get_user_posts(cls, db, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        query = db.query(cls).filter((cls.user_id == user_id) & (cls.post_blocked == False) & (cls.post_pending == False))
+        return paginate(query, cls.post_created_at, cls.post_id, limit, cursor, columns)
 
     @classmethod
     def create_post(cls, db,user_id,  post_title, post_content,
-                    post_auto_answer, post_delay=None, post_blocked=None, post_blocked_at=None):
+                    post_auto_answer, post_delay=None, post_blocked=None, post_blocked_at=None, post_pending=None,
+                    commit=True):
         new_post = cls(user_id=user_id,post_title=post_title, post_content=post_content,
                        post_auto_answer=post_auto_answer, post_delay=post_delay,
-                       post_blocked = post_blocked, post_blocked_at=post_blocked_at)
+                       post_blocked = post_blocked, post_blocked_at=post_blocked_at, post_pending=post_pending)
 
         db.add(new_post)
-        db.commit()
-        db.refresh(new_post)
+
+        # commit=False only flushes, so the caller can add related rows (e.g. its Job) to the same transaction
+        if commit:
+            db.commit()
+            db.refresh(new_post)
+        else:
+            db.flush()
 
         return new_post
 
     @classmethod
-    def get_all_posts(cls, db):
-        return db.query(cls).filter(cls.post_blocked == False).order_by(desc(cls.post_created_at)).all()
+    def get_all_posts(cls, db, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        query = db.query(cls).filter((cls.post_blocked == False) & (cls.post_pending == False))
+        return paginate(query, cls.post_created_at, cls.post_id, limit, cursor, columns)
+
+    @classmethod
+    async def get_post_by_id_async(cls, db, post_id):
+        return await db.run_sync(cls.get_post_by_id, post_id)
+
+    @classmethod
+    async def get_posts_by_ids_async(cls, db, post_ids):
+        return await db.run_sync(cls.get_posts_by_ids, post_ids)
+
+    @classmethod
+    async def get_user_posts_async(cls, db, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        return await db.run_sync(cls.get_user_posts, user_id, limit, cursor, columns)
+
+    @classmethod
+    async def create_post_async(cls, db, **fields):
+        return await db.run_sync(cls.create_post, **fields)
+
+    @classmethod
+    async def get_all_posts_async(cls, db, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        return await db.run_sync(cls.get_all_posts, limit, cursor, columns)
 
 
 class Comment(Base):
@@ -105,8 +219,21 @@ class Comment(Base):
     user_id = Column(Integer, ForeignKey('User.user_id'), nullable=False)
     comment_content = Column(String, nullable=False)
     comment_created_at = Column(DateTime, default=datetime.utcnow)
+    comment_updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     comment_blocked = Column(Boolean, default=False)
     comment_blocked_at = Column(DateTime, nullable=True)
+    comment_pending = Column(Boolean, default=False)
+    # visible replies, kept up to date by the CommentReply methods in the same transaction as the reply change
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    post = relationship("Post", back_populates="comments", lazy="raise")
+    replies = relationship("CommentReply", back_populates="comment", lazy="raise", passive_deletes=True,
+                           order_by="(CommentReply.comment_id, CommentReply.reply_created_at)")
+
+    __table_args__ = (
+        Index("ix_comment_post_visible_created", "post_id", "comment_blocked", "comment_pending", "comment_created_at"),
+        Index("ix_comment_user_visible_created", "user_id", "comment_blocked", "comment_pending", "comment_created_at"),
+    )
 
     def to_dict(self):
         return {
@@ -114,49 +241,214 @@ class Comment(Base):
             "post_id": self.post_id,
             "user_id": self.user_id,
             "comment_content": self.comment_content,
-            "comment_created_at": self.comment_created_at
+            "comment_created_at": self.comment_created_at,
+            "reply_count": self.reply_count
         }
 
-    def update(self, db, comment_content=None, comment_blocked=None, comment_blocked_at=None):
+    @property
+    def visible(self):
+        return not self.comment_blocked and not self.comment_pending
+
+    def rollup_changes(self, sign=1):
+        '''
+        What this comment adds to the Comment_Daily rollup: one created comment on its creation day
+        and one blocked comment on its blocking day if it is blocked.
+        :param sign: 1 to add the comment, -1 to remove it
+        :return: list of (post_id, user_id, day, created, blocked) changes
+        '''
+
+        changes = [(self.post_id, self.user_id, self.comment_created_at.date(), sign, 0)]
+
+        if self.comment_blocked and self.comment_blocked_at:
+            changes.append((self.post_id, self.user_id, self.comment_blocked_at.date(), 0, sign))
+
+        return changes
+
+    def update(self, db, comment_content=None, comment_blocked=None, comment_blocked_at=None, comment_pending=None,
+               commit=True):
+        was_visible = self.visible
+        old_rollup = self.rollup_changes(-1)
+
         if comment_content is not None:
             self.comment_content = comment_content
         if comment_blocked is not None:
             self.comment_blocked = comment_blocked
         if comment_blocked_at is not None:
             self.comment_blocked_at = comment_blocked_at
+        if comment_pending is not None:
+            self.comment_pending = comment_pending
+
+        Post.add_to_comment_counts(db, {self.post_id: self.visible - was_visible})
+        CommentDaily.add(db, old_rollup + self.rollup_changes())
 
+        if commit:
+            db.commit()
+            db.refresh(self)
+        else:
+            db.flush()
+
+    def delete(self, db):
+        if self.visible:
+            Post.add_to_comment_counts(db, {self.post_id: -1})
+        CommentDaily.add(db, self.rollup_changes(-1))
+
+        db.delete(self)
         db.commit()
-        db.refresh(self)
+
+    async def update_async(self, db, **fields):
+        await db.run_sync(self.update, **fields)
+
+    async def delete_async(self, db):
+        await db.run_sync(self.delete)
+
+    @classmethod
+    def add_to_reply_counts(cls, db, deltas):
+        '''
+        Shift reply_count of comments without committing, so the change is committed together with the replies.
+        :param db: db session
+        :param deltas: dict comment id -> change of the number of visible replies
+        '''
+
+        params = [{"target_id": comment_id, "delta": delta} for comment_id, delta in deltas.items() if delta]
+
+        if params:
+            db.connection().execute(update(cls).where(cls.comment_id == bindparam("target_id"))
+                                    .values(reply_count=cls.reply_count + bindparam("delta")), params)
+
+    @classmethod
+    def reconcile_reply_counts(cls, db):
+        '''
+        Recompute reply_count of all comments with one GROUP BY over the replies and fix the comments that drifted.
+        :param db: db session
+        :return: number of fixed comments
+        '''
+
+        counts = dict(db.query(CommentReply.comment_id, func.count())
+                      .filter((CommentReply.reply_blocked == False) & (CommentReply.reply_pending == False))
+                      .group_by(CommentReply.comment_id))
+        drifted = [{"target_id": comment_id, "count": counts.get(comment_id, 0)}
+                   for comment_id, reply_count in db.query(cls.comment_id, cls.reply_count)
+                   if reply_count != counts.get(comment_id, 0)]
+
+        if drifted:
+            db.connection().execute(update(cls).where(cls.comment_id == bindparam("target_id"))
+                                    .values(reply_count=bindparam("count")), drifted)
+        db.commit()
+
+        return len(drifted)
 
     @classmethod
     def get_comment_by_id(cls, db, comment_id):
         return db.query(cls).filter(cls.comment_id == comment_id).first()
 
     @classmethod
-    def get_post_comments(cls, db, post_id):
-        return db.query(cls).filter((cls.post_id == post_id) & (cls.comment_blocked == False)).all()
+    def get_comments_by_ids(cls, db, comment_ids):
+        return {comment.comment_id: comment for comment in db.query(cls).filter(cls.comment_id.in_(comment_ids))}
 
     @classmethod
-    def get_user_comments(cls, db, user_id):
-        return db.query(cls).filter((cls.user_id == user_id) & (cls.comment_blocked == False)).order_by(
-            desc(cls.comment_created_at)).all()
+    def get_post_comments(cls, db, post_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        query = db.query(cls).filter((cls.post_id == post_id) & (cls.comment_blocked == False) &
+                                     (cls.comment_pending == False))
+        return paginate(query, cls.comment_created_at, cls.comment_id, limit, cursor, columns)
 
     @classmethod
-    def create_comment(cls, db, post_id, user_id, comment_content, comment_blocked=None, comment_blocked_at=None):
+    def get_post_comments_with_replies(cls, db, post_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        '''
+        Page of visible comments of a post with their visible replies.
+        Replies of the whole page are loaded by one extra query (selectinload).
+        :return: comments of the page and cursor for the next page
+        :raises ValueError: If the cursor is malformed
+        '''
+
+        visible_replies = cls.replies.and_((CommentReply.reply_blocked == False) & (CommentReply.reply_pending == False))
+        query = db.query(cls).options(selectinload(visible_replies)).filter(
+            (cls.post_id == post_id) & (cls.comment_blocked == False) & (cls.comment_pending == False))
+        return paginate(query, cls.comment_created_at, cls.comment_id, limit, cursor)
+
+    @classmethod
+    def get_user_comments(cls, db, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        query = db.query(cls).filter((cls.user_id == user_id) & (cls.comment_blocked == False) &
+                                     (cls.comment_pending == False))
+        return paginate(query, cls.comment_created_at, cls.comment_id, limit, cursor, columns)
+
+    @classmethod
+    def create_comment(cls, db, post_id, user_id, comment_content, comment_blocked=None, comment_blocked_at=None,
+                       comment_pending=None, commit=True):
         new_comment = cls(
             post_id=post_id,
             user_id=user_id,
             comment_content=comment_content,
             comment_blocked=comment_blocked,
-            comment_blocked_at=comment_blocked_at
+            comment_blocked_at=comment_blocked_at,
+            comment_pending=comment_pending
         )
 
         db.add(new_comment)
-        db.commit()
-        db.refresh(new_comment)
+        # flush to get the creation time for the rollup
+        db.flush()
+        if new_comment.visible:
+            Post.add_to_comment_counts(db, {post_id: 1})
+        CommentDaily.add(db, new_comment.rollup_changes())
+
+        if commit:
+            db.commit()
+            db.refresh(new_comment)
 
         return new_comment
 
+    @classmethod
+    async def get_comment_by_id_async(cls, db, comment_id):
+        return await db.run_sync(cls.get_comment_by_id, comment_id)
+
+    @classmethod
+    async def get_post_comments_async(cls, db, post_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        return await db.run_sync(cls.get_post_comments, post_id, limit, cursor, columns)
+
+    @classmethod
+    async def get_post_comments_with_replies_async(cls, db, post_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        return await db.run_sync(cls.get_post_comments_with_replies, post_id, limit, cursor)
+
+    @classmethod
+    async def get_user_comments_async(cls, db, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        return await db.run_sync(cls.get_user_comments, user_id, limit, cursor, columns)
+
+    @classmethod
+    def create_comments(cls, db, rows, commit=True):
+        '''
+        Insert many comments with one multi-row INSERT and one commit.
+        :param db: db session
+        :param rows: list of dicts with the create_comment arguments, all with the same keys
+        :param commit: False leaves the transaction open for related rows (e.g. jobs)
+        :return: list of new Comment objects in the order of rows
+        '''
+
+        if not rows:
+            return []
+
+        # render_nulls keeps rows with and without blocked_at in one statement. RETURNING order is not guaranteed,
+        # but ids of one INSERT are given out in the order of its rows (sort_by_parameter_order would make SQLite
+        # fall back to one INSERT per row)
+        new_comments = db.scalars(insert(cls).returning(cls), rows, execution_options={"render_nulls": True})
+        new_comments = sorted(new_comments, key=lambda row: row.comment_id)
+        Post.add_to_comment_counts(db, Counter(comment.post_id for comment in new_comments if comment.visible))
+        CommentDaily.add(db, [change for comment in new_comments for change in comment.rollup_changes()])
+        if commit:
+            db.commit()
+
+        return new_comments
+
+    @classmethod
+    async def get_comments_by_ids_async(cls, db, comment_ids):
+        return await db.run_sync(cls.get_comments_by_ids, comment_ids)
+
+    @classmethod
+    async def create_comment_async(cls, db, **fields):
+        return await db.run_sync(cls.create_comment, **fields)
+
+    @classmethod
+    async def create_comments_async(cls, db, rows, commit=True):
+        return await db.run_sync(cls.create_comments, rows, commit)
+
 
 class CommentReply(Base):
     __tablename__ = "Reply_Comment"
@@ -166,8 +458,16 @@ class CommentReply(Base):
     user_id = Column(Integer, ForeignKey('User.user_id'), nullable=False)
     reply_content = Column(String, nullable=False)
     reply_created_at = Column(DateTime, default=datetime.utcnow)
+    reply_updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     reply_blocked = Column(Boolean, default=False)
     reply_blocked_at = Column(DateTime, nullable=True)
+    reply_pending = Column(Boolean, default=False)
+
+    comment = relationship("Comment", back_populates="replies", lazy="raise")
+
+    __table_args__ = (
+        Index("ix_reply_comment_visible_created", "comment_id", "reply_blocked", "reply_pending", "reply_created_at"),
+    )
 
     def to_dict(self):
         return {
@@ -178,37 +478,419 @@ class CommentReply(Base):
             "reply_created_at": self.reply_created_at
         }
 
-    def update(self, db, reply_content=None, reply_blocked=None, reply_blocked_at=None):
+    @property
+    def visible(self):
+        return not self.reply_blocked and not self.reply_pending
+
+    def update(self, db, reply_content=None, reply_blocked=None, reply_blocked_at=None, reply_pending=None):
+        was_visible = self.visible
+
         if reply_content is not None:
             self.reply_content = reply_content
         if reply_blocked is not None:
             self.reply_blocked = reply_blocked
         if reply_blocked_at is not None:
             self.reply_blocked_at = reply_blocked_at
+        if reply_pending is not None:
+            self.reply_pending = reply_pending
 
+        Comment.add_to_reply_counts(db, {self.comment_id: self.visible - was_visible})
         db.commit()
         db.refresh(self)
 
+    def delete(self, db):
+        if self.visible:
+            Comment.add_to_reply_counts(db, {self.comment_id: -1})
+
+        db.delete(self)
+        db.commit()
+
+    async def update_async(self, db, **fields):
+        await db.run_sync(self.update, **fields)
+
+    async def delete_async(self, db):
+        await db.run_sync(self.delete)
+
     @classmethod
     def get_reply_by_id(cls, db, reply_id):
         return db.query(cls).filter(cls.reply_id == reply_id).first()
 
     @classmethod
-    def get_comment_replies(cls, db, comment_id):
-        return db.query(cls).filter((cls.comment_id == comment_id) & (cls.reply_blocked == False)).all()
+    def get_comment_replies(cls, db, comment_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        query = db.query(cls).filter((cls.comment_id == comment_id) & (cls.reply_blocked == False) &
+                                     (cls.reply_pending == False))
+        return paginate(query, cls.reply_created_at, cls.reply_id, limit, cursor, columns)
 
     @classmethod
-    def create_reply(cls, db, comment_id, user_id, reply_content, reply_blocked=None, reply_blocked_at=None):
+    def create_reply(cls, db, comment_id, user_id, reply_content, reply_blocked=None, reply_blocked_at=None,
+                     reply_pending=None, commit=True):
         new_reply = cls(
             comment_id=comment_id,
             user_id=user_id,
             reply_content=reply_content,
             reply_blocked=reply_blocked,
-            reply_blocked_at=reply_blocked_at
+            reply_blocked_at=reply_blocked_at,
+            reply_pending=reply_pending
         )
 
         db.add(new_reply)
-        db.commit()
-        db.refresh(new_reply)
+        if new_reply.visible:
+            Comment.add_to_reply_counts(db, {comment_id: 1})
+
+        if commit:
+            db.commit()
+            db.refresh(new_reply)
+        else:
+            db.flush()
 
         return new_reply
+
+    @classmethod
+    async def get_reply_by_id_async(cls, db, reply_id):
+        return await db.run_sync(cls.get_reply_by_id, reply_id)
+
+    @classmethod
+    async def get_comment_replies_async(cls, db, comment_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+        return await db.run_sync(cls.get_comment_replies, comment_id, limit, cursor, columns)
+
+    @classmethod
+    def create_replies(cls, db, rows, commit=True):
+        '''
+        Insert many replies with one multi-row INSERT and one commit.
+        :param db: db session
+        :param rows: list of dicts with the create_reply arguments, all with the same keys
+        :param commit: False leaves the transaction open for related rows (e.g. jobs)
+        :return: list of new CommentReply objects in the order of rows
+        '''
+
+        if not rows:
+            return []
+
+        # see create_comments
+        new_replies = db.scalars(insert(cls).returning(cls), rows, execution_options={"render_nulls": True})
+        new_replies = sorted(new_replies, key=lambda row: row.reply_id)
+        Comment.add_to_reply_counts(db, Counter(reply.comment_id for reply in new_replies if reply.visible))
+        if commit:
+            db.commit()
+
+        return new_replies
+
+    @classmethod
+    async def create_reply_async(cls, db, **fields):
+        return await db.run_sync(cls.create_reply, **fields)
+
+    @classmethod
+    async def create_replies_async(cls, db, rows, commit=True):
+        return await db.run_sync(cls.create_replies, rows, commit)
+
+
+class CommentDaily(Base):
+    '''
+    Daily rollup of created and blocked comments (by creation and blocking day, UTC) for the whole site,
+    for every post and for every author, so a breakdown reads one row per day.
+    '''
+
+    __tablename__ = "Comment_Daily"
+
+    # "all" (daily_scope_id 0), "post" (post id) or "user" (author id)
+    daily_scope = Column(String, primary_key=True)
+    daily_scope_id = Column(Integer, primary_key=True)
+    daily_day = Column(Date, primary_key=True)
+    daily_created = Column(Integer, nullable=False, default=0)
+    daily_blocked = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def add(cls, db, changes):
+        '''
+        Apply comment changes to the rollup without committing, so they are committed together with the comments.
+        :param db: db session
+        :param changes: iterable of (post_id, user_id, day, created, blocked) tuples, see Comment.rollup_changes
+        '''
+
+        totals = {}
+
+        for post_id, user_id, day, created, blocked in changes:
+            for scope in (("all", 0), ("post", post_id), ("user", user_id)):
+                total = totals.setdefault(scope + (day,), [0, 0])
+                total[0] += created
+                total[1] += blocked
+
+        params = [{"daily_scope": scope, "daily_scope_id": scope_id, "daily_day": day,
+                   "daily_created": created, "daily_blocked": blocked}
+                  for (scope, scope_id, day), (created, blocked) in totals.items() if created or blocked]
+
+        if params:
+            upsert = sqlite_insert(cls)
+            db.connection().execute(upsert.on_conflict_do_update(
+                index_elements=[cls.daily_scope, cls.daily_scope_id, cls.daily_day],
+                set_={"daily_created": cls.daily_created + upsert.excluded.daily_created,
+                      "daily_blocked": cls.daily_blocked + upsert.excluded.daily_blocked},
+            ), params)
+
+    @classmethod
+    def backfill(cls, db):
+        '''
+        Rebuild the rollup from the Comment table with one GROUP BY pass.
+        :param db: db session
+        :return: number of rollup rows written
+        '''
+
+        blocked_day = func.date(Comment.comment_blocked_at)
+        groups = (db.query(Comment.post_id, Comment.user_id, func.date(Comment.comment_created_at),
+                           and_(Comment.comment_blocked == True, blocked_day.isnot(None)), blocked_day, func.count())
+                  .group_by(Comment.post_id, Comment.user_id, func.date(Comment.comment_created_at),
+                            Comment.comment_blocked, blocked_day))
+
+        changes = []
+        for post_id, user_id, created_day, blocked, blocked_day, count in groups:
+            changes.append((post_id, user_id, date.fromisoformat(created_day), count, 0))
+            if blocked:
+                changes.append((post_id, user_id, date.fromisoformat(blocked_day), 0, count))
+
+        db.query(cls).delete()
+        cls.add(db, changes)
+        db.commit()
+
+        return db.query(cls).count()
+
+    @classmethod
+    def get_breakdown(cls, db, date_from, date_to, post_id=None, user_id=None):
+        '''
+        Daily created and blocked comments over a date range, read from the rollup.
+        :param db: db session
+        :param date_from: first day
+        :param date_to: last day (included)
+        :param post_id: count only comments of this post (optional)
+        :param user_id: count only comments of this author (optional), not together with post_id
+        :return: list of (day, created, blocked) for every day of the range
+        '''
+
+        scope = ("post", post_id) if post_id is not None else ("user", user_id) if user_id is not None else ("all", 0)
+
+        rows = {day: (created, blocked) for day, created, blocked in
+                db.query(cls.daily_day, cls.daily_created, cls.daily_blocked)
+                .filter((cls.daily_scope == scope[0]) & (cls.daily_scope_id == scope[1]) &
+                        (cls.daily_day >= date_from) & (cls.daily_day <= date_to))}
+
+        return [(day, *rows.get(day, (0, 0)))
+                for day in (date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1))]
+
+    @classmethod
+    async def get_breakdown_async(cls, db, date_from, date_to, post_id=None, user_id=None):
+        return await db.run_sync(cls.get_breakdown, date_from, date_to, post_id, user_id)
+
+
+class ModerationVerdict(Base):
+    __tablename__ = "Moderation_Verdict"
+
+    verdict_key = Column(String, primary_key=True)
+    verdict_kind = Column(String, nullable=False)
+    verdict_blocked = Column(Boolean, nullable=False)
+    verdict_created_at = Column(DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def get_verdict(cls, db, verdict_key, created_after):
+        return db.query(cls).filter((cls.verdict_key == verdict_key) & (cls.verdict_created_at > created_after)).first()
+
+    @classmethod
+    def save_verdict(cls, db, verdict_key, verdict_kind, verdict_blocked):
+        db.merge(cls(verdict_key=verdict_key, verdict_kind=verdict_kind, verdict_blocked=verdict_blocked,
+                     verdict_created_at=datetime.utcnow()))
+        db.commit()
+
+
+class Job(Base):
+    __tablename__ = "Job"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    job_kind = Column(String, nullable=False)
+    job_entity_id = Column(Integer, nullable=False)
+    job_status = Column(String, nullable=False, default="queued")
+    job_attempts = Column(Integer, nullable=False, default=0)
+    job_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    job_locked_until = Column(DateTime, nullable=True)
+    job_created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_job_status_run_at", "job_status", "job_run_at"),
+        Index("ix_job_kind_entity", "job_kind", "job_entity_id"),
+    )
+
+    @classmethod
+    def enqueue(cls, db, job_kind, job_entity_id, job_run_at=None, commit=True):
+        new_job = cls(job_kind=job_kind, job_entity_id=job_entity_id, job_run_at=job_run_at or datetime.utcnow())
+
+        db.add(new_job)
+
+        # commit=False queues the job in the transaction of the row it works on: both are saved or neither
+        if commit:
+            db.commit()
+            db.refresh(new_job)
+        else:
+            db.flush()
+
+        return new_job
+
+    @classmethod
+    def enqueue_many(cls, db, jobs, commit=True):
+        '''
+        Queue many jobs with one INSERT and one commit.
+        :param db: db session
+        :param jobs: list of (job_kind, job_entity_id, job_run_at) tuples, job_run_at None means now
+        :param commit: False leaves the transaction open, so the jobs are saved together with their rows
+        '''
+
+        if not jobs:
+            return
+
+        now = datetime.utcnow()
+        db.execute(insert(cls), [{"job_kind": job_kind, "job_entity_id": job_entity_id, "job_run_at": job_run_at or now}
+                                 for job_kind, job_entity_id, job_run_at in jobs])
+        if commit:
+            db.commit()
+
+    @classmethod
+    def next_due(cls, db, now):
+        '''
+        Oldest due job without claiming it. The queued jobs and the expired leases are two queries, each served
+        in job_run_at order by ix_job_status_run_at and stopped at the first row; one query with OR of both
+        conditions would sort all due jobs on every poll.
+        :param db: db session
+        :param now: datetime
+        :return: Job or None
+        '''
+
+        queued = (db.query(cls).filter((cls.job_status == "queued") & (cls.job_run_at <= now))
+                  .order_by(cls.job_run_at).first())
+        expired = (db.query(cls).filter((cls.job_status == "running") & (cls.job_locked_until < now))
+                   .order_by(cls.job_run_at).first())
+
+        if queued is None or expired is None:
+            return queued or expired
+        return queued if queued.job_run_at <= expired.job_run_at else expired
+
+    @classmethod
+    def claim_next(cls, db, lease_seconds):
+        '''
+        Take the oldest due job: queued, or running with an expired lease (its worker died).
+        The conditional UPDATE makes the claim safe between workers and processes.
+        :param db: db session
+        :param lease_seconds: how long the job belongs to this worker
+        :return: claimed Job or None if there is nothing to do
+        '''
+
+        now = datetime.utcnow()
+
+        while True:
+            job = cls.next_due(db, now)
+            if job is None:
+                return None
+
+            claimed = db.execute(
+                update(cls)
+                .where((cls.job_id == job.job_id) & (cls.job_status == job.job_status) &
+                       (cls.job_attempts == job.job_attempts))
+                .values(job_status="running", job_attempts=cls.job_attempts + 1,
+                        job_locked_until=now + timedelta(seconds=lease_seconds))
+            ).rowcount
+            db.commit()
+
+            if claimed:
+                db.refresh(job)
+                return job
+
+    def mark_done(self):
+        '''
+        Set the done status without committing, so it is saved by the commit of the handler together with its work.
+        '''
+
+        self.job_status = "done"
+        self.job_locked_until = None
+
+    def finish(self, db):
+        self.mark_done()
+        db.commit()
+
+    def retry(self, db, backoff_base, backoff_max, max_attempts):
+        '''
+        Put a failed job back in the queue with exponential backoff,
+        or move it to the dead status after max_attempts attempts.
+        :param db: db session
+        :param backoff_base: delay in seconds before the second attempt, doubled for every next attempt
+        :param backoff_max: max delay in seconds
+        :param max_attempts: attempts after which the job is given up
+        '''
+
+        self.job_locked_until = None
+
+        if self.job_attempts >= max_attempts:
+            self.job_status = "dead"
+        else:
+            delay = min(backoff_base * 2 ** (self.job_attempts - 1), backoff_max)
+            self.job_status = "queued"
+            self.job_run_at = datetime.utcnow() + timedelta(seconds=delay)
+
+        db.commit()
+
+    @classmethod
+    def purge_done(cls, db, older_than):
+        '''
+        Delete done jobs due before older_than, so the table does not grow with every job ever run.
+        Dead jobs are kept for inspection.
+        :param db: db session
+        :param older_than: datetime
+        :return: number of deleted jobs
+        '''
+
+        deleted = (db.query(cls).filter((cls.job_status == "done") & (cls.job_run_at < older_than))
+                   .delete(synchronize_session=False))
+        db.commit()
+
+        return deleted
+
+    @classmethod
+    def queue_stats(cls, db):
+        '''
+        Queue introspection.
+        :param db: db session
+        :return: dict with number of jobs in every status and lag: seconds since the oldest due queued job
+        was supposed to run (0 if nothing is overdue)
+        '''
+
+        now = datetime.utcnow()
+        stats = {status: 0 for status in ("queued", "running", "done", "dead")}
+
+        for status, count in db.query(cls.job_status, func.count()).group_by(cls.job_status):
+            stats[status] = count
+
+        oldest_due = (db.query(func.min(cls.job_run_at))
+                      .filter((cls.job_status == "queued") & (cls.job_run_at <= now)).scalar())
+        stats["lag"] = (now - oldest_due).total_seconds() if oldest_due else 0.0
+
+        return stats
+
+    @classmethod
+    async def enqueue_async(cls, db, job_kind, job_entity_id, job_run_at=None, commit=True):
+        return await db.run_sync(cls.enqueue, job_kind, job_entity_id, job_run_at, commit)
+
+    @classmethod
+    async def enqueue_many_async(cls, db, jobs, commit=True):
+        await db.run_sync(cls.enqueue_many, jobs, commit)
+
+    @classmethod
+    async def claim_next_async(cls, db, lease_seconds):
+        return await db.run_sync(cls.claim_next, lease_seconds)
+
+    async def finish_async(self, db):
+        await db.run_sync(self.finish)
+
+    @classmethod
+    async def purge_done_async(cls, db, older_than):
+        return await db.run_sync(cls.purge_done, older_than)
+
+    async def retry_async(self, db, backoff_base, backoff_max, max_attempts):
+        await db.run_sync(self.retry, backoff_base, backoff_max, max_attempts)
+
+    @classmethod
+    async def queue_stats_async(cls, db):
+        return await db.run_sync(cls.queue_stats)
@@ -1,10 +1,13 @@
 from fastapi import APIRouter
 
-from . import auth, posts, comments, reply_comment
+from . import auth, posts, comments, reply_comment, export, thread, search
 
 router = APIRouter()
 router.include_router(auth.router)
 router.include_router(posts.router)
 router.include_router(comments.router)
 router.include_router(reply_comment.router)
+router.include_router(export.router)
+router.include_router(thread.router)
+router.include_router(search.router)
 
@@ -2,47 +2,55 @@ from datetime import datetime, timedelta, timezone
 
 import jwt
 from fastapi import APIRouter, HTTPException, Response, Depends
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 
 from swetter import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 from swetter.models import User
 from swetter.schem import UserSchem, Token
-from swetter.utils.deps import get_db
+from swetter.utils.deps import get_async_db
+from swetter.utils.passwords import password_hasher, PasswordHasherOverloaded
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    '''
+    Hash a password in the calling thread, for scripts outside the event loop.
+    '''
+
+    return password_hasher.context.hash(password)
 
 
-def authenticate_user(db, username: str, password: str):
+async def authenticate_user(db, username: str, password: str):
     '''
-    Check if user exists on db and equals of hash passwords
+    Check if user exists on db and equals of hash passwords.
+    A hash made with another BCRYPT_ROUNDS is replaced with a new one.
     :param db: db session
     :param username: user username
     :param password: user password
     :return: User instance from db if user correct authenticated else False
+    :raises PasswordHasherOverloaded: If too many password operations are in progress
     '''
 
-    user = User.get_user_by_username(db, username)
+    user = await User.get_user_by_username_async(db, username)
     if not user:
         return False
-    if not verify_password(password, user.user_password_hash):
+
+    verified, new_hash = await password_hasher.verify_and_update(password, user.user_password_hash)
+    if not verified:
         return False
+
+    if new_hash is not None:
+        await user.update_password_hash_async(db, new_hash)
+
     return user
 
 
 def create_access_token(data: dict) -> str:
     '''
     Create token using jwt and user data
-    :param data: username and password
+    :param data: username (sub) and user id (user_id)
     :return: access token
     '''
 
@@ -56,45 +64,57 @@ def create_access_token(data: dict) -> str:
 
 
 @router.post("/registration/")
-async def create_user(form_data: UserSchem, db=Depends(get_db)):
+async def create_user(form_data: UserSchem, db=Depends(get_async_db)):
     '''
     Create user, if not exists or return error
     :param form_data: username and password
     :param db: db session
-    :return: Empty response with 201 status code or Exception if user exists
+    :return: Empty response with 201 status code, Exception if user exists
+    or JSONResponse with status code 503 if too many passwords are being hashed
     '''
 
     username, password = form_data.dict().values()
 
-    user = User.get_user_by_username(db, username)
+    user = await User.get_user_by_username_async(db, username)
 
     if user:
         raise HTTPException(400, headers={"Cannot create": "User with this name already exists"})
 
-    User.create_user(db, username, get_password_hash(password))
+    try:
+        password_hash = await password_hasher.hash(password)
+    except PasswordHasherOverloaded:
+        return JSONResponse(status_code=503, content={"Service Unavailable": "Please, try again later"},
+                            headers={"Retry-After": "1"})
+
+    await User.create_user_async(db, username, password_hash)
 
     return Response(status_code=201)
 
 
 @router.post("/login/", response_model=Token)
-async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_async_db)):
     '''
     Log in user by username and password. Return token
     :param form_data: username and password
     :param db: db session
-    :return: Token if user authenticated or Exception if incorrect username or password
+    :return: Token if user authenticated, Exception if incorrect username or password
+    or JSONResponse with status code 503 if too many passwords are being checked
     '''
 
-    user = authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHasherOverloaded:
+        return JSONResponse(status_code=503, content={"Service Unavailable": "Please, try again later"},
+                            headers={"Retry-After": "1"})
 
-    if not user or not verify_password(form_data.password, user.user_password_hash):
+    if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = create_access_token(
-        data={"sub": user.user_name}
+        data={"sub": user.user_name, "user_id": user.user_id}
     )
 
     return Token(access_token=access_token, token_type="bearer")
@@ -1,62 +1,132 @@
+import asyncio
 import datetime
-from typing import List
 
-from fastapi import APIRouter, Response, Depends
+import orjson
+
+from fastapi import APIRouter, Request, Response, Depends, Query
 from fastapi.responses import JSONResponse
 
-from swetter import scheduler
-from swetter.models import Comment, Post
-from swetter.routes.reply_comment import create_auto_reply
-from swetter.schem import CommentResponse, CommentCreateRequest, CommentUpdateRequest
+from swetter import MODERATION_MODE
+from swetter.models import Comment, CommentDaily, Post, Job
+from swetter.schem import (CommentResponse, CommentCreateRequest, CommentUpdateRequest, CommentPage, CommentBatchRequest,
+                           CommentBatchResponse, CommentDailyBreakdown)
+from swetter.utils.conditional import (row_etag, page_etag, is_not_modified, validator_headers,
+                                       not_modified_response)
 from swetter.utils.deps import get_current_user
-from swetter.utils.deps import get_db
-from swetter.utils.gemini import get_data_from_gemini
+from swetter.utils.deps import get_async_db
+from swetter.utils.gemini import get_data_from_gemini_async
+from swetter.utils.jobs import job_handler
+from swetter.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from swetter.utils.read_cache import read_cache
+from swetter.utils.serialization import RowSerializer
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
+MAX_BREAKDOWN_DAYS = 366
+comment_serializer = RowSerializer(CommentResponse, Comment)
+comment_page_columns = comment_serializer.columns + (Comment.comment_updated_at,)
+
+
+def invalidate_comment_pages(post_id):
+    '''
+    Drop the cached data that shows the comments of a post: its comment pages and the post (comment_count).
+    :param post_id: post id in database
+    '''
+
+    read_cache.invalidate("post_comments", post_id)
+    read_cache.invalidate("post", post_id)
+
+
+def auto_reply_run_at(post):
+    '''
+    Time of the auto-reply of the post owner to a new comment.
+    :param post: Post object
+    :return: now plus the post delay
+    '''
+
+    delay = datetime.timedelta(hours=post.post_delay.hour, minutes=post.post_delay.minute,
+                               seconds=post.post_delay.second) if post.post_delay else datetime.timedelta()
+    return datetime.datetime.utcnow() + delay
+
+
+async def schedule_auto_reply(db, post, comment):
+    '''
+    Queue the auto-reply of the post owner to a comment, if the post has auto answer enabled.
+    The job is run after the post delay by the job workers (see create_auto_reply).
+    It is only flushed: the caller commits it together with the comment.
+    :param db: db session
+    :param post: Post object
+    :param comment: Comment object
+    '''
+
+    if post.post_auto_answer:
+        await Job.enqueue_async(db, "auto_reply", comment.comment_id, job_run_at=auto_reply_run_at(post),
+                                commit=False)
 
 
 @router.get("/comment/{comment_id}", response_model=CommentResponse)
-async def get_comment(comment_id: int, db=Depends(get_db)):
+async def get_comment(comment_id: int, request: Request, db=Depends(get_async_db)):
     '''
     Get comment by comment id.
     :param comment_id: comment id in database
+    :param request: request with the If-None-Match / If-Modified-Since headers
     :param db: db session
     :return: CommentResponse with comment data or JSONResponse with error if comment not exists
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    comment = Comment.get_comment_by_id(db, comment_id)
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
 
     if not comment:
         return JSONResponse(status_code=404, content={"Not Found": "Comment with this id not found"})
     if comment.comment_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment is blocked"})
+    if comment.comment_pending:
+        return JSONResponse(status_code=202, content={"Pending": "Comment is awaiting moderation"})
 
-    return CommentResponse(**comment.to_dict())
+    etag = row_etag("comment", comment.comment_id, comment.comment_updated_at)
+    headers = validator_headers(etag, comment.comment_updated_at)
+
+    if is_not_modified(request, etag, comment.comment_updated_at):
+        return not_modified_response(headers)
+
+    return comment_serializer.response(comment, headers=headers)
 
 
 @router.post("/comment/", response_model=CommentResponse)
-async def create_comment(form_data: CommentCreateRequest, db=Depends(get_db),
+async def create_comment(form_data: CommentCreateRequest, db=Depends(get_async_db),
                          current_user=Depends(get_current_user)):
     '''
     Create comment from user data. Before creating, check if comment contains prohibited content.
+    In pending moderation mode the comment is saved hidden and checked by a background worker.
     :param form_data: comment content and associated post id
     :param db: db session
     :param current_user: user who sends the request
-    :return: CommentResponse with comment data or JSONResponse with error if comment contains prohibited content or problems with Gemini
+    :return: CommentResponse with comment data, JSONResponse with status code 202 and comment id in pending moderation mode
+    or JSONResponse with error if comment contains prohibited content or problems with Gemini
     '''
 
     data = form_data.dict()
 
-    post = Post.get_post_by_id(db, data["post_id"])
+    post = await Post.get_post_by_id_async(db, data["post_id"])
 
     if not post:
         return JSONResponse(status_code=404, content={"Not Found": "Post with this id not found"})
     if post.post_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Post is blocked"})
+    if post.post_pending:
+        return JSONResponse(status_code=409, content={"Pending": "Post is awaiting moderation"})
 
     data["user_id"] = current_user.user_id
 
-    need_to_block = get_data_from_gemini(comment_content=data['comment_content'])
+    if MODERATION_MODE == "pending":
+        new_comment = await Comment.create_comment_async(db, **data, comment_pending=True, commit=False)
+        await Job.enqueue_async(db, "moderate_comment", new_comment.comment_id, commit=False)
+        await db.commit()
+
+        return JSONResponse(status_code=202, content={"comment_id": new_comment.comment_id,
+                                                      "Pending": "Comment is awaiting moderation"})
+
+    need_to_block = await get_data_from_gemini_async(comment_content=data['comment_content'])
 
     if need_to_block is None:
         return JSONResponse(status_code=500, content={"Error": "Please, try again later"})
@@ -66,24 +136,104 @@ async def create_comment(form_data: CommentCreateRequest, db=Depends(get_db),
     if need_to_block:
         data["comment_blocked_at"] = datetime.datetime.utcnow()
 
-    new_comment = Comment.create_comment(db, **data)
+    new_comment = await Comment.create_comment_async(db, **data, commit=False)
+
+    if not need_to_block:
+        await schedule_auto_reply(db, post, new_comment)
+
+    await db.commit()
 
     if need_to_block:
         return JSONResponse(status_code=403,
                             content={"Error": "Comment contains prohibited content. Comment was blocked"})
 
-    if post.post_auto_answer:
-        delay = datetime.timedelta(hours=post.post_delay.hour, minutes=post.post_delay.minute,
-                                   seconds=post.post_delay.second)
-        run_time = datetime.datetime.now() + delay
-        scheduler.add_job(create_auto_reply, 'date', (db, post.user_id, post, new_comment), run_date=run_time)
+    invalidate_comment_pages(new_comment.post_id)
+
+    return comment_serializer.response(new_comment)
+
+
+@router.post("/comments/batch", response_model=CommentBatchResponse)
+async def create_comments_batch(form_data: CommentBatchRequest, db=Depends(get_async_db),
+                                current_user=Depends(get_current_user)):
+    '''
+    Create up to WRITE_BATCH_MAX_ITEMS comments in one call.
+    Posts are loaded with one query, content of all items is moderated concurrently (so Gemini sees it in batches),
+    accepted rows and their jobs are saved with two INSERTs and one commit.
+    Every item gets the result the single POST /comment/ would give it.
+    :param form_data: list of comments with content and associated post id
+    :param db: db session
+    :param current_user: user who sends the request
+    :return: CommentBatchResponse with one result per item, in the order of the request
+    '''
 
-    return CommentResponse(**new_comment.to_dict())
+    items = form_data.items
+    posts = await Post.get_posts_by_ids_async(db, {item.post_id for item in items})
+    results = [None] * len(items)
+    accepted = []
+
+    for index, item in enumerate(items):
+        post = posts.get(item.post_id)
+
+        if not post:
+            results[index] = {"status_code": 404, "error": "Post with this id not found"}
+        elif post.post_blocked:
+            results[index] = {"status_code": 406, "error": "Post is blocked"}
+        elif post.post_pending:
+            results[index] = {"status_code": 409, "error": "Post is awaiting moderation"}
+        else:
+            accepted.append(index)
+
+    if MODERATION_MODE == "pending":
+        verdicts = [None] * len(accepted)
+    else:
+        verdicts = await asyncio.gather(*(get_data_from_gemini_async(comment_content=items[index].comment_content)
+                                          for index in accepted))
+
+    now = datetime.datetime.utcnow()
+    rows, row_indexes = [], []
+
+    for index, need_to_block in zip(accepted, verdicts):
+        if MODERATION_MODE != "pending" and need_to_block is None:
+            results[index] = {"status_code": 500, "error": "Please, try again later"}
+            continue
+
+        rows.append({"post_id": items[index].post_id, "user_id": current_user.user_id,
+                     "comment_content": items[index].comment_content,
+                     "comment_blocked": bool(need_to_block), "comment_blocked_at": now if need_to_block else None,
+                     "comment_pending": MODERATION_MODE == "pending"})
+        row_indexes.append(index)
+
+    new_comments = await Comment.create_comments_async(db, rows, commit=False)
+    jobs = []
+
+    for index, comment in zip(row_indexes, new_comments):
+        if comment.comment_pending:
+            results[index] = {"status_code": 202, "comment_id": comment.comment_id,
+                              "error": "Comment is awaiting moderation"}
+            jobs.append(("moderate_comment", comment.comment_id, None))
+        elif comment.comment_blocked:
+            results[index] = {"status_code": 403, "comment_id": comment.comment_id,
+                              "error": "Comment contains prohibited content. Comment was blocked"}
+        else:
+            results[index] = {"status_code": 200, "comment_id": comment.comment_id,
+                              "comment": comment_serializer.to_dict(comment)}
+            post = posts[comment.post_id]
+            if post.post_auto_answer:
+                jobs.append(("auto_reply", comment.comment_id, auto_reply_run_at(post)))
+
+    await Job.enqueue_many_async(db, jobs, commit=False)
+    await db.commit()
+
+    for comment in new_comments:
+        if comment.visible:
+            invalidate_comment_pages(comment.post_id)
+
+    return Response(content=orjson.dumps({"items": results}), media_type="application/json")
 
 
 @router.put("/comment/{comment_id}", response_model=CommentResponse)
 async def update_comment(comment_id: int, form_data: CommentUpdateRequest,
-                         db=Depends(get_db)):
+                         db=Depends(get_async_db)):
     '''
     Update comment by comment id.
     :param comment_id: comment id in database
@@ -92,34 +242,37 @@ async def update_comment(comment_id: int, form_data: CommentUpdateRequest,
     :return: CommentResponse with updated comment data or JSONResponse with error if comment not exists or is blocked
     '''
 
-    comment = Comment.get_comment_by_id(db, comment_id)
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
 
     if not comment:
         return JSONResponse(status_code=404, content={"Not Found": "Comment with this id not found"})
     if comment.comment_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment is blocked"})
+    if comment.comment_pending:
+        return JSONResponse(status_code=409, content={"Pending": "Comment is awaiting moderation"})
 
     data = form_data.dict()
     comment_content = data.get('comment_content', None)
 
-    need_to_block = get_data_from_gemini(comment_content=comment_content)
+    need_to_block = await get_data_from_gemini_async(comment_content=comment_content)
 
     data["comment_blocked"] = need_to_block
 
     if need_to_block:
         data["comment_blocked_at"] = datetime.datetime.utcnow()
 
-    comment.update(db, **data)
+    await comment.update_async(db, **data)
+    invalidate_comment_pages(comment.post_id)
 
     if need_to_block:
         return JSONResponse(status_code=403,
                             content={"Error": "Comment contains prohibited content. Comment was blocked"})
 
-    return CommentResponse(**comment.to_dict())
+    return comment_serializer.response(comment)
 
 
 @router.delete("/comment/{comment_id}")
-async def delete_comment(comment_id: int, db=Depends(get_db)):
+async def delete_comment(comment_id: int, db=Depends(get_async_db)):
     '''
     Delete comment by comment id.
     :param comment_id: comment id in database
@@ -127,44 +280,133 @@ async def delete_comment(comment_id: int, db=Depends(get_db)):
     :return: Response with status code 200 or JSONResponse with error if comment not exists or is blocked
     '''
 
-    comment = Comment.get_comment_by_id(db, comment_id)
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
 
     if not comment:
         return JSONResponse(status_code=404, content={"Not Found": "Comment with this id not found"})
     if comment.comment_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment is blocked"})
 
-    db.delete(comment)
-    db.commit()
+    await comment.delete_async(db)
+    invalidate_comment_pages(comment.post_id)
 
     return Response(status_code=200)
 
 
-@router.get("/comments/{user_id}", response_model=List[CommentResponse])
-async def get_user_comments(user_id: int, db=Depends(get_db)):
+@job_handler("moderate_comment")
+async def moderate_comment(db, comment_id):
+    '''
+    Background moderation of a comment created in pending moderation mode.
+    Approved comments get their auto-reply scheduled in the same transaction as the approval.
+    :param db: db session
+    :param comment_id: comment id in database
+    :return: True if the comment was moderated or no longer needs it, False if Gemini did not answer
+    '''
+
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
+
+    if not comment or not comment.comment_pending:
+        return True
+
+    need_to_block = await get_data_from_gemini_async(comment_content=comment.comment_content)
+
+    if need_to_block is None:
+        return False
+
+    post = await Post.get_post_by_id_async(db, comment.post_id)
+
+    await comment.update_async(db, comment_pending=False, comment_blocked=need_to_block,
+                               comment_blocked_at=datetime.datetime.utcnow() if need_to_block else None, commit=False)
+    if post and not need_to_block:
+        await schedule_auto_reply(db, post, comment)
+    await db.commit()
+
+    invalidate_comment_pages(comment.post_id)
+
+    return True
+
+
+@router.get("/comments/{user_id}", response_model=CommentPage)
+async def get_user_comments(request: Request, user_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: str | None = None, db=Depends(get_async_db)):
     '''
-    Get all comments by user id.
+    Get a page of comments by user id, newest first.
+    :param request: request with the If-None-Match header
     :param user_id: user id in database
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
     :param db: db session
-    :return: List of CommentResponse with user's comments
+    :return: CommentPage with user's comments and cursor for the next page or JSONResponse with error if cursor is invalid
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    user_comments = Comment.get_user_comments(db, user_id)
-    result = [CommentResponse(**comment.to_dict()) for comment in user_comments]
+    try:
+        user_comments, next_cursor = await Comment.get_user_comments_async(db, user_id, limit, cursor,
+                                                                           columns=comment_page_columns)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    headers = validator_headers(page_etag("comment", user_comments, "comment_id", "comment_updated_at", next_cursor))
 
-    return result
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
 
+    return comment_serializer.page_response(user_comments, next_cursor, headers=headers)
 
-@router.get("/comments/{post_id}", response_model=List[CommentResponse])
-async def get_comments_for_posts(post_id: int, db=Depends(get_db)):
+
+@router.get("/posts/{post_id}/comments", response_model=CommentPage)
+async def get_comments_for_posts(request: Request, post_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                 cursor: str | None = None, db=Depends(get_async_db)):
     '''
-    Get all comments for a specific post by post id.
+    Get a page of comments for a specific post by post id, newest first.
+    :param request: request with the If-None-Match header
     :param post_id: post id in database
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
     :param db: db session
-    :return: List of CommentResponse with comments for the post
+    :return: CommentPage with comments for the post and cursor for the next page or JSONResponse with error if cursor is invalid
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    comments = Comment.get_post_comments(db, post_id)
-    result = [CommentResponse(**comment.to_dict()) for comment in comments]
+    try:
+        comments, next_cursor = await read_cache.get_or_load(
+            "post_comments", post_id,
+            lambda: Comment.get_post_comments_async(db, post_id, limit, cursor, columns=comment_page_columns),
+            variant=(limit, cursor),
+        )
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    headers = validator_headers(page_etag("comment", comments, "comment_id", "comment_updated_at", next_cursor))
+
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+
+    return comment_serializer.page_response(comments, next_cursor, headers=headers)
+
+
+@router.get("/comments-daily-breakdown", response_model=CommentDailyBreakdown)
+async def get_comments_daily_breakdown(date_from: datetime.date, date_to: datetime.date, post_id: int | None = None,
+                                       user_id: int | None = None, db=Depends(get_async_db)):
+    '''
+    Number of created and blocked comments per day (UTC), read from the Comment_Daily rollup.
+    :param date_from: first day
+    :param date_to: last day (included)
+    :param post_id: count only comments of this post (optional)
+    :param user_id: count only comments of this author (optional)
+    :param db: db session
+    :return: CommentDailyBreakdown with one item for every day of the range
+    or JSONResponse with error if the range or the filters are invalid
+    '''
+
+    if date_to < date_from or (date_to - date_from).days >= MAX_BREAKDOWN_DAYS:
+        return JSONResponse(status_code=400,
+                            content={"Bad Request": f"The range must be 1-{MAX_BREAKDOWN_DAYS} days long"})
+    if post_id is not None and user_id is not None:
+        return JSONResponse(status_code=400, content={"Bad Request": "Filter by post_id or by user_id, not both"})
+
+    breakdown = await CommentDaily.get_breakdown_async(db, date_from, date_to, post_id, user_id)
 
-    return result
+    return Response(content=orjson.dumps({"items": [{"day": day, "created": created, "blocked": blocked}
+                                                    for day, created, blocked in breakdown]}),
+                    media_type="application/json")
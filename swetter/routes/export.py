@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from swetter.database.export_db import export_rows, EXPORT_ENTITIES, EXPORT_FORMATS
+from swetter.utils.deps import get_admin_user, get_session_factory
+
+router = APIRouter(dependencies=[Depends(get_admin_user)])
+
+
+@router.get("/export/{entity}")
+def export_entity(entity: str, export_format: str = Query("ndjson", alias="format"),
+                  created_from: datetime | None = None, created_to: datetime | None = None,
+                  blocked: bool | None = None, session_factory=Depends(get_session_factory)):
+    '''
+    Stream all rows of an entity as NDJSON or CSV. Admins only.
+    :param entity: posts, comments or replies
+    :param export_format: ndjson (default) or csv
+    :param created_from: export rows created at or after this time (optional)
+    :param created_to: export rows created before this time (optional)
+    :param blocked: export only blocked (true) or only not blocked (false) rows (optional)
+    :param session_factory: factory of the db session used while streaming
+    :return: StreamingResponse with the export or JSONResponse with error if entity or format is unknown
+    '''
+
+    if entity not in EXPORT_ENTITIES:
+        return JSONResponse(status_code=404, content={"Not Found": "Unknown export entity"})
+    if export_format not in EXPORT_FORMATS:
+        return JSONResponse(status_code=400, content={"Bad Request": "Unknown export format"})
+
+    chunks = export_rows(entity, export_format, created_from, created_to, blocked, session_factory=session_factory)
+    filename = f"{entity}.{export_format}"
+
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import Response
+
+from swetter.models import Job
+from swetter.utils.deps import get_async_db, check_metrics_token
+from swetter.utils.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(check_metrics_token)])
+async def get_metrics(db=Depends(get_async_db)):
+    '''
+    Metrics of this process in the Prometheus text format.
+    :param db: db session
+    :return: Response with the metrics
+    '''
+
+    queue_stats = await Job.queue_stats_async(db)
+
+    return Response(render_metrics(queue_stats), media_type=CONTENT_TYPE)
@@ -1,53 +1,96 @@
 import datetime
-from typing import List
 
-from fastapi import APIRouter, Response, Depends
+from fastapi import APIRouter, Request, Response, Depends, Query
 from fastapi.responses import JSONResponse
 
-from swetter.models import Post
-from swetter.schem import PostCreateRequest, PostUpdateRequest, PostResponse
+from swetter import MODERATION_MODE
+from swetter.models import Post, Job
+from swetter.schem import PostCreateRequest, PostUpdateRequest, PostResponse, PostPage
+from swetter.utils.conditional import (row_etag, page_etag, is_not_modified, validator_headers,
+                                       not_modified_response)
 from swetter.utils.deps import get_current_user
-from swetter.utils.deps import get_db
-from swetter.utils.gemini import get_data_from_gemini
+from swetter.utils.deps import get_async_db
+from swetter.utils.gemini import get_data_from_gemini_async
+from swetter.utils.jobs import job_handler
+from swetter.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from swetter.utils.read_cache import read_cache
+from swetter.utils.serialization import RowSerializer
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
+post_serializer = RowSerializer(PostResponse, Post)
+post_page_columns = post_serializer.columns + (Post.post_updated_at,)
+
+
+async def load_post(db, post_id):
+    '''
+    Load a post for the read cache, detached from the session so that it can be shared between requests.
+    :param db: db session
+    :param post_id: post id in database
+    :return: Post object or None if post not exists
+    '''
+
+    post = await Post.get_post_by_id_async(db, post_id)
+
+    if post is not None:
+        db.expunge(post)
+
+    return post
 
 
 @router.get("/post/{post_id}", response_model=PostResponse)
-async def get_post(post_id: int, db=Depends(get_db)):
+async def get_post(post_id: int, request: Request, db=Depends(get_async_db)):
     '''
     Get post by post id.
     :param post_id: post id in database
+    :param request: request with the If-None-Match / If-Modified-Since headers
     :param db: db session
     :return: PostResponse with post data or JSONResponse with error if post not exists
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    post = Post.get_post_by_id(db, post_id)
+    post = await read_cache.get_or_load("post", post_id, lambda: load_post(db, post_id))
 
     if not post:
         return JSONResponse(status_code=404, content={"Not Found": "Post with this id not found"})
     if post.post_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Post is blocked"})
+    if post.post_pending:
+        return JSONResponse(status_code=202, content={"Pending": "Post is awaiting moderation"})
+
+    etag = row_etag("post", post.post_id, post.post_updated_at)
+    headers = validator_headers(etag, post.post_updated_at)
 
-    return PostResponse(**post.to_dict())
+    if is_not_modified(request, etag, post.post_updated_at):
+        return not_modified_response(headers)
+
+    return post_serializer.response(post, headers=headers)
 
 
 @router.post("/post/", response_model=PostResponse)
-async def create_post(form_data: PostCreateRequest, db=Depends(get_db),
+async def create_post(form_data: PostCreateRequest, db=Depends(get_async_db),
                       current_user=Depends(get_current_user)):
     '''
     Create post from user data. Before creating, check if post contains prohibited content.
+    In pending moderation mode the post is saved hidden and checked by a background worker.
     :param form_data: post title, post content and options for auto answer
     :param db: db session
     :param current_user: user who sends the request
-    :return: PostResponse with post data or JSONResponse with error if post contains prohibited content
-    or problems with Gemini
+    :return: PostResponse with post data, JSONResponse with status code 202 and post id in pending moderation mode
+    or JSONResponse with error if post contains prohibited content or problems with Gemini
     '''
 
     data = form_data.dict()
     data["user_id"] = current_user.user_id
 
-    need_to_block = get_data_from_gemini(post_title=data['post_title'], post_content=data['post_content'])
+    if MODERATION_MODE == "pending":
+        new_post = await Post.create_post_async(db, **data, post_pending=True, commit=False)
+        await Job.enqueue_async(db, "moderate_post", new_post.post_id, commit=False)
+        await db.commit()
+
+        return JSONResponse(status_code=202, content={"post_id": new_post.post_id,
+                                                      "Pending": "Post is awaiting moderation"})
+
+    need_to_block = await get_data_from_gemini_async(post_title=data['post_title'], post_content=data['post_content'])
 
     if need_to_block is None:
         return JSONResponse(status_code=500, content={"Error": "Please, try again later"})
@@ -57,16 +100,16 @@ async def create_post(form_data: PostCreateRequest, db=Depends(get_db),
     if need_to_block:
         data["post_blocked_at"] = datetime.datetime.utcnow()
 
-    new_post = Post.create_post(db, **data)
+    new_post = await Post.create_post_async(db, **data)
 
     if need_to_block:
         return JSONResponse(status_code=403, content={"Error": "Post contains prohibited content. Post was blocked"})
 
-    return PostResponse(**new_post.to_dict())
+    return post_serializer.response(new_post)
 
 
 @router.put("/post/{post_id}", response_model=PostResponse)
-async def update_post(post_id: int, form_data: PostUpdateRequest, db=Depends(get_db)):
+async def update_post(post_id: int, form_data: PostUpdateRequest, db=Depends(get_async_db)):
     '''
     Update post by post id.
     :param post_id: post id in database
@@ -75,34 +118,37 @@ async def update_post(post_id: int, form_data: PostUpdateRequest, db=Depends(get
     :return: PostResponse with updated post data or JSONResponse with error if post not exists or is blocked
     '''
 
-    post = Post.get_post_by_id(db, post_id)
+    post = await Post.get_post_by_id_async(db, post_id)
 
     if not post:
         return JSONResponse(status_code=404, content={"Not Found": "Post with this id not found"})
     if post.post_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Post is blocked"})
+    if post.post_pending:
+        return JSONResponse(status_code=409, content={"Pending": "Post is awaiting moderation"})
 
     data = form_data.dict()
     post_title = data.get('post_title', None)
     post_content = data.get('post_content', None)
 
-    need_to_block = get_data_from_gemini(post_title=post_title, post_content=post_content)
+    need_to_block = await get_data_from_gemini_async(post_title=post_title, post_content=post_content)
 
     data["post_blocked"] = need_to_block
 
     if need_to_block:
         data["post_blocked_at"] = datetime.datetime.utcnow()
 
-    post.update(db, **data)
+    await post.update_async(db, **data)
+    read_cache.invalidate("post", post_id)
 
     if need_to_block:
         return JSONResponse(status_code=403, content={"Error": "Post contains prohibited content. Post was blocked"})
 
-    return PostResponse(**post.to_dict())
+    return post_serializer.response(post)
 
 
 @router.delete("/post/{post_id}")
-async def delete_post(post_id: int, db=Depends(get_db)):
+async def delete_post(post_id: int, db=Depends(get_async_db)):
     '''
     Delete post by post id.
     :param post_id: post id in database
@@ -110,43 +156,96 @@ async def delete_post(post_id: int, db=Depends(get_db)):
     :return: Response with status code 200 or JSONResponse with error if post not exists or is blocked
     '''
 
-    post = Post.get_post_by_id(db, post_id)
+    post = await Post.get_post_by_id_async(db, post_id)
 
     if not post:
         return JSONResponse(status_code=404, content={"Not Found": "Post with this id not found"})
     if post.post_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Post is blocked"})
 
-    db.delete(post)
-    db.commit()
+    await db.delete(post)
+    await db.commit()
+    read_cache.invalidate("post", post_id)
 
     return Response(status_code=200)
 
 
-@router.get("/posts/{user_id}", response_model=List[PostResponse])
-async def get_user_posts(user_id: int, db=Depends(get_db)):
+@job_handler("moderate_post")
+async def moderate_post(db, post_id):
+    '''
+    Background moderation of a post created in pending moderation mode.
+    :param db: db session
+    :param post_id: post id in database
+    :return: True if the post was moderated or no longer needs it, False if Gemini did not answer
+    '''
+
+    post = await Post.get_post_by_id_async(db, post_id)
+
+    if not post or not post.post_pending:
+        return True
+
+    need_to_block = await get_data_from_gemini_async(post_title=post.post_title, post_content=post.post_content)
+
+    if need_to_block is None:
+        return False
+
+    await post.update_async(db, post_pending=False, post_blocked=need_to_block,
+                            post_blocked_at=datetime.datetime.utcnow() if need_to_block else None)
+    read_cache.invalidate("post", post_id)
+
+    return True
+
+
+@router.get("/posts/{user_id}", response_model=PostPage)
+async def get_user_posts(request: Request, user_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: str | None = None, db=Depends(get_async_db)):
     '''
-    Get all posts by user id.
+    Get a page of posts by user id, newest first.
+    :param request: request with the If-None-Match header
     :param user_id: user id in database
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
     :param db: db session
-    :return: List of PostResponse with user's posts
+    :return: PostPage with user's posts and cursor for the next page or JSONResponse with error if cursor is invalid
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    user_posts = Post.get_user_posts(db, user_id)
-    result = [PostResponse(**post.to_dict()) for post in user_posts]
+    try:
+        user_posts, next_cursor = await Post.get_user_posts_async(db, user_id, limit, cursor,
+                                                                  columns=post_page_columns)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    headers = validator_headers(page_etag("post", user_posts, "post_id", "post_updated_at", next_cursor))
 
-    return result
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
 
+    return post_serializer.page_response(user_posts, next_cursor, headers=headers)
 
-@router.get("/posts/", response_model=List[PostResponse])
-async def get_all_posts(db=Depends(get_db)):
+
+@router.get("/posts/", response_model=PostPage)
+async def get_all_posts(request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: str | None = None, db=Depends(get_async_db)):
     '''
-    Get all posts.
+    Get a page of all posts, newest first.
+    :param request: request with the If-None-Match header
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
     :param db: db session
-    :return: List of PostResponse with all posts
+    :return: PostPage with posts and cursor for the next page or JSONResponse with error if cursor is invalid
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    posts = Post.get_all_posts(db)
-    result = [PostResponse(**post.to_dict()) for post in posts]
+    try:
+        posts, next_cursor = await Post.get_all_posts_async(db, limit, cursor,
+                                                            columns=post_page_columns)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    headers = validator_headers(page_etag("post", posts, "post_id", "post_updated_at", next_cursor))
+
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
 
-    return result
+    return post_serializer.page_response(posts, next_cursor, headers=headers)
@@ -1,70 +1,129 @@
+import asyncio
 import datetime
-from time import sleep
-from typing import List
 
-from fastapi import APIRouter, Response, Depends
+import orjson
+
+from fastapi import APIRouter, Request, Response, Depends, Query
 from fastapi.responses import JSONResponse
 
-from swetter.models import CommentReply
-from swetter.schem import ReplyCreateRequest, ReplyUpdateRequest, ReplyResponse
+from swetter import MODERATION_MODE
+from swetter.models import CommentReply, Comment, Post, Job
+from swetter.schem import (ReplyCreateRequest, ReplyUpdateRequest, ReplyResponse, ReplyPage, ReplyBatchRequest,
+                           ReplyBatchResponse)
+from swetter.routes.comments import invalidate_comment_pages
+from swetter.utils.conditional import (row_etag, page_etag, is_not_modified, validator_headers,
+                                       not_modified_response)
 from swetter.utils.deps import get_current_user
-from swetter.utils.deps import get_db
-from swetter.utils.gemini import get_data_from_gemini, create_reply_by_gemini
+from swetter.utils.deps import get_async_db
+from swetter.utils.gemini import get_data_from_gemini_async, create_reply_by_gemini_async
+from swetter.utils.jobs import job_handler
+from swetter.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from swetter.utils.serialization import RowSerializer
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
+reply_serializer = RowSerializer(ReplyResponse, CommentReply)
+reply_page_columns = reply_serializer.columns + (CommentReply.reply_updated_at,)
 
 
-def create_auto_reply(db, post_owner_id, post, comment):
+async def invalidate_reply_count(db, comment_id):
     '''
-    Create an auto-reply for a comment.
+    Drop the cached comment pages that show the reply_count of a comment.
     :param db: db session
-    :param post_owner_id: ID of the post owner
-    :param post: Post object
-    :param comment: Comment object
+    :param comment_id: comment id in database
     '''
 
-    auto_reply_content = None
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
+
+    if comment:
+        invalidate_comment_pages(comment.post_id)
+
+
+@job_handler("auto_reply")
+async def create_auto_reply(db, comment_id):
+    '''
+    Create an auto-reply for a comment on behalf of the post owner.
+    Runs in a job worker with its own db session.
+    :param db: db session
+    :param comment_id: ID of the comment to reply to
+    :return: True if the reply was created or is no longer needed, False if Gemini did not answer
+    '''
+
+    comment = await Comment.get_comment_by_id_async(db, comment_id)
+
+    if not comment:
+        return True
+
+    post = await Post.get_post_by_id_async(db, comment.post_id)
 
-    while auto_reply_content is None:
-        auto_reply_content = create_reply_by_gemini(post.post_title, post.post_content, comment.comment_content)
-        sleep(3)
+    if not post:
+        return True
 
-    CommentReply.create_reply(db, comment.comment_id, post_owner_id, auto_reply_content)
+    auto_reply_content = await create_reply_by_gemini_async(post.post_title, post.post_content,
+                                                            comment.comment_content)
+
+    if auto_reply_content is None:
+        return False
+
+    await CommentReply.create_reply_async(db, comment_id=comment.comment_id, user_id=post.user_id,
+                                          reply_content=auto_reply_content)
+    invalidate_comment_pages(comment.post_id)
+
+    return True
 
 
 @router.get("/reply/{reply_id}", response_model=ReplyResponse)
-async def get_reply(reply_id: int, db=Depends(get_db)):
+async def get_reply(reply_id: int, request: Request, db=Depends(get_async_db)):
     '''
     Get reply by reply id.
     :param reply_id: reply id in database
+    :param request: request with the If-None-Match / If-Modified-Since headers
     :param db: db session
     :return: ReplyResponse with reply data or JSONResponse with error if reply not exists
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    reply = CommentReply.get_reply_by_id(db, reply_id)
+    reply = await CommentReply.get_reply_by_id_async(db, reply_id)
 
     if not reply:
         return JSONResponse(status_code=404, content={"Not Found": "Comment reply with this id not found"})
     if reply.reply_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment reply is blocked"})
+    if reply.reply_pending:
+        return JSONResponse(status_code=202, content={"Pending": "Comment reply is awaiting moderation"})
+
+    etag = row_etag("reply", reply.reply_id, reply.reply_updated_at)
+    headers = validator_headers(etag, reply.reply_updated_at)
+
+    if is_not_modified(request, etag, reply.reply_updated_at):
+        return not_modified_response(headers)
 
-    return ReplyResponse(**reply.to_dict())
+    return reply_serializer.response(reply, headers=headers)
 
 
 @router.post("/reply/", response_model=ReplyResponse)
-async def create_reply(form_data: ReplyCreateRequest, db=Depends(get_db), current_user=Depends(get_current_user)):
+async def create_reply(form_data: ReplyCreateRequest, db=Depends(get_async_db), current_user=Depends(get_current_user)):
     '''
     Create reply from user data. Before creating, check if reply contains prohibited content.
+    In pending moderation mode the reply is saved hidden and checked by a background worker.
     :param form_data: reply content and associated comment id
     :param db: db session
     :param current_user: user who sends the request
-    :return: ReplyResponse with reply data or JSONResponse with error if reply contains prohibited content or problems with Gemini
+    :return: ReplyResponse with reply data, JSONResponse with status code 202 and reply id in pending moderation mode
+    or JSONResponse with error if reply contains prohibited content or problems with Gemini
     '''
 
     data = form_data.dict()
     data["user_id"] = current_user.user_id
 
-    need_to_block = get_data_from_gemini(reply_content=data['reply_content'])
+    if MODERATION_MODE == "pending":
+        new_reply = await CommentReply.create_reply_async(db, **data, reply_pending=True, commit=False)
+        await Job.enqueue_async(db, "moderate_reply", new_reply.reply_id, commit=False)
+        await db.commit()
+
+        return JSONResponse(status_code=202, content={"reply_id": new_reply.reply_id,
+                                                      "Pending": "Comment reply is awaiting moderation"})
+
+    need_to_block = await get_data_from_gemini_async(reply_content=data['reply_content'])
 
     if need_to_block is None:
         return JSONResponse(status_code=500, content={"Error": "Please, try again later"})
@@ -74,17 +133,94 @@ async def create_reply(form_data: ReplyCreateRequest, db=Depends(get_db), curren
     if need_to_block:
         data["reply_blocked_at"] = datetime.datetime.utcnow()
 
-    new_reply = CommentReply.create_reply(db, **data)
+    new_reply = await CommentReply.create_reply_async(db, **data)
 
     if need_to_block:
         return JSONResponse(status_code=403,
                             content={"Error": "Comment reply contains prohibited content. Reply was blocked"})
 
-    return ReplyResponse(**new_reply.to_dict())
+    await invalidate_reply_count(db, new_reply.comment_id)
+
+    return reply_serializer.response(new_reply)
+
+
+@router.post("/replies/batch", response_model=ReplyBatchResponse)
+async def create_replies_batch(form_data: ReplyBatchRequest, db=Depends(get_async_db),
+                               current_user=Depends(get_current_user)):
+    '''
+    Create up to WRITE_BATCH_MAX_ITEMS replies in one call.
+    Comments are loaded with one query, content of all items is moderated concurrently,
+    accepted rows and their moderation jobs are saved with one commit.
+    :param form_data: list of replies with content and associated comment id
+    :param db: db session
+    :param current_user: user who sends the request
+    :return: ReplyBatchResponse with one result per item, in the order of the request
+    '''
+
+    items = form_data.items
+    comments = await Comment.get_comments_by_ids_async(db, {item.comment_id for item in items})
+    results = [None] * len(items)
+    accepted = []
+
+    for index, item in enumerate(items):
+        comment = comments.get(item.comment_id)
+
+        if not comment:
+            results[index] = {"status_code": 404, "error": "Comment with this id not found"}
+        elif comment.comment_blocked:
+            results[index] = {"status_code": 406, "error": "Comment is blocked"}
+        elif comment.comment_pending:
+            results[index] = {"status_code": 409, "error": "Comment is awaiting moderation"}
+        else:
+            accepted.append(index)
+
+    if MODERATION_MODE == "pending":
+        verdicts = [None] * len(accepted)
+    else:
+        verdicts = await asyncio.gather(*(get_data_from_gemini_async(reply_content=items[index].reply_content)
+                                          for index in accepted))
+
+    now = datetime.datetime.utcnow()
+    rows, row_indexes = [], []
+
+    for index, need_to_block in zip(accepted, verdicts):
+        if MODERATION_MODE != "pending" and need_to_block is None:
+            results[index] = {"status_code": 500, "error": "Please, try again later"}
+            continue
+
+        rows.append({"comment_id": items[index].comment_id, "user_id": current_user.user_id,
+                     "reply_content": items[index].reply_content,
+                     "reply_blocked": bool(need_to_block), "reply_blocked_at": now if need_to_block else None,
+                     "reply_pending": MODERATION_MODE == "pending"})
+        row_indexes.append(index)
+
+    new_replies = await CommentReply.create_replies_async(db, rows, commit=False)
+    jobs = []
+
+    for index, reply in zip(row_indexes, new_replies):
+        if reply.reply_pending:
+            results[index] = {"status_code": 202, "reply_id": reply.reply_id,
+                              "error": "Comment reply is awaiting moderation"}
+            jobs.append(("moderate_reply", reply.reply_id, None))
+        elif reply.reply_blocked:
+            results[index] = {"status_code": 403, "reply_id": reply.reply_id,
+                              "error": "Comment reply contains prohibited content. Reply was blocked"}
+        else:
+            results[index] = {"status_code": 200, "reply_id": reply.reply_id,
+                              "reply": reply_serializer.to_dict(reply)}
+
+    await Job.enqueue_many_async(db, jobs, commit=False)
+    await db.commit()
+
+    for reply in new_replies:
+        if reply.visible:
+            invalidate_comment_pages(comments[reply.comment_id].post_id)
+
+    return Response(content=orjson.dumps({"items": results}), media_type="application/json")
 
 
 @router.put("/reply/{reply_id}", response_model=ReplyResponse)
-async def update_reply(reply_id: int, form_data: ReplyUpdateRequest, db=Depends(get_db)):
+async def update_reply(reply_id: int, form_data: ReplyUpdateRequest, db=Depends(get_async_db)):
     '''
     Update reply by reply id.
     :param reply_id: reply id in database
@@ -93,34 +229,37 @@ async def update_reply(reply_id: int, form_data: ReplyUpdateRequest, db=Depends(
     :return: ReplyResponse with updated reply data or JSONResponse with error if reply not exists or is blocked
     '''
 
-    reply = CommentReply.get_reply_by_id(db, reply_id)
+    reply = await CommentReply.get_reply_by_id_async(db, reply_id)
 
     if not reply:
         return JSONResponse(status_code=404, content={"Not Found": "Comment reply with this id not found"})
     if reply.reply_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment reply is blocked"})
+    if reply.reply_pending:
+        return JSONResponse(status_code=409, content={"Pending": "Comment reply is awaiting moderation"})
 
     data = form_data.dict()
     reply_content = data.get('reply_content', None)
 
-    need_to_block = get_data_from_gemini(reply_content=reply_content)
+    need_to_block = await get_data_from_gemini_async(reply_content=reply_content)
 
     data["reply_blocked"] = need_to_block
 
     if need_to_block:
         data["reply_blocked_at"] = datetime.datetime.utcnow()
 
-    reply.update(db, **data)
+    await reply.update_async(db, **data)
 
     if need_to_block:
+        await invalidate_reply_count(db, reply.comment_id)
         return JSONResponse(status_code=403,
                             content={"Error": "Comment reply contains prohibited content. Reply was blocked"})
 
-    return ReplyResponse(**reply.to_dict())
+    return reply_serializer.response(reply)
 
 
 @router.delete("/reply/{reply_id}")
-async def delete_reply(reply_id: int, db=Depends(get_db)):
+async def delete_reply(reply_id: int, db=Depends(get_async_db)):
     '''
     Delete reply by reply id.
     :param reply_id: reply id in database
@@ -128,29 +267,70 @@ async def delete_reply(reply_id: int, db=Depends(get_db)):
     :return: Response with status code 200 or JSONResponse with error if reply not exists or is blocked
     '''
 
-    reply = CommentReply.get_reply_by_id(db, reply_id)
+    reply = await CommentReply.get_reply_by_id_async(db, reply_id)
 
     if not reply:
         return JSONResponse(status_code=404, content={"Not Found": "Comment reply with this id not found"})
     if reply.reply_blocked:
         return JSONResponse(status_code=406, content={"Blocked": "Comment reply is blocked"})
 
-    db.delete(reply)
-    db.commit()
+    await reply.delete_async(db)
+    await invalidate_reply_count(db, reply.comment_id)
 
     return Response(status_code=200)
 
 
-@router.get("/replies/{comment_id}", response_model=List[ReplyResponse])
-async def get_comment_replies(comment_id: int, db=Depends(get_db)):
+@job_handler("moderate_reply")
+async def moderate_reply(db, reply_id):
     '''
-    Get all replies for a specific comment by comment id.
+    Background moderation of a reply created in pending moderation mode.
+    :param db: db session
+    :param reply_id: reply id in database
+    :return: True if the reply was moderated or no longer needs it, False if Gemini did not answer
+    '''
+
+    reply = await CommentReply.get_reply_by_id_async(db, reply_id)
+
+    if not reply or not reply.reply_pending:
+        return True
+
+    need_to_block = await get_data_from_gemini_async(reply_content=reply.reply_content)
+
+    if need_to_block is None:
+        return False
+
+    await reply.update_async(db, reply_pending=False, reply_blocked=need_to_block,
+                             reply_blocked_at=datetime.datetime.utcnow() if need_to_block else None)
+
+    if not need_to_block:
+        await invalidate_reply_count(db, reply.comment_id)
+
+    return True
+
+
+@router.get("/replies/{comment_id}", response_model=ReplyPage)
+async def get_comment_replies(request: Request, comment_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                              cursor: str | None = None, db=Depends(get_async_db)):
+    '''
+    Get a page of replies for a specific comment by comment id, newest first.
+    :param request: request with the If-None-Match header
     :param comment_id: comment id in database
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
     :param db: db session
-    :return: List of ReplyResponse with replies for the comment
+    :return: ReplyPage with replies for the comment and cursor for the next page or JSONResponse with error if cursor is invalid
+    or Response with status code 304 without body if the client copy is up to date
     '''
 
-    replies = CommentReply.get_comment_replies(db, comment_id)
-    result = [ReplyResponse(**reply.to_dict()) for reply in replies]
+    try:
+        replies, next_cursor = await CommentReply.get_comment_replies_async(db, comment_id, limit, cursor,
+                                                                            columns=reply_page_columns)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    headers = validator_headers(page_etag("reply", replies, "reply_id", "reply_updated_at", next_cursor))
+
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
 
-    return result
+    return reply_serializer.page_response(replies, next_cursor, headers=headers)
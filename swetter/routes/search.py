@@ -0,0 +1,38 @@
+import orjson
+from fastapi import APIRouter, Response, Depends, Query
+from fastapi.responses import JSONResponse
+
+from swetter.database.search_db import search, SEARCH_ENTITIES
+from swetter.schem import SearchPage
+from swetter.utils.deps import get_current_user
+from swetter.utils.deps import get_async_db
+from swetter.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/search", response_model=SearchPage)
+async def search_entity(q: str = Query(min_length=1, max_length=200), entity: str = "posts",
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None,
+                        db=Depends(get_async_db)):
+    '''
+    Full-text search over visible posts, comments or replies, best matches first.
+    :param q: search text, all words must match, the last one also as a prefix
+    :param entity: posts (default), comments or replies
+    :param limit: page size
+    :param cursor: next_cursor from the previous page (optional)
+    :param db: db session
+    :return: SearchPage with hits (id, user id, parent post or comment id, post title, snippet with matches
+    in <b></b>, rank) and cursor for the next page or JSONResponse with error if entity or cursor is invalid
+    '''
+
+    if entity not in SEARCH_ENTITIES:
+        return JSONResponse(status_code=404, content={"Not Found": "Unknown search entity"})
+
+    try:
+        hits, next_cursor = await db.run_sync(search, entity, q, limit, cursor)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    return Response(content=orjson.dumps({"items": hits, "next_cursor": next_cursor}),
+                    media_type="application/json")
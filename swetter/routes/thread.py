@@ -0,0 +1,55 @@
+import orjson
+from fastapi import APIRouter, Response, Depends, Query
+from fastapi.responses import JSONResponse
+
+from swetter.models import Post, Comment
+from swetter.routes.comments import comment_serializer
+from swetter.routes.posts import post_serializer
+from swetter.routes.reply_comment import reply_serializer
+from swetter.schem import ThreadResponse
+from swetter.utils.deps import get_current_user
+from swetter.utils.deps import get_async_db
+from swetter.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/thread/{post_id}", response_model=ThreadResponse)
+async def get_thread(post_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     cursor: str | None = None, db=Depends(get_async_db)):
+    '''
+    Get a post with a page of its comments (newest first) and all visible replies to them.
+    Costs three queries: the post, the comments page and the replies of the page.
+    :param post_id: post id in database
+    :param limit: comments page size
+    :param cursor: next_cursor from the previous page (optional)
+    :param db: db session
+    :return: ThreadResponse with post, comments with replies and cursor for the next comments page
+    or JSONResponse with error if post not exists, is blocked or pending or cursor is invalid
+    '''
+
+    post = await Post.get_post_by_id_async(db, post_id)
+
+    if not post:
+        return JSONResponse(status_code=404, content={"Not Found": "Post with this id not found"})
+    if post.post_blocked:
+        return JSONResponse(status_code=406, content={"Blocked": "Post is blocked"})
+    if post.post_pending:
+        return JSONResponse(status_code=202, content={"Pending": "Post is awaiting moderation"})
+
+    try:
+        comments, next_cursor = await Comment.get_post_comments_with_replies_async(db, post_id, limit, cursor)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"Bad Request": "Invalid cursor"})
+
+    thread = {
+        "post": post_serializer.to_dict(post),
+        "comments": [
+            {**comment_serializer.to_dict(comment),
+             "replies": [reply_serializer.to_dict(reply) for reply in comment.replies]}
+            for comment in comments
+        ],
+        "next_cursor": next_cursor,
+    }
+
+    return Response(content=orjson.dumps(thread), media_type="application/json")
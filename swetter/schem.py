@@ -1,6 +1,9 @@
-from datetime import time, datetime
+from datetime import time, datetime, date
+from typing import List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
+
+from swetter import WRITE_BATCH_MAX_ITEMS
 
 
 class Token(BaseModel):
@@ -32,6 +35,8 @@ class PostUpdateRequest(BaseModel):
 
 
 class PostResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     post_id: int
     user_id: int
     post_title: str
@@ -39,6 +44,12 @@ class PostResponse(BaseModel):
     post_auto_answer: bool
     post_delay: time | None
     post_created_at: datetime
+    comment_count: int
+
+
+class PostPage(BaseModel):
+    items: List[PostResponse]
+    next_cursor: str | None = None
 
 
 class CommentCreateRequest(BaseModel):
@@ -51,11 +62,44 @@ class CommentUpdateRequest(BaseModel):
 
 
 class CommentResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     comment_id: int
     post_id: int
     user_id: int
     comment_content: str
     comment_created_at: datetime
+    reply_count: int
+
+
+class CommentPage(BaseModel):
+    items: List[CommentResponse]
+    next_cursor: str | None = None
+
+
+class CommentBatchRequest(BaseModel):
+    items: List[CommentCreateRequest] = Field(min_length=1, max_length=WRITE_BATCH_MAX_ITEMS)
+
+
+class CommentBatchResult(BaseModel):
+    status_code: int
+    comment_id: int | None = None
+    comment: CommentResponse | None = None
+    error: str | None = None
+
+
+class CommentBatchResponse(BaseModel):
+    items: List[CommentBatchResult]
+
+
+class CommentDailyCount(BaseModel):
+    day: date
+    created: int
+    blocked: int
+
+
+class CommentDailyBreakdown(BaseModel):
+    items: List[CommentDailyCount]
 
 
 class ReplyCreateRequest(BaseModel):
@@ -68,8 +112,55 @@ class ReplyUpdateRequest(BaseModel):
 
 
 class ReplyResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     reply_id: int
     comment_id: int
     user_id: int
     reply_content: str
     reply_created_at: datetime
+
+
+class ReplyPage(BaseModel):
+    items: List[ReplyResponse]
+    next_cursor: str | None = None
+
+
+class ReplyBatchRequest(BaseModel):
+    items: List[ReplyCreateRequest] = Field(min_length=1, max_length=WRITE_BATCH_MAX_ITEMS)
+
+
+class ReplyBatchResult(BaseModel):
+    status_code: int
+    reply_id: int | None = None
+    reply: ReplyResponse | None = None
+    error: str | None = None
+
+
+class ReplyBatchResponse(BaseModel):
+    items: List[ReplyBatchResult]
+
+
+class ThreadComment(CommentResponse):
+    replies: List[ReplyResponse]
+
+
+class ThreadResponse(BaseModel):
+    post: PostResponse
+    comments: List[ThreadComment]
+    next_cursor: str | None = None
+
+
+class SearchHit(BaseModel):
+    id: int
+    user_id: int
+    parent_id: int | None = None
+    title: str | None = None
+    snippet: str
+    rank: float
+    created_at: datetime
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: str | None = None
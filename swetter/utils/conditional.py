@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Response
+
+
+def row_etag(entity: str, row_id: int, updated_at: datetime) -> str:
+    '''
+    :param entity: name of the model
+    :param row_id: primary key of the row
+    :param updated_at: last update time of the row
+    :return: strong ETag of one row
+    '''
+
+    return f'"{entity}-{row_id}-{updated_at.isoformat()}"'
+
+
+def page_etag(entity: str, rows, id_field: str, updated_field: str, next_cursor: str | None) -> str:
+    '''
+    ETag of a listing page from the ids and update times of its rows, so any insert, update, delete
+    or visibility change that touches the page changes it.
+    :param entity: name of the model
+    :param rows: rows of the page with id_field and updated_field
+    :param id_field: name of the primary key field
+    :param updated_field: name of the update time field
+    :param next_cursor: cursor of the next page or None
+    :return: strong ETag of the page
+    '''
+
+    digest = hashlib.sha1(entity.encode())
+    for row in rows:
+        digest.update(f"{getattr(row, id_field)}@{getattr(row, updated_field).isoformat()};".encode())
+    digest.update(str(next_cursor).encode())
+
+    return f'"{digest.hexdigest()}"'
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def is_not_modified(request, etag: str, last_modified: datetime | None = None) -> bool:
+    '''
+    Evaluate If-None-Match and, when it is absent, If-Modified-Since.
+    :param request: incoming request
+    :param etag: current ETag of the resource
+    :param last_modified: current last modification time of the resource (UTC, optional)
+    :return: True if the client copy is still valid and 304 can be returned
+    '''
+
+    if_none_match = request.headers.get("if-none-match")
+
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: datetime | None = None) -> dict:
+    headers = {"ETag": etag}
+
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -1,37 +1,54 @@
+import hmac
+from datetime import datetime, timezone
 from typing import Annotated
 
 import jwt
-from fastapi import HTTPException , Depends
+from fastapi import HTTPException , Depends, Header
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 
-from swetter.database.db import SessionLocal
-from swetter import SECRET_KEY, ALGORITHM
+from swetter.database.db import SessionLocal, AsyncSessionLocal
+from swetter import SECRET_KEY, ALGORITHM, ADMIN_USERNAMES, METRICS_TOKEN
 from swetter.schem import TokenData
 from swetter.models import User
+from swetter.utils.user_cache import user_cache
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db=Depends(get_db)):
+def get_session_factory():
+    '''
+    Session factory for work that outlives the request, such as streaming responses:
+    sessions from get_async_db are closed before the response body is sent.
+    '''
+
+    return SessionLocal
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db=Depends(get_async_db)):
     '''
     Get the current user based on the provided token.
-    This function decodes the JWT token to extract the username and retrieves the corresponding user from the database.
+    This function decodes the JWT token and retrieves the user from the database by the user_id claim
+    (tokens issued before it existed are resolved by username). Resolved users are cached by token.
+    FastAPI runs a dependency once per request, so the router dependency and the current_user parameter
+    of a route share one resolution and the db session of the route.
     :param token: JWT token
     :param db: db session
     :return: User object
     :raises HTTPException: If the token is invalid or user is not found
     '''
 
+    user = user_cache.get(token)
+
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -48,10 +65,50 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db=Depends(g
         print(e)
         raise credentials_exception
 
-    user = User.get_user_by_username(db, token_data.username)
+    user_id = payload.get("user_id")
+
+    if user_id is not None:
+        user = await User.get_user_by_id_async(db, user_id)
+        if user is not None and user.user_name != token_data.username:
+            user = None
+    else:
+        user = await User.get_user_by_username_async(db, token_data.username)
 
     if user is None:
         print("User not found")
         raise credentials_exception
 
+    if "exp" in payload:
+        user_cache.set(token, user, datetime.fromtimestamp(payload["exp"], timezone.utc))
+
     return user
+
+
+def get_admin_user(current_user=Depends(get_current_user)):
+    '''
+    Get the current user if it is an admin (listed in ADMIN_USERNAMES).
+    :param current_user: user who sends the request
+    :return: User object
+    :raises HTTPException: If the user is not an admin
+    '''
+
+    if current_user.user_name not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return current_user
+
+
+def check_metrics_token(authorization: Annotated[str | None, Header()] = None):
+    '''
+    Let the scraper through if it sends "Authorization: Bearer <METRICS_TOKEN>".
+    Without METRICS_TOKEN the endpoint is not served at all, so the metrics and the Job table query behind them
+    are not open to everyone by default.
+    :param authorization: Authorization header
+    :raises HTTPException: 404 if METRICS_TOKEN is not set, 401 if the token is missing or wrong
+    '''
+
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if authorization is None or not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
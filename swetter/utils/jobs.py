@@ -0,0 +1,139 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from swetter import (JOB_WORKERS, JOB_POLL_INTERVAL, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_BACKOFF_BASE,
+                     JOB_BACKOFF_MAX, JOB_DONE_RETENTION_SECONDS, JOB_PRUNE_INTERVAL)
+from swetter.database.db import AsyncSessionLocal
+from swetter.models import Job
+from swetter.utils.metrics import job_runs, job_duration
+
+handlers = {}
+
+
+def job_handler(job_kind):
+    '''
+    Register a coroutine as the handler of a job kind.
+    The handler is called with its own AsyncSession and the entity id stored in the job,
+    and returns True when the job is done or False to run it again later.
+    The done status of the job is committed by the first commit of the handler, so a job whose work was saved
+    is not run again, even if the worker dies before it returns.
+    :param job_kind: kind of the job
+    '''
+
+    def decorator(function):
+        handlers[job_kind] = function
+        return function
+
+    return decorator
+
+
+class JobWorkerPool:
+    '''
+    Background workers that take jobs from the Job table.
+    The table is the queue, so queued jobs survive restarts and are shared by all app processes.
+    A waiting job is a row, not a thread: at most `workers` jobs run at once, each with its own session.
+    Failed jobs are retried with exponential backoff and end up in the dead status after max_attempts.
+    Done jobs are deleted after done_retention seconds by an idle worker.
+    '''
+
+    def __init__(self, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL, lease_seconds=JOB_LEASE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS, backoff_base=JOB_BACKOFF_BASE, backoff_max=JOB_BACKOFF_MAX,
+                 done_retention=JOB_DONE_RETENTION_SECONDS, prune_interval=JOB_PRUNE_INTERVAL,
+                 session_factory=AsyncSessionLocal):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.done_retention = done_retention
+        self.prune_interval = prune_interval
+        self.session_factory = session_factory
+        self.pruned_at = None
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.run_worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def run_worker(self):
+        while True:
+            try:
+                has_job = await self.run_next()
+                if not has_job:
+                    await self.prune_done()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Job worker failed. Error: {e}")
+                has_job = False
+
+            if not has_job:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_next(self) -> bool:
+        '''
+        Claim and run one due job.
+        :return: True if a job was run, False if the queue had nothing to do
+        '''
+
+        async with self.session_factory() as db:
+            job = await Job.claim_next_async(db, self.lease_seconds)
+
+            if job is None:
+                return False
+
+            job_kind = job.job_kind
+            handler = handlers.get(job_kind)
+            started = time.perf_counter()
+            job.mark_done()
+
+            try:
+                done = handler is not None and await handler(db, job.job_entity_id)
+            except Exception as e:
+                print(f"Warning: Job {job.job_id} ({job_kind}) failed. Error: {e}")
+                done = False
+
+            if not done:
+                await db.rollback()
+
+            job_duration.observe(time.perf_counter() - started, (job_kind,))
+            job_runs.inc((job_kind, "done" if done else "retry"))
+
+            if done:
+                await job.finish_async(db)
+            else:
+                await job.retry_async(db, self.backoff_base, self.backoff_max, self.max_attempts)
+
+            return True
+
+    async def prune_done(self):
+        '''
+        Delete the done jobs older than done_retention seconds, at most once every prune_interval seconds.
+        :return: number of deleted jobs or None if the last prune was too recent
+        '''
+
+        now = time.monotonic()
+        if self.pruned_at is not None and now - self.pruned_at < self.prune_interval:
+            return None
+        self.pruned_at = now
+
+        async with self.session_factory() as db:
+            return await Job.purge_done_async(db, datetime.utcnow() - timedelta(seconds=self.done_retention))
+
+    async def stats(self):
+        '''
+        Queue depth by status and lag of the oldest due job, see Job.queue_stats.
+        '''
+
+        async with self.session_factory() as db:
+            return await Job.queue_stats_async(db)
+
+
+job_workers = JobWorkerPool()
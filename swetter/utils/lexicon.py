@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+
+from swetter import LEXICON_PATH, LEXICON_RELOAD_INTERVAL, LEXICON_TRIVIAL_MAX_LENGTH
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+class Lexicon:
+    '''
+    Aho-Corasick automaton over blocked and allowed terms.
+    Transitions of every state are fully resolved (failure links folded in), so matching
+    costs one dict lookup per character regardless of the number of terms.
+    '''
+
+    def __init__(self, blocked=(), whole_word=(), allowed=()):
+        self.terms = []
+        self.goto = [{}]
+        self.outputs = [[]]
+
+        for term in blocked:
+            self.add(term, blocked=True, whole_word=False)
+        for term in whole_word:
+            self.add(term, blocked=True, whole_word=True)
+        for term in allowed:
+            self.add(term, blocked=False, whole_word=False)
+
+        self.build()
+
+    def add(self, term, blocked, whole_word):
+        term = normalize_text(term.strip())
+        if not term:
+            return
+
+        state = 0
+        for char in term:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.outputs.append([])
+            state = next_state
+
+        self.outputs[state].append(len(self.terms))
+        self.terms.append((term, blocked, whole_word))
+
+    def build(self):
+        fail = [0] * len(self.goto)
+        order = []
+        queue = deque(self.goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, next_state in self.goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = fail[fallback]
+                candidate = self.goto[fallback].get(char, 0)
+                fail[next_state] = candidate if candidate != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[fail[next_state]]
+                queue.append(next_state)
+
+        # states are resolved in BFS order, so the failure state of every state is already complete
+        for state in order:
+            inherited = self.goto[fail[state]]
+            own = self.goto[state]
+            self.goto[state] = {**inherited, **own}
+
+    def matches(self, text):
+        '''
+        Find all term occurrences in a normalized text.
+        :param text: text after normalize_text
+        :return: list of (term index, start, end) tuples
+        '''
+
+        goto = self.goto
+        outputs = self.outputs
+        found = []
+        state = 0
+
+        for position, char in enumerate(text):
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                for term_index in outputs[state]:
+                    end = position + 1
+                    found.append((term_index, end - len(self.terms[term_index][0]), end))
+
+        return found
+
+    def find_blocked(self, text):
+        '''
+        Find blocked terms in a text, ignoring occurrences inside allowed terms
+        and whole-word terms that are part of a longer word.
+        :param text: text to check
+        :return: list of blocked terms found
+        '''
+
+        text = normalize_text(text)
+        found = self.matches(text)
+
+        allowed_spans = [(start, end) for term_index, start, end in found if not self.terms[term_index][1]]
+        blocked = []
+
+        for term_index, start, end in found:
+            term, is_blocked, whole_word = self.terms[term_index]
+            if not is_blocked:
+                continue
+            if whole_word and ((start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())):
+                continue
+            if any(allowed_start <= start and end <= allowed_end for allowed_start, allowed_end in allowed_spans):
+                continue
+            blocked.append(term)
+
+        return blocked
+
+
+def load_lexicon(path) -> Lexicon:
+    '''
+    Load a lexicon file. One term per line, lines starting with # are comments.
+    A term prefixed with = only matches a whole word, a term prefixed with ! is an allow rule:
+    blocked terms found inside it are ignored.
+    :param path: path to the lexicon file
+    :return: Lexicon
+    '''
+
+    blocked, whole_word, allowed = [], [], []
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("="):
+                whole_word.append(line[1:])
+            elif line.startswith("!"):
+                allowed.append(line[1:])
+            else:
+                blocked.append(line)
+
+    return Lexicon(blocked, whole_word, allowed)
+
+
+class LexiconFilter:
+    '''
+    Local moderation pre-filter in front of Gemini.
+    The lexicon file is reloaded when its modification time changes (checked at most every reload_interval seconds).
+    A file that can not be loaded (removed, not UTF-8, half written) is logged and the previous lexicon is kept
+    until the file changes again.
+    '''
+
+    def __init__(self, path=LEXICON_PATH, reload_interval=LEXICON_RELOAD_INTERVAL,
+                 trivial_max_length=LEXICON_TRIVIAL_MAX_LENGTH):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.trivial_max_length = trivial_max_length
+        self.lexicon = Lexicon()
+        self.mtime = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+
+        if mtime == self.mtime:
+            return
+
+        self.mtime = mtime
+
+        try:
+            self.lexicon = load_lexicon(self.path)
+        except Exception as e:
+            print(f"Warning: Lexicon {self.path} was not loaded, the previous one is kept. Error: {e}")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.reload_interval:
+            return
+
+        with self.lock:
+            if now - self.checked_at >= self.reload_interval:
+                self.checked_at = now
+                self.reload()
+
+    def check(self, content) -> bool | None:
+        '''
+        Decide obvious cases without Gemini.
+        :param content: text to check
+        :return: True if the text contains a blocked term, False if it is short text without letters or digits
+        (emoji, punctuation), None if Gemini has to decide
+        '''
+
+        self.maybe_reload()
+
+        if self.lexicon.find_blocked(content):
+            return True
+
+        if len(content) <= self.trivial_max_length and not any(char.isalnum() for char in content):
+            return False
+
+        return None
+
+
+lexicon_filter = LexiconFilter()
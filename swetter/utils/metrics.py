@@ -0,0 +1,250 @@
+import threading
+from bisect import bisect_left
+
+from swetter.utils.query_events import watch_queries, watch_requests
+from swetter.utils.read_cache import read_cache
+from swetter.utils.user_cache import user_cache
+from swetter.utils.verdict_cache import verdict_cache
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    '''
+    Series of one metric keyed by label values. Updates take the lock of the metric only for the increment,
+    the exposition text is built when /metrics is scraped.
+    '''
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def samples(self):
+        '''
+        :return: list of (sample name, labels text, value)
+        '''
+
+        with self.lock:
+            series = dict(self.series)
+
+        return [(self.name, format_labels(self.labels, labels), value) for labels, value in sorted(series.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        with self.lock:
+            self.series[labels] = value
+
+
+class Histogram(Metric):
+    '''
+    Observations counted in the first bucket they fit; buckets are made cumulative at scrape time.
+    '''
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # counts of every bucket and of +Inf, then the sum
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+
+        samples = []
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                samples.append((f"{self.name}_bucket", format_labels(self.labels, labels, le), cumulative))
+            samples.append((f"{self.name}_sum", format_labels(self.labels, labels), values[-1]))
+            samples.append((f"{self.name}_count", format_labels(self.labels, labels), cumulative))
+
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self, extra=()):
+        '''
+        :param extra: metrics computed for this scrape only
+        :return: exposition text of all metrics
+        '''
+
+        lines = []
+        for metric in [*self.metrics, *extra]:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "Database queries issued while handling one request.", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS))
+db_query_time_per_request = registry.register(Histogram(
+    "db_query_time_per_request_seconds", "Time spent in database queries while handling one request.",
+    ("method", "route")))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Latency of single database queries (requests and background jobs).",
+    buckets=QUERY_TIME_BUCKETS))
+gemini_call_duration = registry.register(Histogram(
+    "gemini_call_duration_seconds", "Gemini call latency by outcome (ok, error, timeout, overloaded).",
+    ("outcome",)))
+moderation_verdicts = registry.register(Counter(
+    "moderation_verdicts_total", "Moderation verdicts by source (lexicon, cache, gemini) and verdict "
+    "(blocked, allowed, unknown when Gemini failed).", ("source", "verdict")))
+job_runs = registry.register(Counter(
+    "job_runs_total", "Background job runs by kind and outcome (done, retry).", ("kind", "outcome")))
+job_duration = registry.register(Histogram(
+    "job_duration_seconds", "Background job run time by kind.", ("kind",)))
+
+
+def record_verdict(source, need_to_block):
+    verdict = "unknown" if need_to_block is None else "blocked" if need_to_block else "allowed"
+    moderation_verdicts.inc((source, verdict))
+
+
+def observe_query(conn, statement, parameters, executemany, elapsed):
+    db_query_duration.observe(elapsed)
+
+
+def observe_request(scope, status, elapsed, queries):
+    '''
+    Record latency, status and database usage of a request by route template (e.g. /post/{post_id}),
+    so the number of series does not grow with the ids in the paths.
+    '''
+
+    # the router stores the matched route in the scope
+    route = scope.get("route")
+    labels = (scope["method"], route.path if route is not None else "unmatched")
+
+    http_requests.inc(labels + (str(status),))
+    http_request_duration.observe(elapsed, labels)
+    db_queries_per_request.observe(queries.count, labels)
+    db_query_time_per_request.observe(queries.seconds, labels)
+
+
+def instrument_engine(engine):
+    '''
+    Count and time every query of a sync engine (for an AsyncEngine pass its sync_engine).
+    '''
+
+    watch_queries(engine, observe_query)
+
+
+def instrument_requests():
+    '''
+    Record every request handled behind QueryTrackingMiddleware.
+    '''
+
+    watch_requests(observe_request)
+
+
+def scrape_metrics(queue_stats):
+    '''
+    Metrics read when /metrics is scraped: job queue depth and lag, and the hit counters of the caches.
+    :param queue_stats: result of Job.queue_stats
+    :return: list of metrics
+    '''
+
+    queue_jobs = Gauge("job_queue_jobs", "Jobs in the Job table by status.", ("status",))
+    for status in ("queued", "running", "done", "dead"):
+        queue_jobs.set(queue_stats[status], (status,))
+
+    queue_lag = Gauge("job_queue_lag_seconds", "Seconds since the oldest due queued job was supposed to run.")
+    queue_lag.set(queue_stats["lag"])
+
+    read_cache_requests = Counter("read_cache_requests_total", "Read cache lookups by namespace and result.",
+                                  ("namespace", "result"))
+    for namespace, stats in read_cache.stats().items():
+        read_cache_requests.inc((namespace, "hit"), stats["hits"])
+        read_cache_requests.inc((namespace, "miss"), stats["misses"])
+
+    user_cache_stats = user_cache.stats()
+    user_cache_requests = Counter("user_cache_requests_total", "Token to user cache lookups by result.", ("result",))
+    user_cache_requests.inc(("hit",), user_cache_stats["hits"])
+    user_cache_requests.inc(("miss",), user_cache_stats["misses"])
+
+    verdict_cache_stats = verdict_cache.stats()
+    verdict_cache_requests = Counter("verdict_cache_requests_total", "Moderation verdict cache lookups by result "
+                                     "(hit in memory, store_hit in the persistent store, miss).", ("result",))
+    for result in ("hits", "store_hits", "misses"):
+        verdict_cache_requests.inc((result[:-1],), verdict_cache_stats[result])
+
+    return [queue_jobs, queue_lag, read_cache_requests, user_cache_requests, verdict_cache_requests]
+
+
+def render_metrics(queue_stats):
+    return registry.render(scrape_metrics(queue_stats))
@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import desc, tuple_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    '''
+    Encode the position of the last row on a page into an opaque cursor.
+    :param created_at: creation time of the last row
+    :param row_id: primary key of the last row
+    :return: url-safe cursor string
+    '''
+
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    '''
+    Decode a cursor created by encode_cursor.
+    :param cursor: cursor string from the client
+    :return: creation time and primary key of the last row of the previous page
+    :raises ValueError: If the cursor is malformed
+    '''
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def paginate(query, created_column, id_column, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+    '''
+    Apply keyset pagination (newest first) to a query.
+    Rows are ordered by (created_at, id) descending and the page starts right after the cursor position,
+    so the cost of a page does not depend on how deep into the listing it is.
+    :param query: filtered query
+    :param created_column: creation time column of the model
+    :param id_column: primary key column of the model
+    :param limit: page size
+    :param cursor: cursor returned with the previous page (optional)
+    :param columns: columns to select instead of the whole model (optional), they must include created_column
+    and id_column
+    :return: rows of the page and cursor for the next page or None if this is the last page
+    :raises ValueError: If the cursor is malformed
+    '''
+
+    if columns:
+        query = query.with_entities(*columns)
+
+    if cursor is not None:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(created_column, id_column) < tuple_(created_at, row_id))
+
+    rows = query.order_by(desc(created_column), desc(id_column)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+
+    return rows, next_cursor
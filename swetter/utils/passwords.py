@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from swetter import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+
+
+class PasswordHasherOverloaded(Exception):
+    pass
+
+
+class PasswordHasher:
+    '''
+    Runs bcrypt in a bounded thread pool (bcrypt releases the GIL), so hashing never blocks the event loop.
+    At most workers + max_queue operations are accepted at once, others are rejected right away.
+    Hashes made with another cost factor than rounds are reported for rehash by verify_and_update.
+    '''
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds,
+                                    bcrypt__min_desired_rounds=rounds, bcrypt__max_desired_rounds=rounds)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self.max_pending = workers + max_queue
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    async def run(self, function, *args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHasherOverloaded(f"{self.pending} password operations are already running or waiting")
+            self.pending += 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    async def hash(self, password) -> str:
+        '''
+        :param password: plain password
+        :return: bcrypt hash
+        :raises PasswordHasherOverloaded: If too many password operations are in progress
+        '''
+
+        return await self.run(self.context.hash, password)
+
+    async def verify_and_update(self, password, password_hash) -> tuple[bool, str | None]:
+        '''
+        Verify a password and rehash it if its hash was made with another cost factor.
+        :param password: plain password
+        :param password_hash: stored hash
+        :return: True if the password matches and the new hash to store, or None if the stored one is up to date
+        :raises PasswordHasherOverloaded: If too many password operations are in progress
+        '''
+
+        return await self.run(self.context.verify_and_update, password, password_hash)
+
+
+password_hasher = PasswordHasher()
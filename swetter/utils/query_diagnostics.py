@@ -0,0 +1,186 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from swetter import SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, N_PLUS_ONE_THRESHOLD, N_PLUS_ONE_STRICT
+from swetter.utils.query_events import current_queries, watch_queries, watch_requests
+
+_placeholder_group = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_repeated_groups = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_whitespace = re.compile(r"\s+")
+
+EXPLAINED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    '''
+    Statement text with IN lists and multi-row VALUES collapsed, so that the same query with another
+    number of parameters has the same shape.
+    '''
+
+    shape = _placeholder_group.sub("(?)", statement)
+    shape = _repeated_groups.sub("(?)", shape)
+    return _whitespace.sub(" ", shape).strip()
+
+
+def request_shapes(queries):
+    '''
+    :param queries: RequestQueries
+    :return: dict statement shape -> [executions, seconds]
+    '''
+
+    shapes = {}
+    for statement, (count, elapsed) in queries.statements.items():
+        entry = shapes.setdefault(statement_shape(statement), [0, 0.0])
+        entry[0] += count
+        entry[1] += elapsed
+    return shapes
+
+
+class QueryDiagnostics:
+    '''
+    Slow-query log and N+1 detector, built on the shared statement and request hooks (see query_events).
+    Statements slower than slow_query_ms are printed, and with explain=True the plan of every slow statement shape
+    is printed once, read by a background thread on its own connection. Requests that ran one statement shape more
+    than n_plus_one_threshold times (a query per comment of a page, etc.) are reported when they finish;
+    with strict=True they raise NPlusOneError instead, which fails the test that made the request.
+    Both checks are off by default.
+    '''
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, explain=SLOW_QUERY_EXPLAIN,
+                 n_plus_one_threshold=N_PLUS_ONE_THRESHOLD, strict=N_PLUS_ONE_STRICT):
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.strict = strict
+        self.explained = set()
+        self.plan_engines = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.slow_query_ms or self.n_plus_one_threshold)
+
+    def attach(self, engine, plan_engine=None):
+        '''
+        Watch the statements of a sync engine (for an AsyncEngine pass its sync_engine).
+        :param plan_engine: sync engine of the same database used to read query plans, needed for the sync_engine
+        of an AsyncEngine, whose connections can not be used from the plan thread
+        '''
+
+        self.plan_engines[engine] = plan_engine or engine
+        watch_queries(engine, self.observe_query)
+
+    def observe_query(self, conn, statement, parameters, executemany, elapsed):
+        if self.slow_query_ms and elapsed * 1000 >= self.slow_query_ms:
+            self.log_slow_query(self.plan_engines.get(conn.engine, conn.engine), statement,
+                                parameters[0] if executemany and parameters else parameters, elapsed,
+                                current_queries.get())
+
+    def observe_request(self, scope, status, elapsed, queries):
+        self.check_request(queries)
+
+    def log_slow_query(self, engine, statement, parameters, elapsed, queries):
+        shape = statement_shape(statement)
+        where = f" in {queries.label}" if queries is not None else ""
+        print(f"Warning: Slow query ({elapsed * 1000:.1f} ms){where}: {shape}")
+
+        if not self.explain or not statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            return
+
+        # the plan of a shape does not change between executions, so it is read once and off the request
+        with self.lock:
+            if shape in self.explained:
+                return
+            self.explained.add(shape)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-plan")
+
+        self.executor.submit(self.log_query_plan, engine, statement, parameters, shape)
+
+    def log_query_plan(self, engine, statement, parameters, shape):
+        lines = self.query_plan(engine, statement, parameters)
+        plan = "\n".join(f"    {line}" for line in lines)
+        print(f"Warning: Query plan of {shape}:\n{plan}")
+
+    @staticmethod
+    def query_plan(engine, statement, parameters):
+        '''
+        Read the plan on a raw connection of the pool, so the EXPLAIN is not timed and reported itself.
+        :return: lines of the query plan, nested steps indented
+        '''
+
+        sqlite = engine.dialect.name == "sqlite"
+        connection = engine.raw_connection()
+
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f"{'EXPLAIN QUERY PLAN' if sqlite else 'EXPLAIN'} {statement}", parameters)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            return [f"no plan: {e}"]
+        finally:
+            connection.close()
+
+        if not sqlite:
+            return [" ".join(str(value) for value in row) for row in rows]
+
+        depth = {0: -1}
+        lines = []
+        for step_id, parent_id, _, detail in rows:
+            depth[step_id] = depth.get(parent_id, -1) + 1
+            lines.append("  " * depth[step_id] + detail)
+        return lines
+
+    def close(self):
+        '''
+        Wait for the query plans being read.
+        '''
+
+        with self.lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def check_request(self, queries):
+        '''
+        Report statement shapes the request ran more than n_plus_one_threshold times.
+        :param queries: RequestQueries of the finished request
+        :return: list of (shape, executions, seconds) over the threshold
+        :raises NPlusOneError: If strict and the request is flagged
+        '''
+
+        if not self.n_plus_one_threshold:
+            return []
+
+        flagged = [(shape, count, elapsed) for shape, (count, elapsed) in request_shapes(queries).items()
+                   if count > self.n_plus_one_threshold]
+
+        for shape, count, elapsed in flagged:
+            print(f"Warning: Possible N+1 in {queries.label}: {count} executions ({elapsed * 1000:.1f} ms) "
+                  f"of {shape}")
+
+        if flagged and self.strict:
+            raise NPlusOneError(f"{queries.label} ran {', '.join(str(count) for _, count, _ in flagged)} "
+                                f"times the same statement: {flagged[0][0]}")
+
+        return flagged
+
+    def instrument_requests(self):
+        '''
+        Check every request handled behind QueryTrackingMiddleware.
+        '''
+
+        watch_requests(self.observe_request)
+
+
+query_diagnostics = QueryDiagnostics()
@@ -0,0 +1,132 @@
+'''
+Instrumentation shared by the metrics and the query diagnostics.
+Every statement of a watched engine is timed once by one set of cursor events and handed to the query observers,
+and one middleware collects the statements of every request and hands them to the request observers at its end.
+'''
+import contextvars
+import time
+import weakref
+
+from sqlalchemy import event
+
+# statements of the request being handled, shared with the threads and greenlets it uses
+current_queries = contextvars.ContextVar("current_queries", default=None)
+
+request_observers = []
+
+
+class RequestQueries:
+    '''
+    Statements run while handling one request: statement text -> [executions, seconds], and their totals.
+    '''
+
+    def __init__(self, label):
+        self.label = label
+        self.statements = {}
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, statement, elapsed):
+        self.count += 1
+        self.seconds += elapsed
+
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+
+class QueryHook:
+    '''
+    Cursor events of one engine. The start times are kept in a stack in conn.info, one entry per running
+    statement; a statement that raises does not get after_cursor_execute, so handle_error drops its entry.
+    '''
+
+    def __init__(self):
+        self.observers = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append((context, time.perf_counter()))
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()[1]
+
+        queries = current_queries.get()
+        if queries is not None:
+            queries.add(statement, elapsed)
+
+        for observer in self.observers:
+            observer(conn, statement, parameters, executemany, elapsed)
+
+    def handle_error(self, context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+
+        if started and started[-1][0] is context.execution_context:
+            started.pop()
+
+
+_hooks = weakref.WeakKeyDictionary()
+
+
+def watch_queries(engine, observer):
+    '''
+    Call observer(conn, statement, parameters, executemany, elapsed) after every statement of a sync engine
+    (for an AsyncEngine pass its sync_engine). The events are added once per engine, whatever the number of observers.
+    '''
+
+    hook = _hooks.get(engine)
+
+    if hook is None:
+        hook = _hooks[engine] = QueryHook()
+        event.listen(engine, "before_cursor_execute", hook.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", hook.after_cursor_execute)
+        event.listen(engine, "handle_error", hook.handle_error)
+
+    if observer not in hook.observers:
+        hook.observers.append(observer)
+
+
+def watch_requests(observer):
+    '''
+    Call observer(scope, status, elapsed, queries) at the end of every request, queries being its RequestQueries.
+    '''
+
+    if observer not in request_observers:
+        request_observers.append(observer)
+
+
+class QueryTrackingMiddleware:
+    '''
+    ASGI middleware collecting the status, latency and statements of every request for the request observers.
+    It does nothing while there are no observers.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not request_observers:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = RequestQueries(f"{scope['method']} {scope['path']}")
+        token = current_queries.set(queries)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_queries.reset(token)
+
+            for observer in request_observers:
+                observer(scope, status, elapsed, queries)
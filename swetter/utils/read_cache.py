@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import defaultdict
+
+from cachetools import TTLCache
+
+from swetter import READ_CACHE_ENABLED, READ_CACHE_SIZE, READ_CACHE_TTL
+
+
+class CacheBackend:
+    '''
+    Storage interface of ReadCache. A shared cache (Redis, memcached) can be plugged in by implementing
+    these methods; entries are expected to expire after the backend ttl and may be evicted at any time.
+    '''
+
+    def get(self, key):
+        '''
+        :return: stored value or None if the key is missing
+        '''
+
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    '''
+    In-process LRU with TTL.
+    '''
+
+    def __init__(self, maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.memory.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+
+    def delete(self, key):
+        with self.lock:
+            self.memory.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+
+
+class ReadCache:
+    '''
+    Read-through cache of model reads, grouped by namespace and key (for example "post_comments" and a post id).
+    One key can hold several variants (pages of a listing). Every key has a generation stored in the backend:
+    invalidate() replaces it, so all variants of the key become unreachable at once and expire on their own.
+    Generations are unique tokens, not counters, so an evicted generation never brings old entries back.
+    Cached values are shared between requests and must not be modified or attached to a session.
+    '''
+
+    def __init__(self, backend=None, enabled=READ_CACHE_ENABLED):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def generation(self, namespace, key):
+        generation_key = f"{namespace}:{key}:generation"
+        generation = self.backend.get(generation_key)
+
+        if generation is None:
+            generation = str(time.time_ns())
+            self.backend.set(generation_key, generation)
+
+        return generation
+
+    async def get_or_load(self, namespace, key, loader, variant=None):
+        '''
+        Return a cached value or load and cache it.
+        :param namespace: kind of the cached read
+        :param key: id the read depends on, used for invalidation
+        :param loader: coroutine function without arguments that loads the value
+        :param variant: other arguments of the read (optional)
+        :return: value; None results are not cached
+        '''
+
+        if not self.enabled:
+            return await loader()
+
+        value_key = f"{namespace}:{key}:{self.generation(namespace, key)}:{variant}"
+        value = self.backend.get(value_key)
+
+        if value is not None:
+            with self.lock:
+                self.hits[namespace] += 1
+            return value
+
+        with self.lock:
+            self.misses[namespace] += 1
+
+        value = await loader()
+
+        if value is not None:
+            self.backend.set(value_key, value)
+
+        return value
+
+    def invalidate(self, namespace, key):
+        self.backend.delete(f"{namespace}:{key}:generation")
+
+    def clear(self):
+        self.backend.clear()
+        with self.lock:
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self):
+        '''
+        :return: hits, misses and hit ratio of every namespace
+        '''
+
+        with self.lock:
+            return {
+                namespace: {
+                    "hits": self.hits[namespace],
+                    "misses": self.misses[namespace],
+                    "hit_ratio": self.hits[namespace] / (self.hits[namespace] + self.misses[namespace]),
+                }
+                for namespace in set(self.hits) | set(self.misses)
+            }
+
+
+read_cache = ReadCache()
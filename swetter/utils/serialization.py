@@ -0,0 +1,46 @@
+from operator import attrgetter
+
+import orjson
+from fastapi import Response
+
+
+class RowSerializer:
+    '''
+    Serializer of a response schema, built once per schema.
+    Reads the schema fields straight from ORM objects or from rows of a column-only select (see columns)
+    and encodes them with orjson, so no pydantic models are built and FastAPI does not validate the response
+    against response_model again. Values come from typed columns, so they already match the schema.
+    '''
+
+    def __init__(self, schema, model):
+        self.fields = tuple(schema.model_fields)
+        self.columns = tuple(getattr(model, field) for field in self.fields)
+        self.getter = attrgetter(*self.fields)
+
+    def to_dict(self, row) -> dict:
+        return dict(zip(self.fields, self.getter(row)))
+
+    def response(self, row, status_code=200, headers=None) -> Response:
+        '''
+        :param row: ORM object or row with the schema fields
+        :param status_code: response status code
+        :param headers: extra response headers (optional)
+        :return: JSON response with one object
+        '''
+
+        return Response(content=orjson.dumps(self.to_dict(row)), status_code=status_code, headers=headers,
+                        media_type="application/json")
+
+    def page_response(self, rows, next_cursor, headers=None) -> Response:
+        '''
+        :param rows: ORM objects or rows with the schema fields
+        :param next_cursor: cursor of the next page or None
+        :param headers: extra response headers (optional)
+        :return: JSON response with the page in the shape of the *Page schemas
+        '''
+
+        fields, getter = self.fields, self.getter
+        items = [dict(zip(fields, getter(row))) for row in rows]
+
+        return Response(content=orjson.dumps({"items": items, "next_cursor": next_cursor}), headers=headers,
+                        media_type="application/json")
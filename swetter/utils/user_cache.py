@@ -0,0 +1,69 @@
+import threading
+from datetime import datetime, timezone
+
+from cachetools import TTLCache
+from sqlalchemy import event
+
+from swetter import USER_CACHE_SIZE, USER_CACHE_TTL
+from swetter.models import User
+
+
+class UserCache:
+    '''
+    Resolved users keyed by access token, so that repeated requests with the same token skip the JWT decode
+    and the database lookup. Entries live at most ttl seconds and never outlive the token itself.
+    '''
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        '''
+        :param token: access token
+        :return: User (detached from its session) or None if the token is not cached or has expired
+        '''
+
+        with self.lock:
+            entry = self.memory.get(token)
+
+            if entry is not None and entry[1] > datetime.now(timezone.utc):
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, token, user, expire):
+        '''
+        :param token: access token
+        :param user: resolved User
+        :param expire: expiration time of the token
+        '''
+
+        with self.lock:
+            self.memory[token] = (user, expire)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in [token for token, (user, _) in self.memory.items() if user.user_id == user_id]:
+                del self.memory[token]
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"size": len(self.memory), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_changed_user(mapper, connection, target):
+    user_cache.invalidate_user(target.user_id)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from cachetools import TTLCache
+
+from swetter import (MODERATION_CACHE_SIZE, MODERATION_CACHE_TTL, MODERATION_CACHE_PERSISTENT,
+                     MODERATION_CACHE_PERSISTENT_TTL)
+from swetter.database.db import SessionLocal
+from swetter.models import ModerationVerdict
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_content(content: str) -> str:
+    '''
+    Normalize text so that copies differing only in case, unicode form or whitespace share a verdict.
+    :param content: moderated text
+    :return: normalized text
+    '''
+
+    return _whitespace.sub(" ", unicodedata.normalize("NFKC", content).casefold()).strip()
+
+
+def verdict_key(kind: str, content: str) -> str:
+    '''
+    Cache key of a moderation verdict.
+    :param kind: prompt kind (comment, post or reply)
+    :param content: moderated text
+    :return: hex sha256 of the kind and the normalized text
+    '''
+
+    return hashlib.sha256(f"{kind}\0{normalize_content(content)}".encode()).hexdigest()
+
+
+class SqliteVerdictStore:
+    '''
+    Persistent verdict tier in the Moderation_Verdict table, shared by all workers and kept across restarts.
+    '''
+
+    def __init__(self, session_factory=SessionLocal, ttl=MODERATION_CACHE_PERSISTENT_TTL):
+        self.session_factory = session_factory
+        self.ttl = ttl
+
+    def get(self, key):
+        db = self.session_factory()
+        try:
+            verdict = ModerationVerdict.get_verdict(db, key, datetime.utcnow() - timedelta(seconds=self.ttl))
+            return None if verdict is None else verdict.verdict_blocked
+        finally:
+            db.close()
+
+    def set(self, key, kind, blocked):
+        db = self.session_factory()
+        try:
+            ModerationVerdict.save_verdict(db, key, kind, blocked)
+        finally:
+            db.close()
+
+
+class VerdictCache:
+    '''
+    Moderation verdicts keyed by content hash: an in-process LRU with TTL in front of an optional persistent store.
+    '''
+
+    def __init__(self, maxsize=MODERATION_CACHE_SIZE, ttl=MODERATION_CACHE_TTL, store=None):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = store
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def get_memory(self, key):
+        with self.lock:
+            blocked = self.memory.get(key)
+            if blocked is not None:
+                self.hits += 1
+            return blocked
+
+    def set_memory(self, key, blocked):
+        with self.lock:
+            self.memory[key] = blocked
+
+    def store_hit(self, key, blocked):
+        with self.lock:
+            self.store_hits += 1
+            self.memory[key] = blocked
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    async def get(self, kind, content):
+        '''
+        Look up a verdict, first in memory, then in the persistent store.
+        :param kind: prompt kind (comment, post or reply)
+        :param content: moderated text
+        :return: True if the content must be blocked, False if not, None if the verdict is unknown
+        '''
+
+        key = verdict_key(kind, content)
+
+        blocked = self.get_memory(key)
+        if blocked is not None:
+            return blocked
+
+        if self.store is not None:
+            blocked = await asyncio.to_thread(self.store.get, key)
+            if blocked is not None:
+                self.store_hit(key, blocked)
+                return blocked
+
+        self.miss()
+        return None
+
+    async def set(self, kind, content, blocked):
+        key = verdict_key(kind, content)
+
+        self.set_memory(key, blocked)
+
+        if self.store is not None:
+            await asyncio.to_thread(self.store.set, key, kind, blocked)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.hits = self.store_hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.memory),
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+            }
+
+
+verdict_cache = VerdictCache(store=SqliteVerdictStore() if MODERATION_CACHE_PERSISTENT else None)
@@ -1,11 +1,17 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from swetter.main import app  # Замените на фактический путь к вашему FastAPI приложению
 from swetter.models import Base, User, Post, Comment
-from swetter.utils.deps import get_db, get_current_user
+from swetter.utils.deps import get_async_db, get_current_user, get_session_factory
+from swetter.utils.query_diagnostics import query_diagnostics
+from swetter.utils.read_cache import read_cache
+from swetter.utils.user_cache import user_cache
+from swetter.utils.verdict_cache import verdict_cache
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -13,30 +19,41 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient starts a new event loop for every request, so async connections must not be pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# N+1 patterns are reported for the test database too, run with N_PLUS_ONE_STRICT=true to fail on them
+query_diagnostics.n_plus_one_threshold = query_diagnostics.n_plus_one_threshold or 10
+query_diagnostics.attach(engine)
+query_diagnostics.attach(async_engine.sync_engine, plan_engine=engine)
+query_diagnostics.instrument_requests()
+
 # Создаем базу данных для тестирования
 Base.metadata.create_all(bind=engine)
 
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def override_get_current_user():
     return User(user_id=1, user_name="testuser", user_password_hash="testhash")
 
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
 
 client = TestClient(app)
 
 
 @pytest.fixture(autouse=True)
 def setup_and_teardown_db():
+    verdict_cache.clear()
+    user_cache.clear()
+    read_cache.clear()
     # Удаляем и пересоздаем таблицы перед каждым тестом
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
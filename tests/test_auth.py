@@ -1,4 +1,16 @@
-from tests.conftest import client
+import asyncio
+
+import jwt
+
+from swetter.main import app
+from swetter.models import User
+from swetter.routes import auth
+from swetter.utils import gemini
+from swetter.utils.deps import get_current_user
+from swetter.utils.passwords import PasswordHasher, PasswordHasherOverloaded
+from swetter.utils.user_cache import user_cache
+from tests.conftest import client, TestingSessionLocal
+from tests.test_gemini import FakeModel
 
 
 def test_create_user():
@@ -56,3 +68,86 @@ def test_login_nonexistent_user():
     )
     assert response.status_code == 401
     assert response.json() == {"detail": "Incorrect username or password"}
+
+
+def login(monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_current_user)
+    client.post("/registration/", json={"username": "testuser", "password": "testpassword"})
+    response = client.post(
+        "/login/",
+        data={"username": "testuser", "password": "testpassword"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_token_contains_user_id(monkeypatch):
+    headers = login(monkeypatch)
+
+    payload = jwt.decode(headers["Authorization"].split()[1], options={"verify_signature": False})
+    db = TestingSessionLocal()
+    assert payload["user_id"] == User.get_user_by_username(db, "testuser").user_id
+    db.close()
+
+
+def test_current_user_resolved_once_and_cached(monkeypatch):
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+    headers = login(monkeypatch)
+    post = {"post_title": "Test Title", "post_content": "Test Content", "post_auto_answer": False, "post_delay": None}
+
+    # the route declares get_current_user both as router dependency and as parameter
+    assert client.post("/post/", json=post, headers=headers).status_code == 200
+    assert user_cache.stats() == {"size": 1, "hits": 0, "misses": 1}
+
+    assert client.post("/post/", json=post, headers=headers).status_code == 200
+    assert user_cache.stats()["hits"] == 1
+
+
+def test_user_cache_invalidated_on_user_change(monkeypatch):
+    headers = login(monkeypatch)
+    assert client.get("/post/1", headers=headers).status_code == 200
+    assert user_cache.stats()["size"] == 1
+
+    db = TestingSessionLocal()
+    User.get_user_by_username(db, "testuser").user_name = "renamed"
+    db.commit()
+    db.close()
+
+    assert user_cache.stats()["size"] == 0
+    assert client.get("/post/1", headers=headers).status_code == 401
+
+
+def test_invalid_token(monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_current_user)
+
+    response = client.get("/post/1", headers={"Authorization": "Bearer invalid"})
+    assert response.status_code == 401
+
+
+def test_login_rehashes_password_when_rounds_change(monkeypatch):
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(rounds=4))
+    client.post("/registration/", json={"username": "testuser", "password": "testpassword"})
+
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(rounds=5))
+    response = client.post(
+        "/login/",
+        data={"username": "testuser", "password": "testpassword"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    assert response.status_code == 200
+
+    db = TestingSessionLocal()
+    assert User.get_user_by_username(db, "testuser").user_password_hash.startswith("$2b$05$")
+    db.close()
+
+
+def test_password_hasher_rejects_when_overloaded():
+    hasher = PasswordHasher(rounds=10, workers=1, max_queue=1)
+
+    async def hash_many():
+        return await asyncio.gather(*(hasher.hash("testpassword") for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(hash_many())
+
+    assert sum(isinstance(result, PasswordHasherOverloaded) for result in results) == 1
+    assert all(hasher.context.verify("testpassword", result) for result in results if isinstance(result, str))
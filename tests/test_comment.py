@@ -1,5 +1,9 @@
+from sqlalchemy import event
+
 from swetter.models import Comment
-from tests.conftest import client, TestingSessionLocal
+from swetter.routes import comments
+from swetter.utils.read_cache import read_cache
+from tests.conftest import client, TestingSessionLocal, async_engine
 
 
 def test_create_comment():
@@ -54,13 +58,70 @@ def test_get_user_comments():
 
     response = client.get("/comments/1")
     assert response.status_code == 200
-    assert len(response.json()) == 3
+    assert len(response.json()["items"]) == 3
 
 
 def test_get_comments_for_post():
     Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content="Test Comment 1", comment_blocked=False)
     Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content="Test Comment 2", comment_blocked=False)
 
-    response = client.get("/comments/1")
+    response = client.get("/posts/1/comments")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+
+
+def test_get_comments_for_post_not_modified():
+    etag = client.get("/posts/1/comments").headers["ETag"]
+    assert client.get("/posts/1/comments", headers={"If-None-Match": etag}).status_code == 304
+
+    db = TestingSessionLocal()
+    Comment.create_comment(db, post_id=1, user_id=1, comment_content="New Comment", comment_blocked=False)
+    db.close()
+    # the page is cached and the comment was not created through the API
+    read_cache.clear()
+
+    response = client.get("/posts/1/comments", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 2
+    assert client.get("/posts/1/comments", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_comments_batch(monkeypatch):
+    async def fake_check(comment_content=None, **kwargs):
+        return None if comment_content == "No Answer" else comment_content == "Bad Comment"
+
+    monkeypatch.setattr(comments, "get_data_from_gemini_async", fake_check)
+
+    statements = []
+
+    def count_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO \"Comment\""):
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_insert)
+    try:
+        response = client.post("/comments/batch", json={"items": [
+            {"post_id": 1, "comment_content": "Batch Comment 1"},
+            {"post_id": 999, "comment_content": "Batch Comment 2"},
+            {"post_id": 1, "comment_content": "Bad Comment"},
+            {"post_id": 1, "comment_content": "No Answer"},
+            {"post_id": 1, "comment_content": "Batch Comment 3"},
+        ]})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_insert)
+
     assert response.status_code == 200
-    assert len(response.json()) == 3
+    results = response.json()["items"]
+    assert [result["status_code"] for result in results] == [200, 404, 403, 500, 200]
+    assert results[0]["comment"]["comment_content"] == "Batch Comment 1"
+    assert results[4]["comment_id"] > results[0]["comment_id"]
+    assert len(statements) == 1
+
+    db = TestingSessionLocal()
+    assert Comment.get_comment_by_id(db, results[2]["comment_id"]).comment_blocked is True
+    db.close()
+
+
+def test_comments_batch_too_large():
+    response = client.post("/comments/batch", json={"items": [{"post_id": 1, "comment_content": "Comment"}] * 101})
+    assert response.status_code == 422
@@ -0,0 +1,57 @@
+from swetter.database.counters_db import reconcile_counters
+from swetter.models import Post, Comment, CommentReply
+from tests.conftest import client, TestingSessionLocal
+
+
+def get_comment_count(post_id):
+    db = TestingSessionLocal()
+    try:
+        return Post.get_post_by_id(db, post_id).comment_count
+    finally:
+        db.close()
+
+
+def test_comment_count():
+    db = TestingSessionLocal()
+    post = Post.create_post(db, 1, "Counted Post", "Content", post_auto_answer=False, post_blocked=False)
+    post_id = post.post_id
+
+    visible = Comment.create_comment(db, post_id=post_id, user_id=1, comment_content="Visible")
+    Comment.create_comment(db, post_id=post_id, user_id=1, comment_content="Pending", comment_pending=True)
+    assert get_comment_count(post_id) == 1
+
+    visible.update(db, comment_blocked=True)
+    assert get_comment_count(post_id) == 0
+
+    visible.update(db, comment_blocked=False)
+    visible.delete(db)
+    assert get_comment_count(post_id) == 0
+
+    Comment.create_comments(db, [{"post_id": post_id, "user_id": 1, "comment_content": f"Comment {i}",
+                                  "comment_blocked": i == 0, "comment_blocked_at": None, "comment_pending": False}
+                                 for i in range(3)])
+    assert get_comment_count(post_id) == 2
+    db.close()
+
+
+def test_reply_count_in_comment_page():
+    assert client.get("/posts/1/comments").json()["items"][0]["reply_count"] == 0
+
+    CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content="Reply")
+    reply = CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content="Reply")
+    # the page is cached, deleting through the API invalidates it
+    response = client.delete(f"/reply/{reply.reply_id}")
+    assert response.status_code == 200
+
+    assert client.get("/posts/1/comments").json()["items"][0]["reply_count"] == 1
+
+
+def test_reconcile_counters():
+    # the fixture comment was inserted without the models, so the post does not count it yet
+    assert get_comment_count(1) == 0
+
+    assert reconcile_counters(TestingSessionLocal) == {"comment_count": 1, "reply_count": 0}
+    assert get_comment_count(1) == 1
+    assert client.get("/post/1").json()["comment_count"] == 1
+
+    assert reconcile_counters(TestingSessionLocal) == {"comment_count": 0, "reply_count": 0}
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+from swetter.database.export_db import export_rows
+from swetter.models import Post
+from swetter.utils import deps
+from tests.conftest import client, TestingSessionLocal
+
+
+def test_export_requires_admin():
+    response = client.get("/export/posts")
+    assert response.status_code == 403
+
+
+def test_export_posts_ndjson(monkeypatch):
+    monkeypatch.setattr(deps, "ADMIN_USERNAMES", {"testuser"})
+    db = TestingSessionLocal()
+    Post.create_post(db, user_id=1, post_title="Blocked Post", post_content="Blocked Content",
+                     post_auto_answer=False, post_blocked=True)
+    db.close()
+
+    response = client.get("/export/posts")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["post_title"] for row in rows] == ["Test Post", "Blocked Post"]
+
+    response = client.get("/export/posts", params={"blocked": True})
+    assert [json.loads(line)["post_title"] for line in response.text.splitlines()] == ["Blocked Post"]
+
+
+def test_export_comments_csv(monkeypatch):
+    monkeypatch.setattr(deps, "ADMIN_USERNAMES", {"testuser"})
+
+    response = client.get("/export/comments", params={"format": "csv", "created_from": "2000-01-01T00:00:00"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1
+    assert rows[0]["comment_content"] == "Test Comment"
+
+    response = client.get("/export/comments", params={"format": "csv", "created_to": "2000-01-01T00:00:00"})
+    assert len(list(csv.DictReader(io.StringIO(response.text)))) == 0
+
+
+def test_export_unknown_entity(monkeypatch):
+    monkeypatch.setattr(deps, "ADMIN_USERNAMES", {"testuser"})
+
+    assert client.get("/export/users").status_code == 404
+    assert client.get("/export/posts", params={"format": "xml"}).status_code == 400
+
+
+def test_export_rows_streams_in_batches():
+    db = TestingSessionLocal()
+    for i in range(5):
+        Post.create_post(db, user_id=1, post_title=f"Post {i}", post_content="Content", post_auto_answer=False)
+    db.close()
+
+    chunks = list(export_rows("posts", batch_size=2, session_factory=TestingSessionLocal))
+
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 2]
@@ -0,0 +1,246 @@
+import asyncio
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from swetter.models import Post, Comment, CommentReply, Job
+from swetter.routes import posts, comments
+from swetter.utils import gemini
+from swetter.utils.jobs import JobWorkerPool
+from tests.conftest import client, TestingSessionLocal, TestingAsyncSessionLocal
+from tests.test_gemini import FakeModel
+
+
+def run_jobs():
+    pool = JobWorkerPool(session_factory=TestingAsyncSessionLocal)
+
+    async def run_all():
+        while await pool.run_next():
+            pass
+
+    asyncio.run(run_all())
+
+
+def test_create_post_pending(monkeypatch):
+    monkeypatch.setattr(posts, "MODERATION_MODE", "pending")
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+
+    response = client.post("/post/", json={"post_title": "New Post", "post_content": "New Content", "post_auto_answer": False, "post_delay": None})
+    assert response.status_code == 202
+    post_id = response.json()["post_id"]
+
+    assert client.get(f"/post/{post_id}").status_code == 202
+    assert all(post["post_id"] != post_id for post in client.get("/posts/1").json()["items"])
+
+    run_jobs()
+
+    response = client.get(f"/post/{post_id}")
+    assert response.status_code == 200
+    assert response.json()["post_title"] == "New Post"
+
+
+def test_create_comment_pending_blocked(monkeypatch):
+    monkeypatch.setattr(comments, "MODERATION_MODE", "pending")
+    monkeypatch.setattr(gemini, "model", FakeModel(text="True"))
+
+    response = client.post("/comment/", json={"post_id": 1, "comment_content": "Bad Comment"})
+    assert response.status_code == 202
+    comment_id = response.json()["comment_id"]
+
+    assert client.put(f"/comment/{comment_id}", json={"comment_content": "Edited"}).status_code == 409
+
+    run_jobs()
+
+    db = TestingSessionLocal()
+    comment = Comment.get_comment_by_id(db, comment_id)
+    assert comment.comment_pending is False
+    assert comment.comment_blocked is True
+    assert db.query(Job).filter(Job.job_status == "done").count() == 1
+    db.close()
+
+
+def test_pending_comment_saved_with_its_job(monkeypatch):
+    monkeypatch.setattr(comments, "MODERATION_MODE", "pending")
+
+    def failing_enqueue(db, job_kind, job_entity_id, job_run_at=None, commit=True):
+        raise RuntimeError("Job table is locked")
+
+    monkeypatch.setattr(Job, "enqueue", failing_enqueue)
+
+    # the comment and its moderation job are one transaction: without the job the comment is not saved
+    with pytest.raises(RuntimeError):
+        client.post("/comment/", json={"post_id": 1, "comment_content": "Orphan Comment"})
+
+    db = TestingSessionLocal()
+    assert db.query(Comment).filter(Comment.comment_content == "Orphan Comment").count() == 0
+    db.close()
+
+
+def test_pending_job_retried_without_verdict(monkeypatch):
+    monkeypatch.setattr(posts, "MODERATION_MODE", "pending")
+    monkeypatch.setattr(gemini, "model", FakeModel(delay=1))
+    monkeypatch.setattr(gemini, "GEMINI_TIMEOUT", 0.05)
+
+    response = client.post("/post/", json={"post_title": "New Post", "post_content": "New Content", "post_auto_answer": False, "post_delay": None})
+    post_id = response.json()["post_id"]
+
+    asyncio.run(JobWorkerPool(session_factory=TestingAsyncSessionLocal).run_next())
+
+    db = TestingSessionLocal()
+    assert Post.get_post_by_id(db, post_id).post_pending is True
+    job = db.query(Job).one()
+    assert job.job_status == "queued"
+    assert job.job_attempts == 1
+    db.close()
+
+
+def test_auto_reply_job(monkeypatch):
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+    db = TestingSessionLocal()
+    Post.create_post(db, 1, "Auto Post", "Auto Content", post_auto_answer=True, post_delay=time(0, 0, 0),
+                     post_blocked=False)
+    db.close()
+
+    response = client.post("/comment/", json={"post_id": 2, "comment_content": "New Comment"})
+    assert response.status_code == 200
+    comment_id = response.json()["comment_id"]
+
+    monkeypatch.setattr(gemini, "model", FakeModel(text="Thank you!"))
+    run_jobs()
+
+    db = TestingSessionLocal()
+    replies, _ = CommentReply.get_comment_replies(db, comment_id)
+    assert [reply.reply_content for reply in replies] == ["Thank you!"]
+    assert replies[0].user_id == 1
+    db.close()
+
+
+def test_auto_reply_job_not_repeated(monkeypatch):
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+    db = TestingSessionLocal()
+    Post.create_post(db, 1, "Auto Post", "Auto Content", post_auto_answer=True, post_delay=time(0, 0, 0),
+                     post_blocked=False)
+    db.close()
+
+    comment_id = client.post("/comment/", json={"post_id": 2, "comment_content": "New Comment"}).json()["comment_id"]
+
+    def dying_finish(job, db):
+        raise RuntimeError("Worker died")
+
+    # the worker dies after the reply was saved: the job is done with it and does not reply again
+    monkeypatch.setattr(gemini, "model", FakeModel(text="Thank you!"))
+    monkeypatch.setattr(Job, "finish", dying_finish)
+    with pytest.raises(RuntimeError):
+        run_jobs()
+    monkeypatch.undo()
+
+    db = TestingSessionLocal()
+    db.query(Job).update({Job.job_locked_until: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+
+    run_jobs()
+
+    db = TestingSessionLocal()
+    replies, _ = CommentReply.get_comment_replies(db, comment_id)
+    assert [reply.reply_content for reply in replies] == ["Thank you!"]
+    assert Job.queue_stats(db)["done"] == 1
+    db.close()
+
+
+def test_moderation_and_auto_reply_one_transaction(monkeypatch):
+    monkeypatch.setattr(comments, "MODERATION_MODE", "pending")
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+    db = TestingSessionLocal()
+    Post.create_post(db, 1, "Auto Post", "Auto Content", post_auto_answer=True, post_delay=time(0, 0, 0),
+                     post_blocked=False)
+    db.close()
+
+    comment_id = client.post("/comment/", json={"post_id": 2, "comment_content": "New Comment"}).json()["comment_id"]
+
+    def failing_enqueue(db, job_kind, job_entity_id, job_run_at=None, commit=True):
+        raise RuntimeError("Job table is locked")
+
+    # the auto-reply can not be queued: the approval is rolled back too and the retry still sees the comment pending
+    with monkeypatch.context() as patched:
+        patched.setattr(Job, "enqueue", failing_enqueue)
+        run_jobs()
+
+    db = TestingSessionLocal()
+    assert Comment.get_comment_by_id(db, comment_id).comment_pending is True
+    db.query(Job).update({Job.job_run_at: datetime.utcnow()})
+    db.commit()
+    db.close()
+
+    run_jobs()
+
+    db = TestingSessionLocal()
+    assert Comment.get_comment_by_id(db, comment_id).comment_pending is False
+    assert db.query(Job).filter(Job.job_kind == "auto_reply", Job.job_entity_id == comment_id).count() == 1
+    db.close()
+
+
+def test_prune_done_jobs():
+    pool = JobWorkerPool(session_factory=TestingAsyncSessionLocal, done_retention=3600, prune_interval=300)
+    db = TestingSessionLocal()
+    Job.enqueue_many(db, [("unknown", 1, datetime.utcnow() - timedelta(hours=2)),
+                          ("unknown", 2, datetime.utcnow() - timedelta(hours=2)), ("unknown", 3, None)])
+    jobs = db.query(Job).order_by(Job.job_id).all()
+    jobs[0].job_status = "dead"
+    jobs[1].job_status = jobs[2].job_status = "done"
+    db.commit()
+    db.close()
+
+    # only the done job older than the retention is deleted, and only once per prune interval
+    assert asyncio.run(pool.prune_done()) == 1
+    assert asyncio.run(pool.prune_done()) is None
+
+    db = TestingSessionLocal()
+    assert [(job.job_entity_id, job.job_status) for job in db.query(Job).order_by(Job.job_id)] == \
+        [(1, "dead"), (3, "done")]
+    db.close()
+
+
+def test_job_backoff_and_dead_letter():
+    pool = JobWorkerPool(session_factory=TestingAsyncSessionLocal, max_attempts=2, backoff_base=60)
+    db = TestingSessionLocal()
+    Job.enqueue(db, "unknown", 1)
+    db.close()
+
+    asyncio.run(pool.run_next())
+
+    db = TestingSessionLocal()
+    job = db.query(Job).one()
+    assert job.job_status == "queued"
+    assert (job.job_run_at - job.job_created_at).total_seconds() >= 59
+    job.job_run_at = job.job_created_at
+    db.commit()
+    db.close()
+
+    asyncio.run(pool.run_next())
+
+    stats = asyncio.run(pool.stats())
+    assert stats["dead"] == 1
+    assert stats["queued"] == 0
+    assert stats["lag"] == 0.0
+
+
+def test_comments_batch_pending(monkeypatch):
+    monkeypatch.setattr(comments, "MODERATION_MODE", "pending")
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+
+    response = client.post("/comments/batch", json={"items": [
+        {"post_id": 1, "comment_content": "Pending Comment 1"},
+        {"post_id": 1, "comment_content": "Pending Comment 2"},
+    ]})
+    results = response.json()["items"]
+    assert [result["status_code"] for result in results] == [202, 202]
+
+    db = TestingSessionLocal()
+    assert Job.queue_stats(db)["queued"] == 2
+    db.close()
+
+    run_jobs()
+
+    for result in results:
+        assert client.get(f"/comment/{result['comment_id']}").status_code == 200
@@ -0,0 +1,65 @@
+import os
+import time
+
+from swetter.utils.lexicon import Lexicon, LexiconFilter
+
+
+def test_lexicon_finds_terms():
+    lexicon = Lexicon(blocked=["he", "she", "hers"], whole_word=["his"])
+
+    assert sorted(lexicon.find_blocked("USHERS")) == ["he", "hers", "she"]
+    assert lexicon.find_blocked("this is his") == ["his"]
+    assert lexicon.find_blocked("nothing here") == ["he"]
+    assert lexicon.find_blocked("clean text") == []
+
+
+def test_lexicon_allow_rules():
+    lexicon = Lexicon(blocked=["cunt"], allowed=["scunthorpe"])
+
+    assert lexicon.find_blocked("Welcome to Scunthorpe") == []
+    assert lexicon.find_blocked("cunt") == ["cunt"]
+
+
+def test_lexicon_filter(tmp_path):
+    path = tmp_path / "lexicon.txt"
+    path.write_text("# comment\nbadword\n=bad\n!notbadword\n", encoding="utf-8")
+    lexicon_filter = LexiconFilter(str(path), reload_interval=0, trivial_max_length=10)
+
+    assert lexicon_filter.check("This is a BADWORD") is True
+    assert lexicon_filter.check("This is bad.") is True
+    assert lexicon_filter.check("It is notbadword and badminton") is None
+    assert lexicon_filter.check("👍🔥!!") is False
+    assert lexicon_filter.check("Nice post") is None
+
+
+def test_lexicon_filter_reload(tmp_path):
+    path = tmp_path / "lexicon.txt"
+    path.write_text("badword\n", encoding="utf-8")
+    lexicon_filter = LexiconFilter(str(path), reload_interval=0)
+
+    assert lexicon_filter.check("some newword here") is None
+
+    path.write_text("badword\nnewword\n", encoding="utf-8")
+    mtime = time.time() + 10
+    os.utime(path, (mtime, mtime))
+
+    assert lexicon_filter.check("some newword here") is True
+
+
+def test_lexicon_filter_keeps_lexicon_on_bad_file(tmp_path, capsys):
+    path = tmp_path / "lexicon.txt"
+    path.write_text("badword\n", encoding="utf-8")
+    lexicon_filter = LexiconFilter(str(path), reload_interval=0)
+
+    # e.g. a file saved in another encoding or cut in the middle of a character
+    path.write_bytes("badword\nnewword\n".encode("utf-8") + b"\xd0")
+    mtime = time.time() + 10
+    os.utime(path, (mtime, mtime))
+
+    assert lexicon_filter.check("some badword here") is True
+    assert "was not loaded, the previous one is kept" in capsys.readouterr().out
+
+    path.write_text("badword\nnewword\n", encoding="utf-8")
+    os.utime(path, (mtime + 10, mtime + 10))
+
+    assert lexicon_filter.check("some newword here") is True
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from swetter.utils import deps, gemini
+from swetter.utils.metrics import Histogram, registry, instrument_engine
+from tests.conftest import client, engine, async_engine
+from tests.test_gemini import FakeModel
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+HEADERS = {"Authorization": "Bearer metrics-token"}
+
+
+@pytest.fixture(autouse=True)
+def metrics_token(monkeypatch):
+    monkeypatch.setattr(deps, "METRICS_TOKEN", "metrics-token")
+
+
+def sample(text, line_start):
+    return [line for line in text.splitlines() if line.startswith(line_start)]
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, ("/a",))
+    histogram.observe(0.5, ("/a",))
+    histogram.observe(5, ("/a",))
+    histogram.observe(0.1, ('say "hi"',))
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP latency_seconds Latency.", "# TYPE latency_seconds histogram"]
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{route="/a"} 5.55' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+    assert 'latency_seconds_bucket{route="say \\"hi\\"",le="0.1"} 1' in lines
+
+
+def test_metrics():
+    registry.clear()
+
+    assert client.get("/post/1").status_code == 200
+    assert client.get("/post/1000").status_code == 404
+    client.get("/no-such-route")
+
+    response = client.get("/metrics", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    assert 'http_requests_total{method="GET",route="/post/{post_id}",status="200"} 1' in text
+    assert 'http_requests_total{method="GET",route="/post/{post_id}",status="404"} 1' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/post/{post_id}"} 2' in text
+
+    # both reads went to the database, the 404 is not cached
+    queries = sample(text, 'db_queries_per_request_sum{method="GET",route="/post/{post_id}"}')
+    assert float(queries[0].split()[-1]) >= 2
+    assert float(sample(text, "db_query_duration_seconds_count")[0].split()[-1]) >= 2
+
+    assert 'job_queue_jobs{status="queued"} 0' in text
+    assert "job_queue_lag_seconds 0.0" in text
+
+
+def test_gemini_metrics(monkeypatch):
+    registry.clear()
+
+    class FailingModel(FakeModel):
+        async def generate_content_async(self, prompt):
+            raise RuntimeError("Gemini is down")
+
+    monkeypatch.setattr(gemini, "model", FakeModel(text="True"))
+    assert asyncio.run(gemini.get_data_from_gemini_async(comment_content="Gemini comment")) is True
+    assert asyncio.run(gemini.get_data_from_gemini_async(comment_content="Gemini comment")) is True
+
+    monkeypatch.setattr(gemini, "model", FailingModel())
+    assert asyncio.run(gemini.get_data_from_gemini_async(comment_content="Another comment")) is None
+
+    text = client.get("/metrics", headers=HEADERS).text
+
+    assert 'gemini_call_duration_seconds_count{outcome="ok"} 1' in text
+    assert 'gemini_call_duration_seconds_count{outcome="error"} 1' in text
+    assert 'moderation_verdicts_total{source="gemini",verdict="blocked"} 1' in text
+    assert 'moderation_verdicts_total{source="cache",verdict="blocked"} 1' in text
+    assert 'moderation_verdicts_total{source="gemini",verdict="unknown"} 1' in text
+
+
+def test_metrics_token(monkeypatch):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    # closed while no token is configured
+    monkeypatch.setattr(deps, "METRICS_TOKEN", "")
+    assert client.get("/metrics", headers=HEADERS).status_code == 404
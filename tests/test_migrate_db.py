@@ -0,0 +1,64 @@
+from datetime import date
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from swetter.database.db import create_db_engine
+from swetter.database.migrate_db import upgrade_schema
+from swetter.models import Post, Comment, CommentReply, CommentDaily
+
+# tables as created by the first version, before pending moderation, counters and the listing indexes
+OLD_SCHEMA = [
+    'CREATE TABLE "User" (user_id INTEGER PRIMARY KEY, user_name VARCHAR NOT NULL UNIQUE, '
+    'user_password_hash VARCHAR NOT NULL, user_created_at DATETIME)',
+    'CREATE TABLE "Post" (post_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES "User" (user_id), '
+    'post_title VARCHAR NOT NULL, post_content VARCHAR NOT NULL, post_auto_answer BOOLEAN NOT NULL, post_delay TIME, '
+    'post_created_at DATETIME, post_blocked BOOLEAN, post_blocked_at DATETIME)',
+    'CREATE TABLE "Comment" (comment_id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL REFERENCES "Post" (post_id), '
+    'user_id INTEGER NOT NULL REFERENCES "User" (user_id), comment_content VARCHAR NOT NULL, '
+    'comment_created_at DATETIME, comment_blocked BOOLEAN, comment_blocked_at DATETIME)',
+    'CREATE TABLE "Reply_Comment" (reply_id INTEGER PRIMARY KEY, '
+    'comment_id INTEGER NOT NULL REFERENCES "Comment" (comment_id), user_id INTEGER NOT NULL REFERENCES "User" (user_id), '
+    'reply_content VARCHAR NOT NULL, reply_created_at DATETIME, reply_blocked BOOLEAN, reply_blocked_at DATETIME)',
+    "INSERT INTO \"User\" VALUES (1, 'old_user', 'hash', '2024-05-01 10:00:00')",
+    "INSERT INTO \"Post\" VALUES (1, 1, 'Old Post', 'Old Content', 0, '00:01:00', '2024-05-01 10:00:00', 0, NULL)",
+    "INSERT INTO \"Comment\" VALUES (1, 1, 1, 'Old Comment', '2024-05-02 10:00:00', 0, NULL)",
+    "INSERT INTO \"Comment\" VALUES (2, 1, 1, 'Blocked Comment', '2024-05-02 11:00:00', 1, '2024-05-02 11:00:00')",
+    "INSERT INTO \"Reply_Comment\" VALUES (1, 1, 1, 'Old Reply', '2024-05-03 10:00:00', 0, NULL)",
+]
+
+
+def test_upgrade_old_database(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'old.db'}")
+
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA:
+            connection.execute(text(statement))
+
+    added = upgrade_schema(engine)
+
+    assert added["Post"] == ["post_updated_at", "post_pending", "comment_count"]
+    assert added["Comment"] == ["comment_updated_at", "comment_pending", "reply_count"]
+    assert added["Reply_Comment"] == ["reply_updated_at", "reply_pending"]
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("Comment")}
+    assert {"ix_comment_post_visible_created", "ix_comment_user_visible_created"} <= indexes
+
+    with Session(engine) as db:
+        post = Post.get_post_by_id(db, 1)
+        assert post.post_pending is False
+        assert post.comment_count == 1
+        assert Comment.get_comment_by_id(db, 1).reply_count == 1
+        reply = db.get(CommentReply, 1)
+        assert reply.reply_pending is False
+        assert reply.reply_updated_at == reply.reply_created_at
+        daily = db.get(CommentDaily, ("all", 0, date(2024, 5, 2)))
+        assert (daily.daily_created, daily.daily_blocked) == (2, 1)
+
+    # the new columns are usable, e.g. by the search index created for the old rows
+    with engine.connect() as connection:
+        matches = connection.execute(text("SELECT rowid FROM Post_Search WHERE Post_Search MATCH 'old'"))
+        assert matches.scalars().all() == [1]
+
+    assert upgrade_schema(engine) == {}
+    engine.dispose()
@@ -1,4 +1,10 @@
+from datetime import time
+
 from swetter.models import Post
+from swetter.schem import PostResponse
+from swetter.utils import gemini
+from swetter.utils.read_cache import read_cache
+from tests.test_gemini import FakeModel
 from tests.conftest import client, TestingSessionLocal
 
 
@@ -66,7 +72,7 @@ def test_get_user_posts():
                      post_auto_answer=False, post_delay=None, post_blocked=False)
     response = client.get("/posts/1")
     assert response.status_code == 200
-    assert len(response.json()) == 3
+    assert len(response.json()["items"]) == 3
 
 
 def test_get_all_posts():
@@ -77,4 +83,87 @@ def test_get_all_posts():
                      post_auto_answer=False, post_delay=None, post_blocked=False)
     response = client.get("/posts/")
     assert response.status_code == 200
-    assert len(response.json()) == 3
+    assert len(response.json()["items"]) == 3
+
+
+def test_get_all_posts_pagination():
+    for i in range(4):
+        Post.create_post(db=TestingSessionLocal(), user_id=1, post_title=f"Test Title {i}", post_content="Test Content",
+                         post_auto_answer=False, post_delay=None, post_blocked=False)
+
+    response = client.get("/posts/", params={"limit": 3})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["items"]) == 3
+    assert first_page["next_cursor"] is not None
+
+    response = client.get("/posts/", params={"limit": 3, "cursor": first_page["next_cursor"]})
+    assert response.status_code == 200
+    second_page = response.json()
+    assert len(second_page["items"]) == 2
+    assert second_page["next_cursor"] is None
+
+    post_ids = [post["post_id"] for post in first_page["items"] + second_page["items"]]
+    assert post_ids == sorted(post_ids, reverse=True)
+
+
+def test_get_all_posts_invalid_cursor():
+    response = client.get("/posts/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_post_serializer_matches_schema():
+    db = TestingSessionLocal()
+    post = Post.create_post(db, user_id=1, post_title="Test Title", post_content="Test Content",
+                            post_auto_answer=True, post_delay=time(0, 10, 30), post_blocked=False)
+    expected = PostResponse.model_validate(post).model_dump(mode="json")
+    db.close()
+
+    assert client.get(f"/post/{post.post_id}").json() == expected
+    assert client.get("/posts/").json()["items"][0] == expected
+
+
+def test_get_post_not_modified(monkeypatch):
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+    response = client.get("/post/1")
+    etag = response.headers["ETag"]
+
+    response = client.get("/post/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/post/1", headers={"If-Modified-Since": response.headers["Last-Modified"]})
+    assert response.status_code == 304
+
+    client.put("/post/1", json={"post_title": "Updated Title", "post_content": "Updated Content"})
+    response = client.get("/post/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["post_title"] == "Updated Title"
+
+
+def test_get_all_posts_not_modified():
+    etag = client.get("/posts/").headers["ETag"]
+
+    assert client.get("/posts/", headers={"If-None-Match": etag}).status_code == 304
+
+    db = TestingSessionLocal()
+    Post.get_post_by_id(db, 1).update(db, post_blocked=True)
+    db.close()
+
+    response = client.get("/posts/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+
+def test_get_post_read_cache(monkeypatch):
+    monkeypatch.setattr(gemini, "model", FakeModel(text="False"))
+
+    client.get("/post/1")
+    assert client.get("/post/1").json()["post_title"] == "Test Post"
+    assert read_cache.stats()["post"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+    client.put("/post/1", json={"post_title": "Updated Title", "post_content": "Updated Content"})
+    assert client.get("/post/1").json()["post_title"] == "Updated Title"
+
+    client.delete("/post/1")
+    assert client.get("/post/1").status_code == 404
@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import OperationalError
+
+from swetter.models import Post, CommentReply
+from swetter.utils.metrics import instrument_engine
+from swetter.utils.query_diagnostics import QueryDiagnostics, NPlusOneError, query_diagnostics, statement_shape
+from swetter.utils.query_events import RequestQueries, current_queries
+from tests.conftest import client, engine, TestingSessionLocal
+
+
+def test_statement_shape():
+    assert statement_shape('SELECT * FROM "Post" WHERE post_id IN (?, ?, ?)') == \
+        statement_shape('SELECT * FROM "Post"\n WHERE post_id IN (?)') == 'SELECT * FROM "Post" WHERE post_id IN (?)'
+    assert statement_shape("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?)"
+
+
+def test_n_plus_one(capsys):
+    queries = RequestQueries("GET /comments")
+    token = current_queries.set(queries)
+    try:
+        with engine.connect() as connection:
+            for post_id in range(12):
+                connection.execute(select(Post).where(Post.post_id == post_id))
+            connection.execute(select(Post).where(Post.post_id.in_([1, 2])))
+            connection.execute(select(Post).where(Post.post_id.in_([1, 2, 3])))
+    finally:
+        current_queries.reset(token)
+
+    assert queries.count == 14
+
+    flagged = QueryDiagnostics(n_plus_one_threshold=10, strict=False).check_request(queries)
+    assert [count for _, count, _ in flagged] == [12]
+    assert "Possible N+1 in GET /comments: 12 executions" in capsys.readouterr().out
+
+    # the IN lists of different length are one shape
+    assert QueryDiagnostics(n_plus_one_threshold=1, strict=False).check_request(queries)[1][1] == 2
+
+    with pytest.raises(NPlusOneError):
+        QueryDiagnostics(n_plus_one_threshold=10, strict=True).check_request(queries)
+
+
+def test_no_n_plus_one_in_thread(monkeypatch):
+    db = TestingSessionLocal()
+    CommentReply.create_replies(db, [{"comment_id": 1, "user_id": 1, "reply_content": f"Reply {i}",
+                                      "reply_blocked": False, "reply_blocked_at": None, "reply_pending": False}
+                                     for i in range(15)])
+    db.close()
+
+    checked = []
+    check_request = query_diagnostics.check_request
+    monkeypatch.setattr(query_diagnostics, "check_request", lambda queries: checked.append(queries) or
+                        check_request(queries))
+    monkeypatch.setattr(query_diagnostics, "n_plus_one_threshold", 3)
+    monkeypatch.setattr(query_diagnostics, "strict", True)
+
+    # comments and their replies are loaded with a few queries, not one per comment
+    assert client.get("/thread/1").status_code == 200
+    assert checked[0].label == "GET /thread/1"
+    assert checked[0].statements
+
+
+def test_slow_query_log(capsys):
+    slow_engine = create_engine("sqlite:///./test.db")
+    diagnostics = QueryDiagnostics(slow_query_ms=1e-6, explain=True)
+    diagnostics.attach(slow_engine)
+
+    with slow_engine.connect() as connection:
+        connection.execute(select(Post).where(Post.post_id == 1))
+        connection.execute(select(Post).where(Post.post_id == 2))
+    diagnostics.close()
+    slow_engine.dispose()
+
+    output = capsys.readouterr().out
+    assert output.count("Slow query") == 2
+    # the plan of a shape is read once, and the EXPLAIN itself is not reported as a slow query
+    assert output.count("Query plan of") == 1
+    assert "SEARCH Post USING INTEGER PRIMARY KEY" in output
+    assert "EXPLAIN" not in output
+
+
+def test_one_hook_per_engine():
+    shared_engine = create_engine("sqlite:///./test.db")
+    diagnostics = QueryDiagnostics(slow_query_ms=0)
+    instrument_engine(shared_engine)
+    diagnostics.attach(shared_engine)
+
+    with shared_engine.connect() as connection:
+        connection.info["query_started"] = []
+        connection.execute(text("SELECT 1"))
+
+        # a failed statement does not leave its start time behind
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        assert connection.info["query_started"] == []
+
+        queries = RequestQueries("test")
+        token = current_queries.set(queries)
+        try:
+            connection.execute(text("SELECT 1"))
+        finally:
+            current_queries.reset(token)
+    shared_engine.dispose()
+
+    # timed once for metrics and diagnostics
+    assert queries.count == 1
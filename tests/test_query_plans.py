@@ -0,0 +1,71 @@
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from swetter.models import User, Post, Comment, CommentReply, Job
+from swetter.routes.posts import post_serializer
+from swetter.utils.pagination import encode_cursor
+from tests.conftest import engine, TestingSessionLocal
+
+CURSOR = encode_cursor(datetime(2030, 1, 1), 10)
+
+QUERY_METHODS = [
+    ("User.get_user_by_username", lambda db: User.get_user_by_username(db, "testuser")),
+    ("Post.get_post_by_id", lambda db: Post.get_post_by_id(db, 1)),
+    ("Post.get_user_posts", lambda db: Post.get_user_posts(db, 1)),
+    ("Post.get_user_posts(cursor)", lambda db: Post.get_user_posts(db, 1, cursor=CURSOR)),
+    ("Post.get_all_posts", lambda db: Post.get_all_posts(db)),
+    ("Post.get_all_posts(cursor)", lambda db: Post.get_all_posts(db, cursor=CURSOR)),
+    ("Post.get_all_posts(columns)", lambda db: Post.get_all_posts(db, columns=post_serializer.columns)),
+    ("Comment.get_comment_by_id", lambda db: Comment.get_comment_by_id(db, 1)),
+    ("Comment.get_post_comments", lambda db: Comment.get_post_comments(db, 1)),
+    ("Comment.get_post_comments(cursor)", lambda db: Comment.get_post_comments(db, 1, cursor=CURSOR)),
+    ("Comment.get_post_comments_with_replies", lambda db: Comment.get_post_comments_with_replies(db, 1)),
+    ("Comment.get_user_comments", lambda db: Comment.get_user_comments(db, 1)),
+    ("Comment.get_user_comments(cursor)", lambda db: Comment.get_user_comments(db, 1, cursor=CURSOR)),
+    ("CommentReply.get_reply_by_id", lambda db: CommentReply.get_reply_by_id(db, 1)),
+    ("CommentReply.get_comment_replies", lambda db: CommentReply.get_comment_replies(db, 1)),
+    ("CommentReply.get_comment_replies(cursor)", lambda db: CommentReply.get_comment_replies(db, 1, cursor=CURSOR)),
+    ("Job.next_due", lambda db: Job.next_due(db, datetime.utcnow())),
+]
+
+# "SCAN <table>" without an index is a full table scan,
+# a temp b-tree means the index does not deliver the requested order
+BAD_PLAN = re.compile(r"^SCAN \w+$|USE TEMP B-TREE")
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.parametrize("name, method", QUERY_METHODS, ids=[name for name, _ in QUERY_METHODS])
+def test_query_does_not_scan(name, method):
+    db = TestingSessionLocal()
+    try:
+        with captured_selects() as statements:
+            method(db)
+    finally:
+        db.close()
+
+    assert statements, f"{name} did not run any query"
+
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            details = [row[-1] for row in plan]
+            bad = [detail for detail in details if BAD_PLAN.search(detail)]
+            assert not bad, f"{name} falls back to {bad}: {statement}"
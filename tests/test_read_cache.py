@@ -0,0 +1,95 @@
+import asyncio
+
+from swetter.models import Comment
+from swetter.routes import comments
+from swetter.utils.read_cache import ReadCache, CacheBackend, read_cache
+from tests.conftest import client, TestingSessionLocal
+
+
+class DictBackend(CacheBackend):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+def test_read_cache_invalidates_all_variants():
+    cache = ReadCache(backend=DictBackend(), enabled=True)
+    loads = []
+
+    async def read(post_id, page):
+        async def loader():
+            loads.append((post_id, page))
+            return [f"{post_id}:{page}:{len(loads)}"]
+
+        return await cache.get_or_load("post_comments", post_id, loader, variant=page)
+
+    async def scenario():
+        first = [await read(1, page) for page in (1, 2)]
+        assert [await read(1, page) for page in (1, 2)] == first
+        await read(2, 1)
+
+        cache.invalidate("post_comments", 1)
+
+        assert [await read(1, page) for page in (1, 2)] != first
+        await read(2, 1)
+
+    asyncio.run(scenario())
+
+    assert loads == [(1, 1), (1, 2), (2, 1), (1, 1), (1, 2)]
+    assert cache.stats()["post_comments"] == {"hits": 3, "misses": 5, "hit_ratio": 3 / 8}
+
+
+def test_read_cache_does_not_cache_missing_rows():
+    cache = ReadCache(backend=DictBackend(), enabled=True)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return None
+
+    asyncio.run(cache.get_or_load("post", 1, loader))
+    asyncio.run(cache.get_or_load("post", 1, loader))
+
+    assert len(loads) == 2
+
+
+def test_post_comments_route_cache(monkeypatch):
+    async def fake_check(comment_content=None, **kwargs):
+        return False
+
+    monkeypatch.setattr(comments, "get_data_from_gemini_async", fake_check)
+
+    def page_contents():
+        return [item["comment_content"] for item in client.get("/posts/1/comments").json()["items"]]
+
+    assert page_contents() == ["Test Comment"]
+    assert read_cache.stats()["post_comments"]["misses"] == 1
+
+    # written without the API, so the cached page is served
+    db = TestingSessionLocal()
+    Comment.create_comment(db, post_id=1, user_id=1, comment_content="Direct Comment", comment_blocked=False)
+    db.close()
+    assert page_contents() == ["Test Comment"]
+    assert read_cache.stats()["post_comments"]["hits"] == 1
+
+    # writes through the API drop the cached pages of the post
+    response = client.post("/comment/", json={"post_id": 1, "comment_content": "Api Comment"})
+    assert response.status_code == 200
+    assert page_contents() == ["Api Comment", "Direct Comment", "Test Comment"]
+
+    assert client.put("/comment/1", json={"comment_content": "Updated Comment"}).status_code == 200
+    assert "Updated Comment" in page_contents()
+
+    assert client.delete(f"/comment/{response.json()['comment_id']}").status_code == 200
+    assert page_contents() == ["Direct Comment", "Updated Comment"]
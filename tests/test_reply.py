@@ -1,4 +1,5 @@
-from swetter.models import CommentReply
+from swetter.models import Comment, CommentReply
+from swetter.routes import reply_comment
 from tests.conftest import client, TestingSessionLocal
 
 
@@ -62,4 +63,38 @@ def test_get_comment_replies():
 
     response = client.get("/replies/1")
     assert response.status_code == 200
-    assert len(response.json()) == 2
+    assert len(response.json()["items"]) == 2
+
+
+def test_get_comment_replies_pagination():
+    for i in range(3):
+        CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content=f"Test Reply {i}",
+                                  reply_blocked=False)
+
+    response = client.get("/replies/1", params={"limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 2
+
+    response = client.get("/replies/1", params={"limit": 2, "cursor": response.json()["next_cursor"]})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 1
+    assert response.json()["next_cursor"] is None
+
+
+def test_replies_batch(monkeypatch):
+    async def fake_check(reply_content=None, **kwargs):
+        return reply_content == "Bad Reply"
+
+    monkeypatch.setattr(reply_comment, "get_data_from_gemini_async", fake_check)
+    Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content="Blocked Comment", comment_blocked=True)
+
+    response = client.post("/replies/batch", json={"items": [
+        {"comment_id": 1, "reply_content": "Batch Reply"},
+        {"comment_id": 2, "reply_content": "Batch Reply"},
+        {"comment_id": 1, "reply_content": "Bad Reply"},
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["items"]
+    assert [result["status_code"] for result in results] == [200, 406, 403]
+    assert results[0]["reply"]["reply_content"] == "Batch Reply"
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from swetter.database.counters_db import backfill_rollup
+from swetter.models import Comment, CommentDaily
+from tests.conftest import client, TestingSessionLocal
+
+
+def get_breakdown(**params):
+    today = datetime.utcnow().date()
+    params = {"date_from": str(today - timedelta(days=1)), "date_to": str(today), **params}
+    response = client.get("/comments-daily-breakdown", params=params)
+    assert response.status_code == 200
+    return [(item["created"], item["blocked"]) for item in response.json()["items"]]
+
+
+def test_comments_daily_breakdown():
+    db = TestingSessionLocal()
+    comment = Comment.create_comment(db, post_id=1, user_id=2, comment_content="Comment 1")
+    Comment.create_comment(db, post_id=1, user_id=1, comment_content="Comment 2", comment_blocked=True,
+                           comment_blocked_at=datetime.utcnow())
+
+    # the fixture comment was inserted without the models, so it is not in the rollup
+    assert get_breakdown() == [(0, 0), (2, 1)]
+    assert get_breakdown(user_id=2) == [(0, 0), (1, 0)]
+    assert get_breakdown(post_id=2) == [(0, 0), (0, 0)]
+
+    comment.update(db, comment_blocked=True, comment_blocked_at=datetime.utcnow())
+    assert get_breakdown(user_id=2) == [(0, 0), (1, 1)]
+
+    comment.update(db, comment_blocked=False)
+    assert get_breakdown(user_id=2) == [(0, 0), (1, 0)]
+    db.close()
+
+
+def test_rollup_backfill():
+    db = TestingSessionLocal()
+    Comment.create_comments(db, [{"post_id": 1, "user_id": 1, "comment_content": f"Comment {i}",
+                                  "comment_blocked": i == 0, "comment_blocked_at": datetime.utcnow() if i == 0 else None,
+                                  "comment_pending": False} for i in range(3)])
+    incremental = sorted((row.daily_scope, row.daily_scope_id, row.daily_day, row.daily_created, row.daily_blocked)
+                         for row in db.query(CommentDaily))
+    db.close()
+
+    assert get_breakdown() == [(0, 0), (3, 1)]
+
+    backfill_rollup(TestingSessionLocal)
+
+    assert get_breakdown() == [(0, 0), (4, 1)]
+
+    db = TestingSessionLocal()
+    Comment.get_comment_by_id(db, 1).delete(db)
+    assert sorted((row.daily_scope, row.daily_scope_id, row.daily_day, row.daily_created, row.daily_blocked)
+                  for row in db.query(CommentDaily)) == incremental
+    db.close()
+
+
+def test_comments_daily_breakdown_invalid():
+    response = client.get("/comments-daily-breakdown", params={"date_from": "2024-02-01", "date_to": "2024-01-01"})
+    assert response.status_code == 400
+    response = client.get("/comments-daily-breakdown", params={"date_from": "2023-01-01", "date_to": "2024-12-31"})
+    assert response.status_code == 400
+    response = client.get("/comments-daily-breakdown",
+                          params={"date_from": "2024-01-01", "date_to": "2024-01-31", "post_id": 1, "user_id": 1})
+    assert response.status_code == 400
@@ -0,0 +1,70 @@
+from swetter.models import Post, Comment, CommentReply
+from tests.conftest import client, TestingSessionLocal
+
+
+def test_search_posts():
+    db = TestingSessionLocal()
+    Post.create_post(db, 1, "Python tips", "Short content", post_auto_answer=False, post_blocked=False)
+    Post.create_post(db, 1, "Cooking", "Pasta with python sauce", post_auto_answer=False, post_blocked=False)
+    Post.create_post(db, 1, "Blocked python", "Blocked content", post_auto_answer=False, post_blocked=True)
+    db.close()
+
+    response = client.get("/search", params={"q": "python"})
+    assert response.status_code == 200
+
+    items = response.json()["items"]
+    # title matches weigh more than content matches
+    assert [item["title"] for item in items] == ["Python tips", "Cooking"]
+    assert items[1]["snippet"] == "Pasta with <b>python</b> sauce"
+
+
+def test_search_snippet_escaped():
+    db = TestingSessionLocal()
+    Comment.create_comment(db, post_id=1, user_id=1, comment_content="<script>alert(1)</script> & python </b>",
+                           comment_blocked=False)
+    db.close()
+
+    items = client.get("/search", params={"q": "python", "entity": "comments"}).json()["items"]
+    assert items[0]["snippet"] == "&lt;script&gt;alert(1)&lt;/script&gt; &amp; <b>python</b> &lt;/b&gt;"
+
+
+def test_search_pagination():
+    for i in range(5):
+        Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content=f"Searchable comment {i}",
+                               comment_blocked=False)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "search", "entity": "comments", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/search", params=params).json()
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+
+def test_search_follows_moderation():
+    db = TestingSessionLocal()
+    reply = CommentReply.create_reply(db, comment_id=1, user_id=1, reply_content="Hidden reply", reply_pending=True)
+
+    assert client.get("/search", params={"q": "hidden", "entity": "replies"}).json()["items"] == []
+
+    reply.update(db, reply_pending=False)
+    items = client.get("/search", params={"q": "hidden", "entity": "replies"}).json()["items"]
+    assert [(item["id"], item["parent_id"]) for item in items] == [(reply.reply_id, 1)]
+
+    reply.update(db, reply_blocked=True)
+    assert client.get("/search", params={"q": "hidden", "entity": "replies"}).json()["items"] == []
+    db.close()
+
+
+def test_search_invalid():
+    assert client.get("/search", params={"q": "test", "entity": "users"}).status_code == 404
+    assert client.get("/search", params={"q": "test", "cursor": "bad"}).status_code == 400
+    assert client.get("/search", params={"q": "\"test OR (*"}).status_code == 200
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import func, text
+
+from swetter.database.search_db import search
+from swetter.database import seed_db
+from swetter.database.seed_db import seed, WORDS
+from swetter.models import User, Post, Comment, CommentReply
+from swetter.utils.passwords import password_hasher
+from tests.conftest import engine, TestingSessionLocal
+
+
+def test_seed():
+    added = seed(engine, users=20, posts=50, comments=2000, replies=500, days=30, blocked_fraction=0.1,
+                 batch_size=300, seed=1, log=lambda message: None)
+    assert added == {"User": 20, "Post": 50, "Comment": 2000, "Reply_Comment": 500}
+
+    db = TestingSessionLocal()
+    try:
+        # ids continue after the rows of the fixture
+        assert db.query(func.min(Post.post_id)).filter(Post.post_title != "Test Post").scalar() == 2
+        assert db.query(Comment).count() == 2001
+
+        # skewed popularity: the hottest post has many times the comments of the median one
+        per_post = sorted(count for _, count in db.query(Comment.post_id, func.count())
+                          .filter(Comment.post_id != 1).group_by(Comment.post_id))
+        assert per_post[-1] > 10 * per_post[len(per_post) // 2]
+
+        assert 0 < db.query(Comment).filter(Comment.comment_blocked == True).count() < 400
+        assert db.query(Comment).join(Post).filter(Comment.comment_created_at < Post.post_created_at).count() == 0
+        assert db.query(CommentReply).join(Comment).filter(
+            CommentReply.reply_created_at < Comment.comment_created_at).count() == 0
+
+        user = db.query(User).filter(User.user_name != "testuser").first()
+        assert password_hasher.context.verify("password", user.user_password_hash)
+
+        # counters, search index and its triggers are rebuilt after the load
+        assert Post.reconcile_comment_counts(db) == 0
+        assert Comment.reconcile_reply_counts(db) == 0
+        hits, _ = search(db, "comments", WORDS[0], limit=5)
+        assert len(hits) == 5
+        assert db.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")).scalar() == 9
+    finally:
+        db.close()
+
+
+def test_seed_failure_restores_triggers(monkeypatch):
+    def interrupted_text(rng, words):
+        raise RuntimeError("Load interrupted")
+
+    monkeypatch.setattr(seed_db, "text_of", interrupted_text)
+
+    with pytest.raises(RuntimeError):
+        seed(engine, users=5, posts=10, comments=0, replies=0, log=lambda message: None)
+
+    db = TestingSessionLocal()
+    try:
+        assert db.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")).scalar() == 9
+
+        # rows written after the failed load are indexed again
+        Post.create_post(db, user_id=1, post_title="Interrupted seed", post_content="Still searchable",
+                         post_auto_answer=False, post_blocked=False)
+        hits, _ = search(db, "posts", "searchable", limit=5)
+        assert [hit["title"] for hit in hits] == ["Interrupted seed"]
+    finally:
+        db.close()
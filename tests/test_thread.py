@@ -0,0 +1,50 @@
+from sqlalchemy import event
+
+from swetter.models import Comment, CommentReply
+from tests.conftest import client, TestingSessionLocal, async_engine
+
+
+def test_get_thread():
+    CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content="Reply 1", reply_blocked=False)
+    CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content="Reply 2", reply_blocked=False)
+    CommentReply.create_reply(db=TestingSessionLocal(), comment_id=1, user_id=1, reply_content="Blocked Reply", reply_blocked=True)
+    Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content="Blocked Comment", comment_blocked=True)
+    Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content="Test Comment 2", comment_blocked=False)
+
+    response = client.get("/thread/1")
+    assert response.status_code == 200
+
+    thread = response.json()
+    assert thread["post"]["post_title"] == "Test Post"
+    assert [comment["comment_content"] for comment in thread["comments"]] == ["Test Comment 2", "Test Comment"]
+    assert thread["comments"][0]["replies"] == []
+    assert [reply["reply_content"] for reply in thread["comments"][1]["replies"]] == ["Reply 1", "Reply 2"]
+    assert thread["next_cursor"] is None
+
+
+def test_get_thread_query_count():
+    for i in range(5):
+        comment = Comment.create_comment(db=TestingSessionLocal(), post_id=1, user_id=1, comment_content=f"Comment {i}", comment_blocked=False)
+        CommentReply.create_reply(db=TestingSessionLocal(), comment_id=comment.comment_id, user_id=1, reply_content=f"Reply {i}", reply_blocked=False)
+
+    statements = []
+
+    def count_select(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_select)
+    try:
+        response = client.get("/thread/1", params={"limit": 3})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_select)
+
+    assert response.status_code == 200
+    assert len(response.json()["comments"]) == 3
+    assert response.json()["next_cursor"] is not None
+    assert len(statements) == 3
+
+
+def test_get_thread_not_found():
+    response = client.get("/thread/999")
+    assert response.status_code == 404